@@ -0,0 +1,558 @@
+#!/usr/bin/env python3
+"""
+Dense retrieval over FineWeb: batched embedding and FAISS IVF/HNSW indexes
+Grown from lesson_containers_slurm/llm_faiss_test.py (all-MiniLM-L6-v2, one sentence,
+IndexFlatL2) into three stages that run as separate SLURM steps:
+
+  embed   stream Parquet text, split documents into word-window passages, tokenize and
+          embed them on CPU in large padded batches (length-sorted to cut padding, mean
+          pooling over the attention mask, L2 normalized) and append the vectors to raw
+          float16/float32 shards that are read back with np.memmap. Resumable: finished
+          shards are listed in the directory manifest.
+  build   train and fill an inner-product index from one or more embedding directories,
+          streaming the shards: IVF (nlist), HNSW (M, efConstruction), exact flat, or
+          compressed scalar (int8) / product-quantized (PQ, OPQ, IVF-PQ) codes.
+          vector_benchmark.py compares their recall, speed and memory on a sample.
+  search  embed queries and search with nprobe / efSearch; hits carry the FineWeb id, so
+          they line up with the Elasticsearch _id of the lexical index.
+
+Encoders load their tokenizer and model through load_pretrained (once per process, from a
+local copy under --model-dir when given); with --cache-dir, texts embedded before by any run
+are read from an embedding_cache.EmbeddingCache instead.
+
+Embedding directory:
+  manifest.json          model, dim, dtype, passage settings, finished shards and row counts
+  emb_<n>.f16|.f32       rows x dim vectors, C order, no header
+  meta_<n>.arrow         per row: doc_id, url, char_start, char_end (Arrow IPC, memory-mapped)
+"""
+
+import argparse
+import bisect
+import functools
+import json
+import math
+import os
+import re
+import shutil
+import sys
+import time
+from typing import Any, Dict, Iterator, List, Tuple
+
+import numpy as np
+
+DEFAULT_MODEL = 'sentence-transformers/all-MiniLM-L6-v2'
+MANIFEST_FILE = 'manifest.json'
+DTYPES = {'float16': ('f16', np.float16), 'float32': ('f32', np.float32)}
+# Exact: flat. Graph: hnsw. Compressed codes: sq8 (int8 per dimension, 4x smaller), pq / opq
+# (pq_m codes of pq_bits per vector, OPQ rotates first), alone or behind an IVF coarse quantizer
+INDEX_TYPES = ('ivf', 'hnsw', 'flat', 'sq8', 'pq', 'opq', 'ivfsq8', 'ivfpq', 'opqivfpq')
+IVF_TYPES = ('ivf', 'ivfsq8', 'ivfpq', 'opqivfpq')
+WORD_SPAN = re.compile(r'\S+')
+
+
+def split_passages(text: str, passage_words: int) -> List[Tuple[int, int]]:
+    """(char_start, char_end) of consecutive passage_words-word windows; 0 keeps the whole text"""
+    if not text:
+        return []
+    if passage_words <= 0:
+        return [(0, len(text))]
+    spans = [m.span() for m in WORD_SPAN.finditer(text)]
+    return [(spans[i][0], spans[min(i + passage_words, len(spans)) - 1][1])
+            for i in range(0, len(spans), passage_words)]
+
+
+def iter_passages(input_path: str, text_column: str = 'text', passage_words: int = 200,
+                  file_range_start: int = None, file_range_end: int = None,
+                  max_docs: int = None) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """(passage text, metadata) in a deterministic order, so a resumed run can skip rows"""
+    import pyarrow.parquet as pq
+    from parquet_files import list_parquet_files
+
+    files = (list_parquet_files(input_path, file_range_start, file_range_end)
+             if os.path.isdir(input_path) else [input_path])
+    docs = 0
+    for file_path in files:
+        parquet_file = pq.ParquetFile(file_path)
+        columns = [c for c in (text_column, 'id', 'url') if c in parquet_file.schema_arrow.names]
+        for batch in parquet_file.iter_batches(batch_size=2000, columns=columns):
+            for row in batch.to_pylist():
+                if max_docs is not None and docs >= max_docs:
+                    return
+                docs += 1
+                text = row.get(text_column) or ''
+                doc_id = str(row.get('id') or f"{os.path.basename(file_path)}:{docs}")
+                for start, end in split_passages(text, passage_words):
+                    yield text[start:end], {'doc_id': doc_id, 'url': row.get('url') or '',
+                                            'char_start': start, 'char_end': end}
+
+
+@functools.lru_cache(maxsize=None)
+def load_pretrained(model_name: str, model_dir: str = None) -> tuple:
+    """
+    (tokenizer, model), loaded once per process. With model_dir the first job saves a copy
+    there, and later jobs load that copy with local_files_only: no hub requests, no retries
+    on compute nodes without internet access.
+    """
+    from transformers import AutoModel, AutoTokenizer
+
+    local_dir = os.path.join(model_dir, model_name.replace('/', '--')) if model_dir else None
+    cached = local_dir is not None and os.path.exists(os.path.join(local_dir, 'config.json'))
+    source, options = (local_dir, {'local_files_only': True}) if cached else (model_name, {})
+    tokenizer = AutoTokenizer.from_pretrained(source, **options)
+    model = AutoModel.from_pretrained(source, **options).eval()
+    if local_dir is not None and not cached:
+        staging = f"{local_dir}.tmp{os.getpid()}"
+        tokenizer.save_pretrained(staging)
+        model.save_pretrained(staging)
+        try:
+            os.rename(staging, local_dir)
+        except OSError:  # Another job saved it first
+            shutil.rmtree(staging, ignore_errors=True)
+    return tokenizer, model
+
+
+class Encoder:
+    """Sentence embeddings with a Hugging Face encoder on CPU"""
+
+    def __init__(self, model_name: str = DEFAULT_MODEL, max_length: int = 256, threads: int = None,
+                 normalize: bool = True, model_dir: str = None):
+        import torch
+
+        if threads:
+            torch.set_num_threads(threads)
+        self.torch = torch
+        self.model_name = model_name
+        self.max_length = max_length
+        self.normalize = normalize
+        self.tokenizer, self.model = load_pretrained(model_name, model_dir)
+        self.dim = self.model.config.hidden_size
+
+    def encode(self, texts: List[str], batch_size: int = 64) -> np.ndarray:
+        """float32 (len(texts), dim); batches are formed by length so padding stays small"""
+        torch = self.torch
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        vectors = np.empty((len(texts), self.dim), dtype=np.float32)
+        with torch.inference_mode():
+            for start in range(0, len(order), batch_size):
+                batch = order[start:start + batch_size]
+                inputs = self.tokenizer([texts[i] for i in batch], padding=True, truncation=True,
+                                        max_length=self.max_length, return_tensors='pt')
+                hidden = self.model(**inputs).last_hidden_state
+                # Mean over real tokens only: padding would pull short texts towards each other
+                mask = inputs['attention_mask'].unsqueeze(-1).to(hidden.dtype)
+                pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9)
+                if self.normalize:
+                    pooled = torch.nn.functional.normalize(pooled, p=2, dim=1)
+                vectors[batch] = pooled.numpy()
+        return vectors
+
+
+def make_encoder(model_name: str = DEFAULT_MODEL, max_length: int = 256, threads: int = None,
+                 normalize: bool = True, cache_dir: str = None, model_dir: str = None,
+                 cache_dtype: str = None):
+    """Encoder, or with cache_dir an embedding_cache.CachedEncoder (same interface)"""
+    if cache_dir:
+        from embedding_cache import CachedEncoder
+        return CachedEncoder(cache_dir, model_name, max_length, threads, normalize, model_dir, cache_dtype)
+    return Encoder(model_name, max_length, threads, normalize, model_dir)
+
+
+# Embedding shards
+def load_manifest(embedding_dir: str) -> Dict[str, Any]:
+    with open(os.path.join(embedding_dir, MANIFEST_FILE), encoding='utf-8') as file:
+        return json.load(file)
+
+
+def _save_manifest(embedding_dir: str, manifest: Dict[str, Any]):
+    path = os.path.join(embedding_dir, MANIFEST_FILE)
+    with open(path + '.tmp', 'w', encoding='utf-8') as file:
+        json.dump(manifest, file, indent=2)
+    os.replace(path + '.tmp', path)  # A killed job never leaves a half-written manifest
+
+
+def _write_metadata(path: str, rows: List[Dict[str, Any]]):
+    import pyarrow as pa
+
+    table = pa.Table.from_pylist(rows, schema=pa.schema([
+        ('doc_id', pa.string()), ('url', pa.string()), ('char_start', pa.int64()), ('char_end', pa.int64())]))
+    with pa.OSFile(path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+
+
+def embed_corpus(input_path: str, embedding_dir: str, encoder: Encoder, text_column: str = 'text',
+                 passage_words: int = 200, batch_size: int = 64, sort_window: int = 32,
+                 shard_rows: int = 200000, dtype: str = 'float16', file_range_start: int = None,
+                 file_range_end: int = None, max_docs: int = None) -> Dict[str, Any]:
+    """
+    Embed every passage of input_path into embedding_dir. Passages are encoded in windows of
+    batch_size * sort_window so that length sorting has enough texts to group.
+    """
+    os.makedirs(embedding_dir, exist_ok=True)
+    extension, np_dtype = DTYPES[dtype]
+    settings = {'model': encoder.model_name, 'dim': encoder.dim, 'dtype': dtype, 'normalized': encoder.normalize,
+                'max_length': encoder.max_length, 'text_column': text_column, 'passage_words': passage_words,
+                'input_path': os.path.abspath(input_path), 'file_range': [file_range_start, file_range_end],
+                'max_docs': max_docs}
+    manifest = {**settings, 'shards': [], 'rows': 0}
+    if os.path.exists(os.path.join(embedding_dir, MANIFEST_FILE)):
+        previous = load_manifest(embedding_dir)
+        changed = {key for key in settings if previous.get(key) != settings[key]}
+        if changed:
+            raise ValueError(f"{embedding_dir} holds embeddings with other settings: {', '.join(sorted(changed))}")
+        manifest = previous
+        print(f"Resuming after {manifest['rows']} passages in {len(manifest['shards'])} shards")
+
+    done = manifest['rows']
+    passages = iter_passages(input_path, text_column, passage_words, file_range_start, file_range_end, max_docs)
+    for _ in range(done):  # Same stream as before: skip what finished shards hold
+        next(passages, None)
+
+    start = time.perf_counter()
+    embedded = 0
+    window = batch_size * sort_window
+    texts: List[str] = []
+    shard_meta: List[Dict[str, Any]] = []
+    shard_file = None
+
+    def flush_window():
+        nonlocal embedded
+        encoder.encode(texts, batch_size).astype(np_dtype).tofile(shard_file)
+        embedded += len(texts)
+        texts.clear()
+
+    def close_shard():
+        nonlocal shard_file
+        name = f"{len(manifest['shards']):05d}"
+        shard_file.close()
+        shard_file = None
+        _write_metadata(os.path.join(embedding_dir, f"meta_{name}.arrow"), shard_meta)
+        manifest['shards'].append({'vectors': f"emb_{name}.{extension}", 'metadata': f"meta_{name}.arrow",
+                                   'rows': len(shard_meta)})
+        manifest['rows'] += len(shard_meta)
+        _save_manifest(embedding_dir, manifest)
+        shard_meta.clear()
+        elapsed = time.perf_counter() - start
+        print(f"Shard {name}: {manifest['rows']} passages total, {embedded / elapsed:.1f} passages/s")
+
+    for text, meta in passages:
+        if shard_file is None:
+            # Opened with 'wb': a shard left over from a killed run is not in the manifest and is rewritten
+            shard_file = open(os.path.join(embedding_dir, f"emb_{len(manifest['shards']):05d}.{extension}"), 'wb')
+        texts.append(text)
+        shard_meta.append(meta)
+        if len(texts) >= window or len(shard_meta) >= shard_rows:
+            flush_window()
+        if len(shard_meta) >= shard_rows:
+            close_shard()
+    if texts:
+        flush_window()
+    if shard_file is not None:
+        close_shard()
+    manifest['complete'] = True
+    _save_manifest(embedding_dir, manifest)
+    return manifest
+
+
+class EmbeddingStore:
+    """Memory-mapped shards of one or more embedding directories, addressed by global row"""
+
+    def __init__(self, embedding_dirs: List[str]):
+        import pyarrow as pa
+
+        self.vectors: List[np.ndarray] = []
+        self.metadata = []
+        self.starts: List[int] = []
+        self.dim = None
+        self.model = None
+        rows = 0
+        for embedding_dir in embedding_dirs:
+            manifest = load_manifest(embedding_dir)
+            if self.dim is not None and (manifest['dim'], manifest['model']) != (self.dim, self.model):
+                raise ValueError(f"{embedding_dir}: embeddings of another model or dimension")
+            self.dim, self.model = manifest['dim'], manifest['model']
+            self.max_length = manifest['max_length']
+            np_dtype = DTYPES[manifest['dtype']][1]
+            for shard in manifest['shards']:
+                self.starts.append(rows)
+                self.vectors.append(np.memmap(os.path.join(embedding_dir, shard['vectors']), dtype=np_dtype,
+                                              mode='r', shape=(shard['rows'], manifest['dim'])))
+                self.metadata.append(pa.ipc.open_file(
+                    pa.memory_map(os.path.join(embedding_dir, shard['metadata']))).read_all())
+                rows += shard['rows']
+        self.rows = rows
+
+    def iter_batches(self, batch_rows: int = 100000) -> Iterator[np.ndarray]:
+        """float32 batches in row order (FAISS takes float32)"""
+        for vectors in self.vectors:
+            for start in range(0, len(vectors), batch_rows):
+                yield np.ascontiguousarray(vectors[start:start + batch_rows], dtype=np.float32)
+
+    def sample(self, n: int, seed: int = 0) -> np.ndarray:
+        """n rows drawn uniformly without replacement, e.g. as the IVF training set"""
+        rows = np.sort(np.random.default_rng(seed).choice(self.rows, size=min(n, self.rows), replace=False))
+        bounds = np.searchsorted(rows, self.starts + [self.rows])
+        return np.concatenate([vectors[rows[lo:hi] - start] for vectors, start, lo, hi
+                               in zip(self.vectors, self.starts, bounds[:-1], bounds[1:])]).astype(np.float32)
+
+    def _locate(self, row: int) -> Tuple[int, int]:
+        shard = bisect.bisect_right(self.starts, row) - 1
+        return shard, row - self.starts[shard]
+
+    def vector(self, row: int) -> np.ndarray:
+        shard, offset = self._locate(row)
+        return self.vectors[shard][offset]
+
+    def meta(self, row: int) -> Dict[str, Any]:
+        shard, offset = self._locate(row)
+        return self.metadata[shard].slice(offset, 1).to_pylist()[0]
+
+
+# FAISS index
+def default_nlist(rows: int) -> int:
+    """~4 sqrt(N) lists, the usual starting point; at least 1, at most rows / 39 (FAISS' minimum per list)"""
+    return max(1, min(int(4 * math.sqrt(rows)), rows // 39))
+
+
+def default_pq_m(dim: int) -> int:
+    """PQ sub-quantizers: the largest divisor of dim up to dim / 8 (384-d MiniLM: 48 bytes per vector)"""
+    return max(m for m in range(1, max(1, dim // 8) + 1) if dim % m == 0)
+
+
+def index_factory_string(index_type: str, dim: int, nlist: int = None, m: int = 32, pq_m: int = None,
+                         pq_bits: int = 8) -> str:
+    """faiss.index_factory description of an index type"""
+    pq = f"PQ{pq_m or default_pq_m(dim)}x{pq_bits}"
+    descriptions = {
+        'flat': 'Flat',
+        'hnsw': f"HNSW{m},Flat",
+        'sq8': 'SQ8',
+        'pq': pq,
+        'opq': f"OPQ{pq_m or default_pq_m(dim)},{pq}",
+        'ivf': f"IVF{nlist},Flat",
+        'ivfsq8': f"IVF{nlist},SQ8",
+        'ivfpq': f"IVF{nlist},{pq}",
+        'opqivfpq': f"OPQ{pq_m or default_pq_m(dim)},IVF{nlist},{pq}",
+    }
+    if index_type not in descriptions:
+        raise ValueError(f"Unknown index type '{index_type}', expected one of {', '.join(INDEX_TYPES)}")
+    return descriptions[index_type]
+
+
+def new_faiss_index(index_type: str, dim: int, rows: int, nlist: int = None, m: int = 32,
+                    ef_construction: int = 200, pq_m: int = None, pq_bits: int = 8) -> Tuple[Any, Dict[str, Any]]:
+    """Empty inner-product index of index_type for about rows vectors, and its build parameters"""
+    import faiss
+
+    params: Dict[str, Any] = {}
+    if index_type in IVF_TYPES:
+        params['nlist'] = nlist = nlist or default_nlist(rows)
+    if index_type in ('pq', 'opq', 'ivfpq', 'opqivfpq'):
+        params.update({'pq_m': pq_m or default_pq_m(dim), 'pq_bits': pq_bits})
+        if dim % params['pq_m']:
+            raise ValueError(f"pq_m {params['pq_m']} does not divide the {dim} dimensions")
+    description = index_factory_string(index_type, dim, nlist, m, pq_m, pq_bits)
+    index = faiss.index_factory(dim, description, faiss.METRIC_INNER_PRODUCT)
+    if index_type == 'hnsw':
+        faiss.downcast_index(index).hnsw.efConstruction = ef_construction
+        params.update({'m': m, 'ef_construction': ef_construction})
+    params['factory'] = description
+    return index, params
+
+
+def default_train_size(params: Dict[str, Any], rows: int) -> int:
+    """
+    Training sample: k-means wants 30-256 points per centroid, so 256 per IVF list and
+    256 per PQ centroid (2^pq_bits); scalar quantizers only need value ranges
+    """
+    wanted = [256 * params['nlist']] if 'nlist' in params else []
+    if 'pq_bits' in params:
+        wanted.append(256 * 2 ** params['pq_bits'])
+    return min(rows, max(wanted) if wanted else 65536)
+
+
+def set_search_params(index, nprobe: int = None, ef_search: int = None):
+    """nprobe (IVF) / efSearch (HNSW), also through wrappers such as IndexIDMap or pre-transforms"""
+    import faiss
+
+    parameters = faiss.ParameterSpace()
+    if nprobe is not None:
+        parameters.set_index_parameter(index, 'nprobe', nprobe)
+    if ef_search is not None:
+        parameters.set_index_parameter(index, 'efSearch', ef_search)
+
+
+def build_faiss_index(embedding_dirs: List[str], index_path: str, index_type: str = 'ivf', nlist: int = None,
+                      m: int = 32, ef_construction: int = 200, train_size: int = None,
+                      threads: int = None, pq_m: int = None, pq_bits: int = 8) -> Dict[str, Any]:
+    """Inner-product index over the normalized embeddings (cosine); row i of the store is FAISS id i"""
+    import faiss
+
+    if threads:
+        faiss.omp_set_num_threads(threads)
+    store = EmbeddingStore(embedding_dirs)
+    if not store.rows:
+        raise ValueError("No embeddings to index")
+    start = time.perf_counter()
+    info = {'index_type': index_type, 'embedding_dirs': [os.path.abspath(d) for d in embedding_dirs],
+            'rows': store.rows, 'dim': store.dim, 'model': store.model, 'max_length': store.max_length}
+    index, params = new_faiss_index(index_type, store.dim, store.rows, nlist, m, ef_construction, pq_m, pq_bits)
+    info.update(params)
+    if not index.is_trained:
+        training = store.sample(train_size or default_train_size(params, store.rows))
+        print(f"Training {params['factory']} on {len(training)} vectors...")
+        index.train(training)
+        info['train_size'] = len(training)
+    info['train_s'] = round(time.perf_counter() - start, 2)
+
+    for batch in store.iter_batches():
+        index.add(batch)
+        print(f"Added {index.ntotal}/{store.rows} vectors ({time.perf_counter() - start:.1f}s)")
+    faiss.write_index(index, index_path)
+    info['build_s'] = round(time.perf_counter() - start, 2)
+    info['index_bytes'] = os.path.getsize(index_path)
+    with open(index_path + '.json', 'w', encoding='utf-8') as file:
+        json.dump(info, file, indent=2)
+    return info
+
+
+class DenseSearcher:
+    """Queries an index written by build_faiss_index; hits resolve to FineWeb doc ids"""
+
+    def __init__(self, index_path: str, encoder: Encoder = None, nprobe: int = None, ef_search: int = None,
+                 threads: int = None, cache_dir: str = None, model_dir: str = None):
+        import faiss
+
+        if threads:
+            faiss.omp_set_num_threads(threads)
+        with open(index_path + '.json', encoding='utf-8') as file:
+            self.info = json.load(file)
+        # IVF inverted lists can stay on disk (mmap); other index types are loaded
+        flags = faiss.IO_FLAG_MMAP if self.info['index_type'] in IVF_TYPES else 0
+        self.index = faiss.read_index(index_path, flags)
+        set_search_params(self.index, nprobe, ef_search)
+        self.store = EmbeddingStore(self.info['embedding_dirs'])
+        self.encoder = encoder or make_encoder(self.info['model'], self.info['max_length'], threads,
+                                               cache_dir=cache_dir, model_dir=model_dir)
+
+    def search_vectors(self, vectors: np.ndarray, k: int = 10,
+                       collapse: bool = True) -> List[List[Dict[str, Any]]]:
+        """
+        Top k hits per query vector. With collapse, passages of the same document count once
+        (best passage kept), so 4k passages are retrieved to fill k documents.
+        """
+        scores, rows = self.index.search(np.ascontiguousarray(vectors, dtype=np.float32), k * 4 if collapse else k)
+        results = []
+        for query_scores, query_rows in zip(scores, rows):
+            hits, seen = [], set()
+            for score, row in zip(query_scores.tolist(), query_rows.tolist()):
+                if row < 0:  # Fewer than k results (e.g. too few lists probed)
+                    break
+                meta = self.store.meta(row)
+                if collapse:
+                    if meta['doc_id'] in seen:
+                        continue
+                    seen.add(meta['doc_id'])
+                hits.append({**meta, 'row': row, 'score': score})
+                if len(hits) >= k:
+                    break
+            results.append(hits)
+        return results
+
+    def search(self, queries: List[str], k: int = 10, collapse: bool = True) -> List[List[Dict[str, Any]]]:
+        return self.search_vectors(self.encoder.encode(queries), k, collapse)
+
+
+def _read_queries(args) -> List[str]:
+    if args.query_file:
+        from query_source import iter_query_rows
+        return [row['segment_text'] for row in iter_query_rows(args.query_file, 0, args.max_queries)]
+    return args.query
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dense retrieval over FineWeb Parquet: embed, build, search")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    threads_default = int(os.environ.get('SLURM_CPUS_PER_TASK', 0)) or None
+
+    embed_parser = subparsers.add_parser('embed', help="Embed Parquet text into memory-mapped shards")
+    embed_parser.add_argument('input_path', help="Parquet file or directory")
+    embed_parser.add_argument('embedding_dir')
+    embed_parser.add_argument('--model', default=DEFAULT_MODEL)
+    embed_parser.add_argument('--text-column', default='text')
+    embed_parser.add_argument('--passage-words', type=int, default=200, help="Words per passage, 0 = whole document")
+    embed_parser.add_argument('--max-length', type=int, default=256, help="Tokens per passage (truncated beyond)")
+    embed_parser.add_argument('--batch-size', type=int, default=64)
+    embed_parser.add_argument('--sort-window', type=int, default=32, help="Batches grouped by length together")
+    embed_parser.add_argument('--shard-rows', type=int, default=200000)
+    embed_parser.add_argument('--dtype', choices=sorted(DTYPES), default='float16')
+    embed_parser.add_argument('--file-range-start', type=int, default=None)
+    embed_parser.add_argument('--file-range-end', type=int, default=None)
+    embed_parser.add_argument('--max-docs', type=int, default=None)
+
+    build_parser = subparsers.add_parser('build', help="Build a FAISS index from embedding directories")
+    build_parser.add_argument('index_path')
+    build_parser.add_argument('--embeddings', nargs='+', required=True, help="Embedding directories, in id order")
+    build_parser.add_argument('--type', choices=INDEX_TYPES, default='ivf')
+    build_parser.add_argument('--nlist', type=int, default=None, help="IVF lists (default ~4 sqrt(N))")
+    build_parser.add_argument('--m', type=int, default=32, help="HNSW neighbours per node")
+    build_parser.add_argument('--ef-construction', type=int, default=200)
+    build_parser.add_argument('--train-size', type=int, default=None)
+    build_parser.add_argument('--pq-m', type=int, default=None, help="PQ codes per vector (default: dim / 8 or below)")
+    build_parser.add_argument('--pq-bits', type=int, default=8, help="Bits per PQ code")
+
+    search_parser = subparsers.add_parser('search', help="Search an index with query texts")
+    search_parser.add_argument('index_path')
+    group = search_parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('--query', action='append')
+    group.add_argument('--query-file', help="CSV/JSONL/Parquet query file (segment_text)")
+    search_parser.add_argument('--max-queries', type=int, default=None)
+    search_parser.add_argument('--k', type=int, default=5)
+    search_parser.add_argument('--nprobe', type=int, default=None)
+    search_parser.add_argument('--ef-search', type=int, default=None)
+    search_parser.add_argument('--no-collapse', action='store_true', help="Allow several passages per document")
+
+    for sub in subparsers.choices.values():
+        sub.add_argument('--threads', type=int, default=threads_default)
+    for sub in (embed_parser, search_parser):
+        sub.add_argument('--cache-dir', default=None, help="Embedding cache shared across runs (embedding_cache.py)")
+        sub.add_argument('--model-dir', default=None, help="Local model copies, saved on first use")
+    args = parser.parse_args()
+
+    if args.command == 'embed':
+        try:
+            # The cache stores vectors in the shard dtype, so cached and fresh rows are identical
+            encoder = make_encoder(args.model, args.max_length, args.threads, cache_dir=args.cache_dir,
+                                   model_dir=args.model_dir, cache_dtype=args.dtype)
+            manifest = embed_corpus(args.input_path, args.embedding_dir, encoder, args.text_column,
+                                    args.passage_words, args.batch_size, args.sort_window, args.shard_rows,
+                                    args.dtype, args.file_range_start, args.file_range_end, args.max_docs)
+        except ValueError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        print(f"Embedded {manifest['rows']} passages ({manifest['dim']}-d {manifest['dtype']}) "
+              f"into {len(manifest['shards'])} shards in {args.embedding_dir}")
+        if args.cache_dir:
+            print(encoder.cache.stats_line())
+    elif args.command == 'build':
+        info = build_faiss_index(args.embeddings, args.index_path, args.type, args.nlist, args.m,
+                                 args.ef_construction, args.train_size, args.threads, args.pq_m, args.pq_bits)
+        print(f"Built {info['index_type']} index of {info['rows']} vectors in {info['build_s']}s "
+              f"({info['index_bytes'] / 1024 ** 2:.1f} MB): {args.index_path}")
+    else:
+        searcher = DenseSearcher(args.index_path, nprobe=args.nprobe, ef_search=args.ef_search,
+                                 threads=args.threads, cache_dir=args.cache_dir, model_dir=args.model_dir)
+        queries = _read_queries(args)
+        start = time.perf_counter()
+        results = searcher.search(queries, args.k, collapse=not args.no_collapse)
+        elapsed = time.perf_counter() - start
+        for query, hits in zip(queries, results):
+            print(f"\nQuery: {query[:100]}")
+            for hit in hits:
+                print(f"  {hit['score']:.4f}  {hit['doc_id']}  {hit['url']}")
+        print(f"\n{len(queries)} queries in {elapsed:.2f}s ({len(queries) / elapsed if elapsed else 0:.1f} queries/s)")
+        if args.cache_dir:
+            print(searcher.encoder.cache.stats_line())
+
+
+if __name__ == "__main__":
+    main()
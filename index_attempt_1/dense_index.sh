@@ -0,0 +1,138 @@
+#!/bin/bash
+#SBATCH --job-name=dense-index
+#SBATCH --partition=normal
+#SBATCH --account=a145
+#SBATCH --time=04:00:00
+#SBATCH --nodes=1
+#SBATCH --ntasks-per-node=1
+#SBATCH --cpus-per-task=32
+#SBATCH --mem=64G
+
+#SBATCH --output=/capstor/scratch/cscs/anastasiia_kucherenko/fineweb_indexing/test_scale/output/dense_index_%j.out
+#SBATCH --error=/capstor/scratch/cscs/anastasiia_kucherenko/fineweb_indexing/test_scale/err/dense_index_%j.err
+
+# Dense retrieval index over FineWeb Parquet (dense_index.py):
+#   embed  passages of DATA_DIR[FILE_RANGE_START:FILE_RANGE_END] -> EMBEDDING_DIR (resumable)
+#   build  FAISS index over EMBEDDING_DIRS -> INDEX_PATH (IVF, HNSW, flat or compressed SQ8/PQ/OPQ/IVF-PQ)
+#   bench  recall@k, QPS, build time and memory of BENCH_TYPES on a sample (vector_benchmark.py)
+# For job arrays run STAGE=embed per file range with its own EMBEDDING_DIR, then one
+# STAGE=build job with EMBEDDING_DIRS listing them all (in order: it defines the vector ids)
+set -e
+
+SCRIPT_DIR="${SCRIPT_DIR:-/capstor/scratch/cscs/anastasiia_kucherenko/index_attempt_1}"
+DATA_DIR="${DATA_DIR:-/capstor/scratch/cscs/anastasiia_kucherenko/index_attempt_1}"
+WORK_DIR="${WORK_DIR:-/capstor/scratch/cscs/anastasiia_kucherenko/fineweb_dense}"
+STAGE="${STAGE:-all}"                         # 'embed', 'build', 'all' (embed + build) or 'bench'
+PYTHON="${PYTHON:-python3}"                   # Needs torch, transformers, faiss-cpu, pyarrow
+
+# Embedding
+MODEL="${MODEL:-sentence-transformers/all-MiniLM-L6-v2}"
+FILE_RANGE_START="${FILE_RANGE_START:-}"
+FILE_RANGE_END="${FILE_RANGE_END:-}"
+EMBEDDING_DIR="${EMBEDDING_DIR:-${WORK_DIR}/embeddings_${FILE_RANGE_START:-0}_${FILE_RANGE_END:-all}}"
+PASSAGE_WORDS="${PASSAGE_WORDS:-200}"         # Words per passage, 0 = whole document
+MAX_LENGTH="${MAX_LENGTH:-256}"               # Tokens per passage, MiniLM was trained on <= 256
+EMBED_BATCH_SIZE="${EMBED_BATCH_SIZE:-64}"
+SORT_WINDOW="${SORT_WINDOW:-32}"              # Batches sorted by length together (less padding)
+EMB_DTYPE="${EMB_DTYPE:-float16}"             # Shard dtype: 'float16' halves disk and page cache
+SHARD_ROWS="${SHARD_ROWS:-200000}"
+THREADS="${THREADS:-${SLURM_CPUS_PER_TASK:-$(nproc)}}"
+EMBEDDING_CACHE_DIR="${EMBEDDING_CACHE_DIR:-}"  # Passages embedded by earlier jobs are read, not recomputed
+MODEL_DIR="${MODEL_DIR:-${WORK_DIR}/models}"   # Local model copy, saved by the first job
+
+# FAISS index
+EMBEDDING_DIRS="${EMBEDDING_DIRS:-$EMBEDDING_DIR}"
+INDEX_TYPE="${INDEX_TYPE:-ivf}"               # ivf, hnsw, flat (exact), sq8, pq, opq, ivfsq8, ivfpq, opqivfpq
+INDEX_PATH="${INDEX_PATH:-${WORK_DIR}/fineweb_${INDEX_TYPE}.faiss}"
+NLIST="${NLIST:-}"                            # IVF lists, default ~4 sqrt(N)
+HNSW_M="${HNSW_M:-32}"
+EF_CONSTRUCTION="${EF_CONSTRUCTION:-200}"
+TRAIN_SIZE="${TRAIN_SIZE:-}"                  # Training sample, default 256 per IVF list / PQ centroid
+PQ_M="${PQ_M:-}"                              # PQ codes per vector (bytes with PQ_BITS=8), default dim / 8
+PQ_BITS="${PQ_BITS:-8}"
+
+# Benchmark (STAGE=bench): exact top k of held-out sample rows vs each index type
+BENCH_TYPES="${BENCH_TYPES:-flat sq8 pq opq ivf ivfsq8 ivfpq opqivfpq hnsw}"
+BENCH_ROWS="${BENCH_ROWS:-1000000}"           # Indexed sample size
+BENCH_QUERIES="${BENCH_QUERIES:-1000}"
+BENCH_QUERY_FILE="${BENCH_QUERY_FILE:-}"      # Real query segments instead of held-out rows
+BENCH_K="${BENCH_K:-10}"
+BENCH_NPROBE="${BENCH_NPROBE:-1 4 16 64}"
+BENCH_EF_SEARCH="${BENCH_EF_SEARCH:-16 64 256}"
+BENCH_OUTPUT="${BENCH_OUTPUT:-${WORK_DIR}/vector_benchmark_$(date +%Y%m%d_%H%M%S).csv}"
+
+# Colors for output
+RED='\033[0;31m'
+GREEN='\033[0;32m'
+BLUE='\033[0;34m'
+NC='\033[0m' # No Color
+
+log_info() {
+    echo -e "${BLUE}[INFO]${NC} $1"
+}
+
+log_error() {
+    echo -e "${RED}[ERROR]${NC} $1"
+}
+
+log_success() {
+    echo -e "${GREEN}[SUCCESS]${NC} $1"
+}
+
+if [ "$STAGE" != "embed" ] && [ "$STAGE" != "build" ] && [ "$STAGE" != "all" ] && [ "$STAGE" != "bench" ]; then
+    log_error "Unknown STAGE '$STAGE'"
+    log_info "Usage: DATA_DIR=/path/to/parquet [STAGE=all|embed|build|bench] sbatch $0"
+    log_info "  FILE_RANGE_START= FILE_RANGE_END=       # Slice of DATA_DIR's sorted Parquet files to embed"
+    log_info "  PASSAGE_WORDS=200 MAX_LENGTH=256        # Passage split and token truncation"
+    log_info "  EMBED_BATCH_SIZE=64 SORT_WINDOW=32      # Padded batch size, batches sorted by length together"
+    log_info "  EMB_DTYPE=float16 SHARD_ROWS=200000     # Memory-mapped shard format"
+    log_info "  EMBEDDING_CACHE_DIR= MODEL_DIR=         # Embedding cache, local model copies"
+    log_info "  EMBEDDING_DIRS=\"dir1 dir2\"               # Build from several embed jobs"
+    log_info "  INDEX_TYPE=ivf NLIST= TRAIN_SIZE=       # IVF lists (default ~4 sqrt(N)), training sample"
+    log_info "  INDEX_TYPE=hnsw HNSW_M=32 EF_CONSTRUCTION=200"
+    log_info "  INDEX_TYPE=ivfpq PQ_M= PQ_BITS=8         # Also sq8, pq, opq, ivfsq8, opqivfpq"
+    log_info "  BENCH_TYPES=\"sq8 ivfpq hnsw\" BENCH_ROWS=1000000 BENCH_QUERIES=1000 BENCH_K=10"
+    log_info "  BENCH_NPROBE=\"1 4 16 64\" BENCH_EF_SEARCH=\"16 64 256\" BENCH_QUERY_FILE="
+    exit 1
+fi
+
+mkdir -p "$WORK_DIR"
+log_info "Dense index: stage $STAGE, $THREADS threads"
+log_info "  Data: $DATA_DIR [${FILE_RANGE_START:-0}, ${FILE_RANGE_END:-end})"
+log_info "  Model: $MODEL (passage words: $PASSAGE_WORDS, max length: $MAX_LENGTH, batch: $EMBED_BATCH_SIZE x $SORT_WINDOW)"
+log_info "  Embeddings: $EMBEDDING_DIRS ($EMB_DTYPE, $SHARD_ROWS rows per shard${EMBEDDING_CACHE_DIR:+, cache: $EMBEDDING_CACHE_DIR})"
+log_info "  Index: $INDEX_PATH ($INDEX_TYPE, nlist: ${NLIST:-auto}, M: $HNSW_M, efConstruction: $EF_CONSTRUCTION, PQ: ${PQ_M:-auto}x$PQ_BITS)"
+
+if [ "$STAGE" = "embed" ] || [ "$STAGE" = "all" ]; then
+    log_info "Embedding passages into $EMBEDDING_DIR..."
+    $PYTHON "$SCRIPT_DIR/dense_index.py" embed "$DATA_DIR" "$EMBEDDING_DIR" \
+        --model "$MODEL" --passage-words "$PASSAGE_WORDS" --max-length "$MAX_LENGTH" \
+        --batch-size "$EMBED_BATCH_SIZE" --sort-window "$SORT_WINDOW" --dtype "$EMB_DTYPE" \
+        --shard-rows "$SHARD_ROWS" --threads "$THREADS" --model-dir "$MODEL_DIR" \
+        ${EMBEDDING_CACHE_DIR:+--cache-dir "$EMBEDDING_CACHE_DIR"} \
+        ${FILE_RANGE_START:+--file-range-start "$FILE_RANGE_START"} \
+        ${FILE_RANGE_END:+--file-range-end "$FILE_RANGE_END"}
+    log_success "Embeddings written to $EMBEDDING_DIR"
+fi
+
+if [ "$STAGE" = "build" ] || [ "$STAGE" = "all" ]; then
+    log_info "Building $INDEX_TYPE index..."
+    # shellcheck disable=SC2086  # EMBEDDING_DIRS is a space separated list
+    $PYTHON "$SCRIPT_DIR/dense_index.py" build "$INDEX_PATH" --embeddings $EMBEDDING_DIRS \
+        --type "$INDEX_TYPE" --m "$HNSW_M" --ef-construction "$EF_CONSTRUCTION" --threads "$THREADS" \
+        --pq-bits "$PQ_BITS" ${PQ_M:+--pq-m "$PQ_M"} \
+        ${NLIST:+--nlist "$NLIST"} ${TRAIN_SIZE:+--train-size "$TRAIN_SIZE"}
+    log_success "Index written to $INDEX_PATH"
+fi
+
+if [ "$STAGE" = "bench" ]; then
+    log_info "Benchmarking $BENCH_TYPES on $BENCH_ROWS vectors, $BENCH_QUERIES queries, k=$BENCH_K..."
+    # shellcheck disable=SC2086  # EMBEDDING_DIRS, BENCH_TYPES, BENCH_NPROBE and BENCH_EF_SEARCH are lists
+    $PYTHON "$SCRIPT_DIR/vector_benchmark.py" --embeddings $EMBEDDING_DIRS --output "$BENCH_OUTPUT" \
+        --types $BENCH_TYPES --database-rows "$BENCH_ROWS" --queries "$BENCH_QUERIES" --k "$BENCH_K" \
+        --nprobe $BENCH_NPROBE --ef-search $BENCH_EF_SEARCH --m "$HNSW_M" --ef-construction "$EF_CONSTRUCTION" \
+        --pq-bits "$PQ_BITS" --threads "$THREADS" --model-dir "$MODEL_DIR" ${PQ_M:+--pq-m "$PQ_M"} \
+        ${NLIST:+--nlist "$NLIST"} ${BENCH_QUERY_FILE:+--query-file "$BENCH_QUERY_FILE"} \
+        ${EMBEDDING_CACHE_DIR:+--cache-dir "$EMBEDDING_CACHE_DIR"}
+    log_success "Benchmark results written to $BENCH_OUTPUT"
+fi
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Content-addressed embedding cache for dense_index.py
+Vectors are keyed by a 128-bit hash of the encoder settings (model, max_length, normalization)
+and the whitespace-normalized text, so the same passage or query segment is embedded once
+across runs and jobs. On disk the cache is two append-only files read back with np.memmap:
+
+  cache.json      dim and dtype of the vectors, model that produced them
+  keys.u64        rows x 2 uint64, the text hash of each row
+  vectors.f16|f32 rows x dim vectors, C order, no header
+
+Appends hold an flock on cache.lock, so several SLURM jobs can share one cache directory.
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+import threading
+import unicodedata
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from dense_index import DTYPES, Encoder
+
+CACHE_META_FILE = 'cache.json'
+KEYS_FILE = 'keys.u64'
+LOCK_FILE = 'cache.lock'
+
+
+def normalize_text(text: str) -> str:
+    """NFC, whitespace runs collapsed: differences the tokenizer does not see anyway"""
+    return ' '.join(unicodedata.normalize('NFC', text).split())
+
+
+def text_keys(prefix: str, texts: List[str]) -> np.ndarray:
+    """(len(texts), 2) uint64 blake2b-128 of prefix + normalized text"""
+    digests = b''.join(hashlib.blake2b(f"{prefix}\0{normalize_text(text)}".encode('utf-8'), digest_size=16).digest()
+                       for text in texts)
+    return np.frombuffer(digests, dtype='<u8').reshape(len(texts), 2)
+
+
+class EmbeddingCache:
+    """
+    Memory-mapped vectors with a compact sorted key index (16 bytes + row per entry) and a
+    small dict of the entries added since the index was last rebuilt. Thread-safe.
+    """
+
+    def __init__(self, cache_dir: str, dim: int = None, dtype: str = None, model: str = None):
+        self.cache_dir = cache_dir
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+        meta_path = os.path.join(cache_dir, CACHE_META_FILE)
+        if os.path.exists(meta_path):
+            with open(meta_path, encoding='utf-8') as file:
+                meta = json.load(file)
+            if (dim is not None and dim != meta['dim']) or (dtype is not None and dtype != meta['dtype']):
+                raise ValueError(f"{cache_dir} caches {meta['dim']}-d {meta['dtype']} vectors, "
+                                 f"not {dim or meta['dim']}-d {dtype or meta['dtype']}")
+            if model is not None and meta.get('model') not in (None, model):
+                raise ValueError(f"{cache_dir} caches vectors of {meta['model']}, not {model}")
+            dim, dtype, model = meta['dim'], meta['dtype'], meta.get('model', model)
+        self.dim = dim
+        self.dtype = dtype or 'float16'
+        self.model = model
+        extension, self.np_dtype = DTYPES[self.dtype]
+        self.keys_path = os.path.join(cache_dir, KEYS_FILE)
+        self.vectors_path = os.path.join(cache_dir, f"vectors.{extension}")
+
+        self.rows = 0
+        self._hi = np.empty(0, dtype=np.uint64)
+        self._lo = np.empty(0, dtype=np.uint64)
+        self._rows = np.empty(0, dtype=np.int64)
+        self._recent: Dict[Tuple[int, int], int] = {}
+        self._vectors = None
+        if self.dim is not None:
+            self._refresh()
+
+    def _complete_rows(self) -> int:
+        """Rows whose key and vector are both on disk (vectors are written first)"""
+        if not os.path.exists(self.keys_path) or not os.path.exists(self.vectors_path):
+            return 0
+        row_bytes = self.dim * np.dtype(self.np_dtype).itemsize
+        return min(os.path.getsize(self.keys_path) // 16, os.path.getsize(self.vectors_path) // row_bytes)
+
+    def _refresh(self):
+        """Pick up rows appended since the last look, by this or another process"""
+        rows = self._complete_rows()
+        if rows <= self.rows:
+            return
+        with open(self.keys_path, 'rb') as file:
+            file.seek(self.rows * 16)
+            keys = np.fromfile(file, dtype='<u8', count=(rows - self.rows) * 2).reshape(-1, 2)
+        for offset, (hi, lo) in enumerate(keys.tolist()):
+            self._recent.setdefault((hi, lo), self.rows + offset)
+        self.rows = rows
+        self._vectors = None
+        if len(self._recent) > max(4096, len(self._hi) // 8):
+            self._merge_recent()
+
+    def _merge_recent(self):
+        """Fold the recent dict into the sorted arrays (one sort, amortized over many appends)"""
+        recent = np.array([(hi, lo, row) for (hi, lo), row in self._recent.items()], dtype=np.uint64).reshape(-1, 3)
+        hi = np.concatenate([self._hi, recent[:, 0]])
+        lo = np.concatenate([self._lo, recent[:, 1]])
+        rows = np.concatenate([self._rows, recent[:, 2].astype(np.int64)])
+        order = np.lexsort((lo, hi))
+        self._hi, self._lo, self._rows = hi[order], lo[order], rows[order]
+        self._recent.clear()
+
+    def _find(self, keys: np.ndarray) -> np.ndarray:
+        """Row of each key, -1 when absent"""
+        found = np.full(len(keys), -1, dtype=np.int64)
+        if len(self._hi):
+            hi, lo = keys[:, 0], keys[:, 1]
+            positions = np.searchsorted(self._hi, hi)
+            clipped = np.minimum(positions, len(self._hi) - 1)
+            same_hi = self._hi[clipped] == hi
+            exact = same_hi & (self._lo[clipped] == lo)
+            found[exact] = self._rows[clipped[exact]]
+            for i in np.flatnonzero(same_hi & ~exact):  # First 64 bits shared by another key: scan the run
+                j = positions[i]
+                while j < len(self._hi) and self._hi[j] == hi[i]:
+                    if self._lo[j] == lo[i]:
+                        found[i] = self._rows[j]
+                        break
+                    j += 1
+        if self._recent:
+            for i in np.flatnonzero(found < 0):
+                found[i] = self._recent.get((int(keys[i, 0]), int(keys[i, 1])), -1)
+        return found
+
+    def find(self, keys: np.ndarray) -> np.ndarray:
+        with self.lock:
+            return self._find(keys)
+
+    def lookup(self, keys: np.ndarray) -> np.ndarray:
+        """Rows of a batch of keys (-1 = miss), counted in the hit statistics"""
+        with self.lock:
+            rows = self._find(keys)
+            misses = int((rows < 0).sum())
+            self.hits += len(rows) - misses
+            self.misses += misses
+        return rows
+
+    def vectors(self, rows: np.ndarray) -> np.ndarray:
+        """float32 vectors of cached rows"""
+        with self.lock:
+            if self._vectors is None:
+                self._vectors = np.memmap(self.vectors_path, dtype=self.np_dtype, mode='r',
+                                          shape=(self.rows, self.dim))
+            return self._vectors[rows].astype(np.float32)
+
+    def put(self, keys: np.ndarray, vectors: np.ndarray):
+        """Append the keys that are not cached yet, also not by a concurrent job"""
+        with self.lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"{self.cache_dir} caches {self.dim}-d vectors, not {vectors.shape[1]}-d")
+            lock_file = open(os.path.join(self.cache_dir, LOCK_FILE), 'a')
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                if not os.path.exists(os.path.join(self.cache_dir, CACHE_META_FILE)):
+                    with open(os.path.join(self.cache_dir, CACHE_META_FILE), 'w', encoding='utf-8') as file:
+                        json.dump({'dim': self.dim, 'dtype': self.dtype, 'model': self.model}, file, indent=2)
+                self._refresh()
+                new, seen = [], set()
+                for i, row in enumerate(self._find(keys).tolist()):
+                    key = (int(keys[i, 0]), int(keys[i, 1]))
+                    if row < 0 and key not in seen:
+                        seen.add(key)
+                        new.append(i)
+                if not new:
+                    return
+                row_bytes = self.dim * np.dtype(self.np_dtype).itemsize
+                # Written at the committed end: a tail left by a killed job is overwritten
+                for path, data, offset in ((self.vectors_path, vectors[new].astype(self.np_dtype), self.rows * row_bytes),
+                                           (self.keys_path, np.ascontiguousarray(keys[new], dtype='<u8'), self.rows * 16)):
+                    with open(path, 'r+b' if os.path.exists(path) else 'wb') as file:
+                        file.seek(offset)
+                        file.write(data.tobytes())
+                        file.truncate()
+                self._refresh()
+                self.stores += len(new)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+                lock_file.close()
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats_line(self) -> str:
+        return (f"Embedding cache: {self.hits + self.misses} lookups, hit rate {self.hit_rate:.1%}, "
+                f"{self.stores} embedded and stored, {self.rows} vectors in {self.cache_dir}")
+
+
+class CachedEncoder:
+    """
+    Encoder interface in front of an EmbeddingCache. The model is loaded on the first miss,
+    so a job whose texts are all cached never pays the model startup.
+    """
+
+    def __init__(self, cache_dir: str, model_name: str, max_length: int = 256, threads: int = None,
+                 normalize: bool = True, model_dir: str = None, dtype: str = None):
+        self.model_name = model_name
+        self.max_length = max_length
+        self.normalize = normalize
+        self.threads = threads
+        self.model_dir = model_dir
+        # The model's dim is only known once it is loaded: the cache checks the model name on
+        # open, and put() the dim of the first vectors embedded
+        self.cache = EmbeddingCache(cache_dir, dtype=dtype, model=model_name)
+        self.key_prefix = f"{model_name}\0{max_length}\0{int(normalize)}"
+        self._encoder = None
+
+    @property
+    def encoder(self) -> Encoder:
+        if self._encoder is None:
+            self._encoder = Encoder(self.model_name, self.max_length, self.threads, self.normalize, self.model_dir)
+        return self._encoder
+
+    @property
+    def dim(self) -> int:
+        return self.cache.dim if self.cache.dim is not None else self.encoder.dim
+
+    def encode(self, texts: List[str], batch_size: int = 64) -> np.ndarray:
+        """
+        float32 (len(texts), dim): hits read from the cache, the distinct misses embedded in
+        one encode call. Every vector comes back through the cache dtype, so a text embeds
+        to the same vector whether it was a hit or not.
+        """
+        if not texts:
+            return np.empty((0, self.dim), dtype=np.float32)
+        keys = text_keys(self.key_prefix, texts)
+        rows = self.cache.lookup(keys)
+        missing = np.flatnonzero(rows < 0)
+        if len(missing):
+            first: Dict[Tuple[int, int], int] = {}
+            for i in missing.tolist():
+                first.setdefault((int(keys[i, 0]), int(keys[i, 1])), i)
+            distinct = list(first.values())
+            self.cache.put(keys[distinct], self.encoder.encode([texts[i] for i in distinct], batch_size))
+            rows[missing] = self.cache.find(keys[missing])
+        return self.cache.vectors(rows)
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Pooled HTTP transport for Elasticsearch
+Keeps persistent keep-alive connections in a requests.Session and
+splits client-side latency into connect / send / server / parse phases
+"""
+
+import json
+import threading
+import time
+from typing import Any, Dict, Tuple, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+# Use orjson for fast (de)serialization if available, fall back to stdlib json
+try:
+    import orjson
+
+    def dumps(obj: Any) -> bytes:
+        return orjson.dumps(obj)
+
+    def loads(data: Union[bytes, str]) -> Any:
+        return orjson.loads(data)
+
+    JSON_BACKEND = 'orjson'
+except ImportError:
+    def dumps(obj: Any) -> bytes:
+        return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+    def loads(data: Union[bytes, str]) -> Any:
+        return json.loads(data)
+
+    JSON_BACKEND = 'json'
+
+# Per-thread accumulators for the phases measured inside urllib3 connections
+_phase_timings = threading.local()
+
+
+def _reset_phase_timings():
+    _phase_timings.connect_ms = 0.0
+    _phase_timings.send_ms = 0.0
+
+
+def _add_phase_time(phase: str, start: float):
+    elapsed = (time.perf_counter() - start) * 1000
+    setattr(_phase_timings, phase, getattr(_phase_timings, phase, 0.0) + elapsed)
+
+
+class _TimedHTTPConnection(HTTPConnection):
+    """HTTP connection that records TCP connect and request send time"""
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            super().connect()
+        finally:
+            _add_phase_time('connect_ms', start)
+
+    def request(self, *args, **kwargs):
+        if self.sock is None:
+            # Lazily connected inside request(), time it as connect
+            self.connect()
+        start = time.perf_counter()
+        try:
+            return super().request(*args, **kwargs)
+        finally:
+            _add_phase_time('send_ms', start)
+
+
+class _TimedHTTPSConnection(HTTPSConnection):
+    """HTTPS connection that records TCP+TLS connect and request send time"""
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            super().connect()
+        finally:
+            _add_phase_time('connect_ms', start)
+
+    def request(self, *args, **kwargs):
+        if self.sock is None:
+            self.connect()
+        start = time.perf_counter()
+        try:
+            return super().request(*args, **kwargs)
+        finally:
+            _add_phase_time('send_ms', start)
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class _TimedHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter whose connection pools use the timed connection classes"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _TimedHTTPConnectionPool,
+            'https': _TimedHTTPSConnectionPool,
+        }
+
+
+class ESTransport:
+    """
+    Persistent, pooled HTTP transport owned by one benchmark/indexer instance.
+    Thread-safe: one Session is shared, each thread checks a connection out of the pool.
+    """
+
+    def __init__(self, es_url: str, pool_size: int = 10, timeout: float = 60):
+        self.es_url = es_url.rstrip('/')
+        self.pool_size = max(1, pool_size)
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        adapter = _TimedHTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({'Content-Type': 'application/json'})
+
+    def encode(self, data: Any) -> bytes:
+        """Encode a request body once so it can be reused across retries/requests"""
+        if data is None or isinstance(data, bytes):
+            return data
+        return dumps(data)
+
+    def request(self, method: str, endpoint: str, body: Union[dict, bytes, None] = None,
+                headers: Dict[str, str] = None,
+                timeout: float = None) -> Tuple[requests.Response, Any, Dict[str, float]]:
+        """
+        Send one request and return (response, decoded_json, phase_timings_ms).
+        body may be a dict or pre-encoded bytes, timeout overrides the transport default.
+        Raises requests exceptions like requests.get/post would.
+        """
+        url = f"{self.es_url}/{endpoint}"
+        data = self.encode(body)
+
+        _reset_phase_timings()
+        start = time.perf_counter()
+        response = self.session.request(method.upper(), url, data=data, headers=headers,
+                                        timeout=timeout or self.timeout, stream=True)
+        headers_received = time.perf_counter()
+
+        try:
+            content = response.content
+        finally:
+            response.close()  # return the connection to the pool
+        decoded = loads(content) if content else {}
+        end = time.perf_counter()
+
+        connect_ms = getattr(_phase_timings, 'connect_ms', 0.0)
+        send_ms = getattr(_phase_timings, 'send_ms', 0.0)
+        to_headers_ms = (headers_received - start) * 1000
+        timings = {
+            'connect_ms': round(connect_ms, 3),
+            'send_ms': round(send_ms, 3),
+            # Time waiting for the response headers: ES processing + network
+            'server_ms': round(max(0.0, to_headers_ms - connect_ms - send_ms), 3),
+            # Reading the body and decoding the JSON
+            'parse_ms': round((end - headers_received) * 1000, 3),
+            'total_ms': (end - start) * 1000,
+        }
+        return response, decoded, timings
+
+    def close(self):
+        self.session.close()
+
+
+def open_transport(es_url: str, pool_size: int = 10, timeout: float = 60):
+    """
+    Transport for a search backend URL: ESTransport for http(s)://, the in-process
+    LocalTransport (local_backend.py) for local:<parquet file or directory>
+    """
+    if es_url.startswith('local:'):
+        from local_backend import LocalTransport
+        return LocalTransport.open(es_url[len('local:'):])
+    return ESTransport(es_url, pool_size=pool_size, timeout=timeout)
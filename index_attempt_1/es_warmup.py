@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Elasticsearch index readiness and warm-up
+Waits for the target index to reach yellow/green with exponential polling, then warms it
+before anything is measured: reads its hot Lucene files (terms dictionary, norms, postings)
+into the page cache and/or runs a sample of representative queries. Reports the duration
+of every phase so benchmark latencies can be read as steady state.
+
+With node.store.allow_mmap=false the index is read through niofs, so the OS page cache is
+what a cold first query waits on; index.store.preload has no effect on that store type.
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
+import requests
+
+from es_transport import ESTransport
+from query_source import count_rows, iter_query_rows
+
+WARMUP_MODES = ('none', 'queries', 'files', 'all')
+# Terms index/dictionary, norms, compound files of small segments, postings; in read order
+HOT_EXTENSIONS = ('tip', 'tim', 'nvm', 'nvd', 'cfs', 'doc')
+READ_CHUNK_BYTES = 8 * 1024 * 1024
+
+
+def wait_for_index(transport: ESTransport, index_name: str, status: str = 'yellow', timeout_s: float = 600,
+                   initial_poll_s: float = 1, max_poll_s: float = 30) -> Dict:
+    """
+    Block until the index health is at least `status`. ES waits server-side for up to the
+    current poll interval, which doubles up to max_poll_s; raises TimeoutError at timeout_s.
+    """
+    deadline = time.monotonic() + timeout_s
+    poll_s = initial_poll_s
+    attempt = 0
+    while True:
+        attempt += 1
+        wait_s = max(1, int(min(poll_s, deadline - time.monotonic())))
+        started = time.monotonic()
+        try:
+            response, health, _ = transport.request(
+                'GET', f"_cluster/health/{index_name}?wait_for_status={status}&timeout={wait_s}s",
+                timeout=wait_s + 30)
+            if response.status_code == 200 and not health.get('timed_out'):
+                return health
+            state = (f"status {health.get('status')}, {health.get('active_shards_percent_as_number', 0)}% shards "
+                     f"active, {health.get('initializing_shards', 0)} initializing, "
+                     f"{health.get('unassigned_shards', 0)} unassigned")
+        except requests.exceptions.RequestException as e:
+            state = f"not reachable ({e.__class__.__name__})"
+            # Connection refused returns at once, so wait out the interval here
+            time.sleep(max(0.0, min(poll_s - (time.monotonic() - started), deadline - time.monotonic())))
+
+        if time.monotonic() >= deadline:
+            raise TimeoutError(f"index '{index_name}' not {status} after {timeout_s}s: {state}")
+        print(f"Waiting for '{index_name}' to be {status} (attempt {attempt}): {state}")
+        poll_s = min(poll_s * 2, max_poll_s)
+
+
+def index_uuids(transport: ESTransport, index_name: str) -> Dict[str, str]:
+    """Concrete index name -> uuid (an alias or pattern may resolve to several indices)"""
+    _, decoded, _ = transport.request('GET', f"{index_name}/_settings/index.uuid?flat_settings=true")
+    return {name: body['settings']['index.uuid'] for name, body in decoded.items()
+            if isinstance(body, dict) and 'settings' in body}
+
+
+def hot_index_files(data_path: str, uuids: List[str], extensions: List[str]) -> List[str]:
+    """Lucene files of the given indices under path.data, ordered by extension priority"""
+    files = []
+    for extension in extensions:
+        for uuid in uuids:
+            # <path.data>/indices/<uuid>/<shard>/index/ (older layouts add nodes/<n>/)
+            for pattern in (os.path.join(data_path, 'indices', uuid, '*', 'index', f'*.{extension}'),
+                            os.path.join(data_path, 'nodes', '*', 'indices', uuid, '*', 'index', f'*.{extension}')):
+                files.extend(sorted(glob.glob(pattern)))
+    return files
+
+
+def _read_file(path: str) -> int:
+    buffer = bytearray(READ_CHUNK_BYTES)
+    total = 0
+    with open(path, 'rb', buffering=0) as file:
+        while True:
+            n = file.readinto(buffer)
+            if not n:
+                return total
+            total += n
+
+
+def warm_files(files: List[str], max_bytes: int, threads: int = 8) -> Tuple[int, int]:
+    """Read files (in the given order) into the page cache until max_bytes; returns (files, bytes)"""
+    selected = []
+    budget = 0
+    for path in files:
+        size = os.path.getsize(path)
+        if budget + size > max_bytes:
+            continue
+        selected.append(path)
+        budget += size
+    # Parallel reads: a shared filesystem is latency bound per stream
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        return len(selected), sum(executor.map(_read_file, selected))
+
+
+def warm_queries(es_url: str, index_name: str, query_file: str, config: Dict, num_queries: int) -> Dict:
+    """
+    Run about num_queries segments spread evenly over the query file through the pipeline's
+    own query builders (same query types and response profile as the measured run)
+    """
+    from my_search import ElasticsearchQueryBenchmark
+
+    total_rows = count_rows(query_file)
+    if total_rows is None:
+        total_rows = sum(1 for _ in iter_query_rows(query_file))
+    warmup_config = dict(config)
+    warmup_config.update({
+        'row_start': 0, 'row_end': None, 'shard_index': 0, 'num_shards': max(1, total_rows // max(num_queries, 1)),
+        'resume': False, 'benchmark_mode': False, 'verbose': False, 'use_query_cache': False,
+        'progress_interval_s': 60
+    })
+    benchmark = ElasticsearchQueryBenchmark(es_url, index_name, warmup_config)
+    try:
+        benchmark.process_csv(query_file)
+    finally:
+        benchmark.close()
+
+    times = [result['query_time_ms'] for result in benchmark.results if not result['error']]
+    tenth = max(1, len(times) // 10)
+    return {
+        'queries': len(benchmark.results),
+        'errors': len(benchmark.results) - len(times),
+        # Converging first/last latencies show the index is warm
+        'first_10pct_mean_ms': round(sum(times[:tenth]) / tenth, 2) if times else 0,
+        'last_10pct_mean_ms': round(sum(times[-tenth:]) / tenth, 2) if times else 0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Wait for an Elasticsearch index and warm it up")
+    parser.add_argument('es_url')
+    parser.add_argument('index_name')
+    parser.add_argument('--status', choices=['yellow', 'green'], default='yellow', help="Health to wait for")
+    parser.add_argument('--timeout-s', type=float, default=600, help="Give up waiting after this long")
+    parser.add_argument('--max-poll-s', type=float, default=30, help="Cap of the doubling poll interval")
+    parser.add_argument('--mode', choices=WARMUP_MODES, default='queries')
+    parser.add_argument('--query-file', default=None, help="Query file for the query warm-up")
+    parser.add_argument('--queries', type=int, default=200, help="Segments sampled for the query warm-up")
+    parser.add_argument('--config-json', default='{}', help="Query configuration, as passed to my_search.py")
+    parser.add_argument('--data-path', default=None, help="ES path.data, for the file warm-up")
+    parser.add_argument('--extensions', default=','.join(HOT_EXTENSIONS), help="Lucene file extensions to read")
+    parser.add_argument('--max-gb', type=float, default=8, help="Page cache budget of the file warm-up")
+    parser.add_argument('--threads', type=int, default=8, help="Parallel file reads")
+    parser.add_argument('--report', default=None, help="Write phase timings to this JSON file")
+    args = parser.parse_args()
+
+    transport = ESTransport(args.es_url.rstrip('/'), pool_size=1, timeout=60)
+    report = {'index_name': args.index_name, 'status': args.status, 'mode': args.mode, 'phases_s': {}}
+    exit_code = 0
+    try:
+        start = time.perf_counter()
+        health = wait_for_index(transport, args.index_name, args.status, args.timeout_s, max_poll_s=args.max_poll_s)
+        report['phases_s']['index_ready'] = round(time.perf_counter() - start, 2)
+        report['health'] = health.get('status')
+        print(f"Index '{args.index_name}' is {health.get('status')} after {report['phases_s']['index_ready']}s")
+
+        if args.mode in ('files', 'all'):
+            if not args.data_path:
+                print("File warm-up skipped: no --data-path")
+            else:
+                start = time.perf_counter()
+                uuids = list(index_uuids(transport, args.index_name).values())
+                files = hot_index_files(args.data_path, uuids, [e.strip() for e in args.extensions.split(',')])
+                files_read, bytes_read = warm_files(files, int(args.max_gb * 1024 ** 3), args.threads)
+                elapsed = time.perf_counter() - start
+                report['phases_s']['warm_files'] = round(elapsed, 2)
+                report['files'] = {'found': len(files), 'read': files_read, 'bytes': bytes_read}
+                print(f"File warm-up: read {files_read}/{len(files)} files, {bytes_read / 1024 ** 3:.2f} GB "
+                      f"in {elapsed:.1f}s ({bytes_read / 1024 ** 2 / elapsed if elapsed else 0:.0f} MB/s)")
+
+        if args.mode in ('queries', 'all'):
+            if not args.query_file:
+                print("Query warm-up skipped: no --query-file")
+            else:
+                start = time.perf_counter()
+                report['queries'] = warm_queries(args.es_url, args.index_name, args.query_file,
+                                                 json.loads(args.config_json), args.queries)
+                report['phases_s']['warm_queries'] = round(time.perf_counter() - start, 2)
+                print(f"Query warm-up: {report['queries']['queries']} queries in "
+                      f"{report['phases_s']['warm_queries']}s, mean latency first 10% "
+                      f"{report['queries']['first_10pct_mean_ms']}ms -> last 10% "
+                      f"{report['queries']['last_10pct_mean_ms']}ms")
+    except TimeoutError as e:
+        print(e)
+        exit_code = 1
+    finally:
+        transport.close()
+
+    print("Phase timings:")
+    for phase, seconds in report['phases_s'].items():
+        print(f"  {phase}: {seconds}s")
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=2)
+        print(f"Warm-up report saved to {args.report}")
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,284 @@
-import pandas as pd
+#!/usr/bin/env python3
+"""
+Parquet inspector
+file mode      - shape, schema, row groups, compression and per-column sizes/statistics
+                 from the footer only, plus a lazily paged preview of a few rows
+directory mode - summary of every shard in parallel: rows and text bytes per language,
+                 text-length histogram and bulk sizing hints for my_indexer.sh
+
+Usage: python3 examine_parquet.py <file.parquet | data_dir> [--rows 10] [--offset 0]
+"""
+
+import argparse
+import json
+import os
 import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from parquet_files import list_parquet_files
+
+HIST_BINS = 24  # log2 buckets of text length in characters: [2^i - 1, 2^(i+1) - 1)
+PREVIEW_WIDTH = 120  # Characters shown per preview value
+SUMMARY_BATCH_ROWS = 65536
+
+
+def _mb(num_bytes: float) -> str:
+    return f"{num_bytes / 1024 ** 2:.2f} MB"
+
+
+def _short(value, width: int = PREVIEW_WIDTH) -> str:
+    text = str(value).replace('\n', '\\n')
+    return text if len(text) <= width else text[:width] + f"... ({len(text)} chars)"
+
+
+def column_summary(metadata: pq.FileMetaData) -> List[Dict]:
+    """Per-column sizes, codecs and statistics aggregated over all row groups (footer only)"""
+    columns = []
+    for c in range(metadata.num_columns):
+        summary = {'name': metadata.schema.column(c).path, 'physical_type': metadata.schema.column(c).physical_type,
+                   'compression': set(), 'encodings': set(), 'compressed_bytes': 0, 'uncompressed_bytes': 0,
+                   'null_count': 0, 'min': None, 'max': None, 'has_stats': True}
+        for rg in range(metadata.num_row_groups):
+            chunk = metadata.row_group(rg).column(c)
+            summary['compression'].add(chunk.compression)
+            summary['encodings'].update(chunk.encodings)
+            summary['compressed_bytes'] += chunk.total_compressed_size
+            summary['uncompressed_bytes'] += chunk.total_uncompressed_size
+            stats = chunk.statistics
+            if stats is None or not stats.has_min_max:
+                summary['has_stats'] = False
+                continue
+            if stats.has_null_count:
+                summary['null_count'] += stats.null_count
+            if summary['min'] is None or stats.min < summary['min']:
+                summary['min'] = stats.min
+            if summary['max'] is None or stats.max > summary['max']:
+                summary['max'] = stats.max
+        summary['compression'] = sorted(summary['compression'])
+        summary['encodings'] = sorted(summary['encodings'])
+        columns.append(summary)
+    return columns
+
+
+def print_file_info(path: str):
+    parquet_file = pq.ParquetFile(path)
+    metadata = parquet_file.metadata
+    file_bytes = os.path.getsize(path)
+    print(f"File: {path}")
+    print(f"Shape: ({metadata.num_rows}, {metadata.num_columns}) (rows, columns)")
+    print(f"Size: {_mb(file_bytes)} on disk, created by {metadata.created_by}, format {metadata.format_version}")
+
+    print(f"\nSchema:")
+    for field in parquet_file.schema_arrow:
+        print(f"  {field.name}: {field.type}")
+
+    print(f"\nRow groups: {metadata.num_row_groups}")
+    for rg in range(metadata.num_row_groups):
+        row_group = metadata.row_group(rg)
+        print(f"  {rg:>4}: {row_group.num_rows:>9} rows, {_mb(row_group.total_byte_size):>12} uncompressed")
+
+    print(f"\nColumns:")
+    print(f"  {'name':<20} {'type':<12} {'codec':<10} {'compressed':>12} {'uncompressed':>14} {'ratio':>6} "
+          f"{'nulls':>8}  min / max")
+    for column in column_summary(metadata):
+        ratio = column['uncompressed_bytes'] / column['compressed_bytes'] if column['compressed_bytes'] else 0
+        if column['has_stats'] and column['min'] is not None:
+            stats = f"{_short(column['min'], 30)} / {_short(column['max'], 30)}"
+            nulls = column['null_count']
+        else:
+            stats, nulls = '-', '-'
+        print(f"  {column['name']:<20} {column['physical_type']:<12} {','.join(column['compression']):<10} "
+              f"{_mb(column['compressed_bytes']):>12} {_mb(column['uncompressed_bytes']):>14} {ratio:>6.2f} "
+              f"{nulls:>8}  {stats}")
+
+
+def iter_rows(path: str, offset: int = 0, limit: int = 10, columns: List[str] = None):
+    """Yield rows [offset, offset + limit) as dicts, decoding only the row groups they fall in"""
+    parquet_file = pq.ParquetFile(path)
+    metadata = parquet_file.metadata
+    first_rg, skip = 0, offset
+    while first_rg < metadata.num_row_groups and skip >= metadata.row_group(first_rg).num_rows:
+        skip -= metadata.row_group(first_rg).num_rows
+        first_rg += 1
+    if first_rg >= metadata.num_row_groups:
+        return
+    row_groups = list(range(first_rg, metadata.num_row_groups))
+    for batch in parquet_file.iter_batches(batch_size=min(skip + limit, SUMMARY_BATCH_ROWS),
+                                           row_groups=row_groups, columns=columns):
+        if skip >= batch.num_rows:
+            skip -= batch.num_rows
+            continue
+        batch = batch.slice(skip, limit)
+        skip = 0
+        for row in batch.to_pylist():
+            yield row
+        limit -= batch.num_rows
+        if limit <= 0:
+            return
+
+
+def print_preview(path: str, offset: int, limit: int, columns: List[str] = None):
+    num_rows = pq.ParquetFile(path).metadata.num_rows
+    if offset >= num_rows:
+        print(f"\nNo rows to preview: offset {offset} is beyond the file's {num_rows} rows")
+        return
+    print(f"\nRows {offset}-{min(offset + limit, num_rows) - 1}:")
+    shown = 0
+    for i, row in enumerate(iter_rows(path, offset, limit, columns), start=offset):
+        print(f"  [{i}]")
+        for key, value in row.items():
+            print(f"    {key}: {_short(value)}")
+        shown += 1
+    remaining = num_rows - offset - shown
+    if remaining > 0:
+        print(f"\n... ({remaining} more rows)")
+
+
+def summarize_file(path: str) -> Dict:
+    """Rows, text bytes and tokens per language and a text-length histogram of one shard"""
+    parquet_file = pq.ParquetFile(path)
+    metadata = parquet_file.metadata
+    names = set(parquet_file.schema_arrow.names)
+    columns = [name for name in ('language', 'text', 'token_count') if name in names]
+    summary = {
+        'path': path,
+        'bytes': os.path.getsize(path),
+        'rows': metadata.num_rows,
+        'row_groups': metadata.num_row_groups,
+        'uncompressed_bytes': sum(metadata.row_group(rg).total_byte_size for rg in range(metadata.num_row_groups)),
+        'max_row_group_rows': max((metadata.row_group(rg).num_rows for rg in range(metadata.num_row_groups)),
+                                  default=0),
+        'max_row_group_bytes': max((metadata.row_group(rg).total_byte_size
+                                    for rg in range(metadata.num_row_groups)), default=0),
+        'languages': {},
+        'text_chars_hist': [0] * HIST_BINS,
+        'max_text_bytes': 0
+    }
+    if not columns:
+        return summary
+
+    # Only the three columns are decoded, one batch at a time
+    for batch in parquet_file.iter_batches(batch_size=SUMMARY_BATCH_ROWS, columns=columns):
+        n = batch.num_rows
+        if 'language' in columns:
+            language = pc.fill_null(batch.column('language').cast(pa.string()), '(null)')
+        else:
+            language = pa.array(['(none)'] * n)
+        text_bytes = pc.fill_null(pc.binary_length(batch.column('text')), 0) if 'text' in columns \
+            else pa.array([0] * n, pa.int64())
+        tokens = pc.fill_null(batch.column('token_count'), 0) if 'token_count' in columns \
+            else pa.array([0] * n, pa.int64())
+
+        grouped = pa.table({'language': language, 'text_bytes': text_bytes.cast(pa.int64()),
+                            'tokens': tokens.cast(pa.int64())}).group_by('language').aggregate(
+            [('text_bytes', 'count'), ('text_bytes', 'sum'), ('tokens', 'sum')])
+        for row in grouped.to_pylist():
+            stats = summary['languages'].setdefault(row['language'], {'rows': 0, 'text_bytes': 0, 'tokens': 0})
+            stats['rows'] += row['text_bytes_count']
+            stats['text_bytes'] += row['text_bytes_sum']
+            stats['tokens'] += row['tokens_sum']
+
+        if 'text' in columns and n:
+            summary['max_text_bytes'] = max(summary['max_text_bytes'], pc.max(text_bytes).as_py())
+            chars = pc.fill_null(pc.utf8_length(batch.column('text')), 0).to_numpy(zero_copy_only=False)
+            buckets = np.minimum(np.log2(chars + 1).astype(np.int64), HIST_BINS - 1)
+            counts = np.bincount(buckets, minlength=HIST_BINS)
+            summary['text_chars_hist'] = [a + int(b) for a, b in zip(summary['text_chars_hist'], counts)]
+    return summary
+
+
+def summarize_directory(data_dir: str, workers: int) -> Dict:
+    files = list_parquet_files(data_dir)
+    if not files:
+        raise ValueError(f"No parquet files found in {data_dir}")
+    total = {'data_dir': data_dir, 'files': len(files), 'bytes': 0, 'rows': 0, 'row_groups': 0,
+             'uncompressed_bytes': 0, 'max_row_group_rows': 0, 'max_row_group_bytes': 0, 'max_text_bytes': 0,
+             'languages': {}, 'text_chars_hist': [0] * HIST_BINS}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for i, summary in enumerate(executor.map(summarize_file, files), start=1):
+            for key in ('bytes', 'rows', 'row_groups', 'uncompressed_bytes'):
+                total[key] += summary[key]
+            for key in ('max_row_group_rows', 'max_row_group_bytes', 'max_text_bytes'):
+                total[key] = max(total[key], summary[key])
+            for language, stats in summary['languages'].items():
+                merged = total['languages'].setdefault(language, {'rows': 0, 'text_bytes': 0, 'tokens': 0})
+                for key in merged:
+                    merged[key] += stats[key]
+            total['text_chars_hist'] = [a + b for a, b in zip(total['text_chars_hist'], summary['text_chars_hist'])]
+            if i % 100 == 0:
+                print(f"  summarized {i}/{len(files)} files")
+    return total
+
+
+def print_summary(total: Dict, max_chunk_mb: float):
+    rows = total['rows']
+    print(f"Directory: {total['data_dir']}")
+    print(f"{total['files']} files, {total['row_groups']} row groups, {rows} rows, "
+          f"{total['bytes'] / 1e9:.2f} GB on disk, {total['uncompressed_bytes'] / 1e9:.2f} GB uncompressed")
+
+    print(f"\nLanguages:")
+    print(f"  {'language':<12} {'rows':>12} {'share':>7} {'text':>14} {'tokens':>14}")
+    for language, stats in sorted(total['languages'].items(), key=lambda item: item[1]['rows'], reverse=True):
+        print(f"  {language:<12} {stats['rows']:>12} {stats['rows'] / rows if rows else 0:>7.2%} "
+              f"{_mb(stats['text_bytes']):>14} {stats['tokens']:>14}")
+
+    print(f"\nText length (characters):")
+    hist = total['text_chars_hist']
+    used = [i for i, count in enumerate(hist) if count]
+    peak = max(hist) or 1
+    for i in range(used[0] if used else 0, used[-1] + 1 if used else 0):
+        low, high = 2 ** i - 1, 2 ** (i + 1) - 1
+        print(f"  {low:>9}-{high - 1:<9} {hist[i]:>12} {'#' * round(40 * hist[i] / peak)}")
+
+    # Sizing: a bulk request is capped by MAX_CHUNK_BYTES, and every build worker holds
+    # one decoded row group plus its NDJSON body. Dictionary-encoded text makes the footer's
+    # uncompressed size an underestimate, so the measured text bytes bound it from below.
+    text_bytes = sum(stats['text_bytes'] for stats in total['languages'].values())
+    avg_row_bytes = max(total['uncompressed_bytes'], text_bytes) / rows if rows else 0
+    print(f"\nSizing:")
+    print(f"  Average row: {avg_row_bytes / 1024:.1f} KB uncompressed, largest text {total['max_text_bytes'] / 1024:.1f} KB")
+    if avg_row_bytes:
+        print(f"  BATCH_SIZE ~{int(max_chunk_mb * 1024 ** 2 / avg_row_bytes)} docs fills a {max_chunk_mb:g} MB bulk")
+    print(f"  Largest row group: {total['max_row_group_rows']} rows, {_mb(total['max_row_group_bytes'])} "
+          f"uncompressed (~{_mb(2 * total['max_row_group_bytes'])} per build worker)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect a Parquet file or summarize a directory of shards")
+    parser.add_argument('path', help="Parquet file or directory of Parquet files")
+    parser.add_argument('--rows', type=int, default=10, help="Rows to preview (file mode)")
+    parser.add_argument('--offset', type=int, default=0, help="First previewed row (file mode)")
+    parser.add_argument('--columns', default=None, help="Comma-separated preview columns (file mode)")
+    parser.add_argument('--workers', type=int,
+                        default=int(os.environ.get('SLURM_CPUS_PER_TASK', os.cpu_count() or 1)),
+                        help="Processes summarizing files in parallel (directory mode)")
+    parser.add_argument('--max-chunk-mb', type=float, default=10, help="Bulk size for the BATCH_SIZE hint (MB)")
+    parser.add_argument('--json', default=None, help="Also write the directory summary to this JSON file")
+    args = parser.parse_args()
+
+    try:
+        if os.path.isdir(args.path):
+            total = summarize_directory(args.path, args.workers)
+            print_summary(total, args.max_chunk_mb)
+            if args.json:
+                with open(args.json, 'w', encoding='utf-8') as file:
+                    json.dump(total, file, indent=2)
+                print(f"\nSummary saved to {args.json}")
+        else:
+            print_file_info(args.path)
+            if args.rows > 0:
+                columns = args.columns.split(',') if args.columns else None
+                print_preview(args.path, args.offset, args.rows, columns)
+    except (OSError, ValueError, pa.ArrowException) as e:
+        print(f"Error reading parquet: {e}")
+        sys.exit(1)
+
 
-file_path = sys.argv[1] if len(sys.argv) > 1 else 'your_file.parquet'
-
-try:
-    df = pd.read_parquet(file_path)
-    print(f"File: {file_path}")
-    print(f"Shape: {df.shape} (rows, columns)")
-    print(f"\nColumns: {df.columns.tolist()}")
-    print(f"\nData types:\n{df.dtypes}")
-    print(f"\nFirst 10 rows:")
-    print(df.head(10).to_string())
-    
-    if df.shape[0] > 10:
-        print(f"\n... ({df.shape[0] - 10} more rows)")
-        
-except Exception as e:
-    print(f"Error reading parquet file: {e}")
+if __name__ == "__main__":
+    main()
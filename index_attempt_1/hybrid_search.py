@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Result fusion for the hybrid (lexical + vector) query type
+Merges Elasticsearch hits with FAISS k-NN hits from dense_index.py. Both sides are keyed by
+the FineWeb document id (the ES _id of the lexical index, doc_id of the embeddings). The
+fused list keeps the ES hit shape, so the pipeline's snippet extraction works unchanged.
+"""
+
+from typing import Any, Dict, List, Tuple
+
+FUSION_METHODS = ('rrf', 'weighted')
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], rrf_k: int = 60) -> Dict[str, float]:
+    """sum over rankings of 1 / (rrf_k + rank), rank starting at 1; ignores score scales entirely"""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (rrf_k + rank)
+    return scores
+
+
+def _min_max(scores: Dict[str, float]) -> Dict[str, float]:
+    if not scores:
+        return {}
+    low, high = min(scores.values()), max(scores.values())
+    if high == low:
+        return {doc_id: 1.0 for doc_id in scores}
+    return {doc_id: (score - low) / (high - low) for doc_id, score in scores.items()}
+
+
+def weighted_fusion(lexical: Dict[str, float], vector: Dict[str, float], lexical_weight: float = 0.5) -> Dict[str, float]:
+    """
+    Convex combination of min-max normalized scores (BM25 is unbounded, cosine is not);
+    a document missing from one side scores 0 there
+    """
+    lexical, vector = _min_max(lexical), _min_max(vector)
+    return {doc_id: lexical_weight * lexical.get(doc_id, 0.0) + (1 - lexical_weight) * vector.get(doc_id, 0.0)
+            for doc_id in lexical.keys() | vector.keys()}
+
+
+def fuse_hits(lexical_hits: List[dict], vector_hits: List[dict], method: str = 'rrf', k: int = 10,
+              rrf_k: int = 60, lexical_weight: float = 0.5) -> Tuple[List[dict], int]:
+    """
+    Top k fused hits in ES hit shape, and the number of distinct candidates. Lexical hits keep
+    their _source and highlight; vector-only hits get their url and are marked '_retrieval': 'vector'.
+    """
+    lexical_by_id: Dict[str, dict] = {}
+    for hit in lexical_hits:
+        lexical_by_id.setdefault(hit.get('_id'), hit)
+    vector_by_id: Dict[str, dict] = {}
+    for hit in vector_hits:
+        vector_by_id.setdefault(hit['doc_id'], hit)  # Best passage first
+
+    if method == 'rrf':
+        scores = reciprocal_rank_fusion([list(lexical_by_id), list(vector_by_id)], rrf_k)
+    elif method == 'weighted':
+        scores = weighted_fusion({doc_id: hit.get('_score') or 0.0 for doc_id, hit in lexical_by_id.items()},
+                                 {doc_id: hit['score'] for doc_id, hit in vector_by_id.items()}, lexical_weight)
+    else:
+        raise ValueError(f"Unknown fusion method '{method}', expected one of {', '.join(FUSION_METHODS)}")
+
+    fused = []
+    for doc_id, score in sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]:
+        lexical_hit, vector_hit = lexical_by_id.get(doc_id), vector_by_id.get(doc_id)
+        hit: Dict[str, Any] = {'_id': doc_id, '_score': score}
+        if lexical_hit is not None:
+            for key in ('_source', 'highlight'):
+                if key in lexical_hit:
+                    hit[key] = lexical_hit[key]
+        else:
+            hit['_source'] = {'url': vector_hit.get('url', '')}
+        hit['_retrieval'] = ('both' if lexical_hit is not None and vector_hit is not None
+                             else 'lexical' if lexical_hit is not None else 'vector')
+        fused.append(hit)
+    return fused, len(scores)
@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""
+Elasticsearch Search Load Generator
+Drives the index with the pipeline's query builders, either closed loop
+(N concurrent virtual users) or open loop (Poisson arrivals at a target QPS),
+for a fixed duration, and reports throughput, latency percentiles over time
+and error/timeout rates
+"""
+
+import csv
+import json
+import os
+import random
+import signal
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Any, Tuple
+
+from my_search import ElasticsearchQueryBenchmark, HYBRID_QUERY_TYPE
+from query_source import iter_query_rows
+from result_stream import RunningStats
+
+WINDOW_FIELDNAMES = [
+    'step', 'target_qps', 'window_start_s', 'requests', 'throughput_qps', 'errors', 'timeouts',
+    'p50_ms', 'p90_ms', 'p99_ms', 'max_ms'
+]
+
+
+class LoadStats:
+    """Thread-safe latency/error counters, overall and per time window"""
+
+    def __init__(self, window_s: float):
+        self.window_s = window_s
+        self.lock = threading.Lock()
+        self.latency = RunningStats()
+        self.windows: Dict[int, Dict[str, Any]] = {}
+        self.requests = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.dropped = 0
+
+    def record(self, elapsed_s: float, latency_ms: float, error: bool, timeout: bool):
+        window = int(elapsed_s // self.window_s)
+        with self.lock:
+            self.requests += 1
+            stats = self.windows.setdefault(window, {'latency': RunningStats(), 'errors': 0, 'timeouts': 0})
+            if error:
+                self.errors += 1
+                stats['errors'] += 1
+            # Counted on its own: a client timeout after retries is both an error and a timeout
+            if timeout:
+                self.timeouts += 1
+                stats['timeouts'] += 1
+            # Failed requests still took time; keep them in the latency distribution
+            self.latency.add(latency_ms)
+            stats['latency'].add(latency_ms)
+
+    def window_rows(self) -> List[dict]:
+        rows = []
+        for window in sorted(self.windows):
+            stats = self.windows[window]
+            latency = stats['latency']
+            rows.append({
+                'window_start_s': round(window * self.window_s, 3),
+                'requests': latency.count,
+                'throughput_qps': round(latency.count / self.window_s, 2),
+                'errors': stats['errors'],
+                'timeouts': stats['timeouts'],
+                'p50_ms': round(latency.quantile(0.5), 2),
+                'p90_ms': round(latency.quantile(0.9), 2),
+                'p99_ms': round(latency.quantile(0.99), 2),
+                'max_ms': round(latency.max or 0, 2),
+            })
+        return rows
+
+
+class SearchLoadGenerator:
+    def __init__(self, benchmark: ElasticsearchQueryBenchmark, config: Dict[str, Any] = None):
+        self.benchmark = benchmark
+
+        # Default configuration
+        default_config = {
+            'load_mode': 'closed',  # 'closed' (virtual users) or 'open' (Poisson arrivals)
+            'virtual_users': 4,  # Concurrent users in closed loop
+            'think_time_ms': 0,  # Pause between a user's requests in closed loop
+            'target_qps': 10,  # Open loop arrival rate; a list runs one step per rate (saturation sweep)
+            'duration_s': 60,  # Duration of a run (of each step in a sweep)
+            'window_s': 5,  # Width of the latency-over-time windows
+            'max_outstanding': 256,  # Open loop: arrivals beyond this many in flight are dropped
+            'seed': 42
+        }
+        if config:
+            default_config.update({k: v for k, v in config.items() if k in default_config})
+        for key, value in default_config.items():
+            setattr(self, key, value)
+
+        self.random = random.Random(self.seed)
+        self.stop_event = threading.Event()
+
+    def load_workload(self, query_file: str) -> List[Tuple[str, dict]]:
+        """Pre-build (query_type, query body) pairs for every segment x enabled query type"""
+        query_methods = self.benchmark._build_query_methods()
+        if HYBRID_QUERY_TYPE in query_methods:
+            # Its vector stage runs in this process, so it would not load Elasticsearch as measured
+            print(f"Load test: {HYBRID_QUERY_TYPE} is skipped, only Elasticsearch query types are replayed")
+            query_methods = {name: builder for name, builder in query_methods.items() if name != HYBRID_QUERY_TYPE}
+        workload = []
+        rows = iter_query_rows(query_file, self.benchmark.row_start, self.benchmark.row_end,
+                               self.benchmark.shard_index, self.benchmark.num_shards)
+        for row in rows:
+            segment_text = row['segment_text'].strip()
+            if not segment_text:
+                continue
+            for query_type, builder in query_methods.items():
+                query = builder(segment_text)
+                if query is not None:
+                    workload.append((query_type, query))
+        if not workload:
+            raise ValueError(f"no queries to send from {query_file}")
+        return workload
+
+    def _send(self, query: dict) -> Tuple[bool, bool]:
+        """Send one query, returns (error, timed_out)"""
+        response, _ = self.benchmark._search(query)
+        if "error" in response:
+            return True, "Timeout" in str(response["error"])
+        return False, bool(response.get("timed_out"))
+
+    def run_closed_loop(self, workload: List[Tuple[str, dict]], stats: LoadStats):
+        """virtual_users threads, each sending its next request as soon as the previous one returns"""
+        start = time.perf_counter()
+        deadline = start + self.duration_s
+
+        def user(user_id: int):
+            rng = random.Random(self.seed + user_id)
+            while not self.stop_event.is_set():
+                sent = time.perf_counter()
+                if sent >= deadline:
+                    return
+                _, query = workload[rng.randrange(len(workload))]
+                error, timeout = self._send(query)
+                done = time.perf_counter()
+                stats.record(sent - start, (done - sent) * 1000, error, timeout)
+                if self.think_time_ms:
+                    time.sleep(self.think_time_ms / 1000)
+
+        threads = [threading.Thread(target=user, args=(i,), daemon=True) for i in range(self.virtual_users)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def run_open_loop(self, workload: List[Tuple[str, dict]], stats: LoadStats, qps: float):
+        """
+        Poisson arrivals at qps for duration_s. Latency is measured from the scheduled
+        arrival time, so queueing behind a saturated server shows up in the percentiles.
+        """
+        start = time.perf_counter()
+        deadline = start + self.duration_s
+        outstanding = threading.Semaphore(self.max_outstanding)
+
+        def request(arrival: float, query: dict):
+            try:
+                error, timeout = self._send(query)
+                stats.record(arrival - start, (time.perf_counter() - arrival) * 1000, error, timeout)
+            finally:
+                outstanding.release()
+
+        with ThreadPoolExecutor(max_workers=self.max_outstanding) as executor:
+            arrival = start
+            while not self.stop_event.is_set():
+                arrival += self.random.expovariate(qps)
+                if arrival >= deadline:
+                    break
+                delay = arrival - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                if not outstanding.acquire(blocking=False):
+                    with stats.lock:
+                        stats.dropped += 1
+                    continue
+                _, query = workload[self.random.randrange(len(workload))]
+                executor.submit(request, arrival, query)
+
+    def run(self, query_file: str) -> List[Dict[str, Any]]:
+        """Run the configured load; one step per target_qps value in open loop"""
+        workload = self.load_workload(query_file)
+        print(f"Workload: {len(workload)} distinct queries")
+
+        if self.load_mode == 'open':
+            rates = self.target_qps if isinstance(self.target_qps, list) else [self.target_qps]
+        else:
+            rates = [None]
+
+        steps = []
+        for step, qps in enumerate(rates):
+            if self.stop_event.is_set():
+                break
+            stats = LoadStats(self.window_s)
+            if qps is None:
+                print(f"\n=== Closed loop: {self.virtual_users} virtual users for {self.duration_s}s ===")
+            else:
+                print(f"\n=== Open loop step {step + 1}/{len(rates)}: {qps} QPS for {self.duration_s}s ===")
+            start = time.perf_counter()
+            if qps is None:
+                self.run_closed_loop(workload, stats)
+            else:
+                self.run_open_loop(workload, stats, qps)
+            elapsed = time.perf_counter() - start
+
+            step_result = {
+                'step': step,
+                'target_qps': qps,
+                'duration_s': round(elapsed, 3),
+                'requests': stats.requests,
+                'throughput_qps': round(stats.requests / elapsed, 2) if elapsed else 0,
+                'errors': stats.errors,
+                'timeouts': stats.timeouts,
+                'dropped': stats.dropped,
+                'error_rate': round(stats.errors / stats.requests, 4) if stats.requests else 0,
+                'timeout_rate': round(stats.timeouts / stats.requests, 4) if stats.requests else 0,
+                'latency_ms': {
+                    'mean': round(stats.latency.mean, 2),
+                    'p50': round(stats.latency.quantile(0.5), 2),
+                    'p90': round(stats.latency.quantile(0.9), 2),
+                    'p99': round(stats.latency.quantile(0.99), 2),
+                    'max': round(stats.latency.max or 0, 2),
+                },
+                'windows': stats.window_rows(),
+            }
+            steps.append(step_result)
+            print(f"Throughput: {step_result['throughput_qps']} QPS, "
+                  f"p50 {step_result['latency_ms']['p50']}ms, p99 {step_result['latency_ms']['p99']}ms, "
+                  f"errors {stats.errors}, timeouts {stats.timeouts}, dropped {stats.dropped}")
+        return steps
+
+    def save_report(self, steps: List[Dict[str, Any]], json_filename: str, windows_filename: str):
+        """JSON report of every step plus a CSV of latency percentiles over time"""
+        report = {
+            'timestamp': datetime.now().isoformat(),
+            'es_url': self.benchmark.es_url,
+            'index_name': self.benchmark.index_name,
+            'config': {
+                'load_mode': self.load_mode,
+                'virtual_users': self.virtual_users,
+                'think_time_ms': self.think_time_ms,
+                'target_qps': self.target_qps,
+                'duration_s': self.duration_s,
+                'window_s': self.window_s,
+                'response_profile': self.benchmark.response_profile,
+                'query_types': list(self.benchmark._build_query_methods()),
+            },
+            'steps': steps,
+        }
+        with open(json_filename, 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=2)
+
+        with open(windows_filename, 'w', newline='', encoding='utf-8') as file:
+            writer = csv.DictWriter(file, fieldnames=WINDOW_FIELDNAMES)
+            writer.writeheader()
+            for step in steps:
+                for window in step['windows']:
+                    row = {'step': step['step'], 'target_qps': step['target_qps']}
+                    row.update(window)
+                    writer.writerow(row)
+
+        print(f"Load test report saved to {json_filename}")
+        print(f"Latency over time saved to {windows_filename}")
+
+
+def main():
+    if len(sys.argv) < 5:
+        print("Usage: python3 load_generator.py <query_file.csv|.jsonl|.parquet> <index_name> <es_url> <output_dir> [config_json]")
+        sys.exit(1)
+
+    query_file = sys.argv[1]
+    index_name = sys.argv[2]
+    es_url = sys.argv[3]
+    output_dir = sys.argv[4]
+
+    config = {}
+    if len(sys.argv) > 5:
+        try:
+            config = json.loads(sys.argv[5])
+        except json.JSONDecodeError as e:
+            print(f"Error parsing configuration JSON: {e}")
+            sys.exit(1)
+
+    print("Elasticsearch Search Load Generator Starting...")
+    print(f"Query File: {query_file}")
+    print(f"Index: {index_name}")
+    print(f"ES URL: {es_url}")
+    print(f"Configuration: {config}")
+    print("=" * 50)
+
+    os.makedirs(output_dir, exist_ok=True)
+
+    # Size the connection pool for the offered load; a load test must not retry
+    concurrency = config.get('virtual_users', 4) if config.get('load_mode', 'closed') == 'closed' \
+        else config.get('max_outstanding', 256)
+    benchmark_config = dict(config)
+    if not benchmark_config.get('http_pool_size'):
+        benchmark_config['http_pool_size'] = concurrency
+    benchmark = ElasticsearchQueryBenchmark(es_url, index_name, benchmark_config)
+    benchmark.max_retries = 1
+
+    response, _ = benchmark._make_request('GET', '')
+    if "error" in response:
+        print(f"Failed to connect to Elasticsearch: {response['error']}")
+        sys.exit(1)
+    print(f"Connected to Elasticsearch: {response.get('tagline', 'Unknown version')}")
+
+    generator = SearchLoadGenerator(benchmark, config)
+    # Stop cleanly at the SLURM time limit and still write what was measured
+    signal.signal(signal.SIGTERM, lambda signum, frame: generator.stop_event.set())
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    job_id = os.environ.get('SLURM_JOB_ID', 'local')
+    json_filename = os.path.join(output_dir, f"load_test_{job_id}_{timestamp}.json")
+    windows_filename = os.path.join(output_dir, f"load_test_windows_{job_id}_{timestamp}.csv")
+
+    try:
+        steps = generator.run(query_file)
+        generator.save_report(steps, json_filename, windows_filename)
+    finally:
+        benchmark.close()
+
+
+if __name__ == "__main__":
+    main()
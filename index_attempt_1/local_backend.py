@@ -0,0 +1,592 @@
+#!/usr/bin/env python3
+"""
+In-process search backend
+A stand-in for Elasticsearch behind ElasticsearchQueryBenchmark: an inverted index over a
+Parquet sample (e.g. fineweb_sample.parquet) that answers the subset of the REST API and
+query DSL the pipeline sends - match (or/and, minimum_should_match, fuzziness),
+match_phrase with slop, term, wildcard, fuzzy, multi_match and bool - with BM25 scoring,
+highlighting, _source filtering and track_total_hits. No JVM, deterministic results.
+
+Select it with es_url 'local:<parquet file or directory>[?max_docs=N]', or
+'local:<index directory>' for a prebuilt memory-mapped index (mmap_index.py).
+'text' and 'text.exact' share one lowercased \\w+ token stream (the standard analyzer
+without its Unicode segmentation rules). Scores use BM25 (k1=1.2, b=0.75) like ES but are
+not byte-identical: ES quantizes norms to one byte, sloppy phrase frequency and fuzzy term
+blending are approximated.
+"""
+
+import bisect
+import hashlib
+import heapq
+import math
+import os
+import re
+import time
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Set, Tuple, Union
+from urllib.parse import parse_qs
+
+import requests
+
+from es_transport import dumps, loads
+
+TOKEN_PATTERN = re.compile(r'\w+')
+K1 = 1.2
+B = 0.75
+DEFAULT_TRACK_TOTAL_HITS = 10000  # ES counts hits exactly up to this many by default
+MAX_FUZZY_EDITS = 2
+STORED_COLUMNS = ('id', 'url', 'text', 'date', 'language')
+_TO_JSON_TAG = re.compile(r'\{\{#toJson\}\}(\w+)\{\{/toJson\}\}')
+
+Scores = Dict[int, float]
+
+
+def analyze(text: str) -> List[str]:
+    """Lowercased word tokens; a token's position is its index in the list"""
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def fuzzy_terms(sorted_terms: List[str], term: str, max_edits: int) -> List[Tuple[str, int]]:
+    """
+    Terms within max_edits (optimal string alignment distance: ES fuzzy counts transpositions)
+    of term. Walks the sorted term list like a trie: DP rows are reused across a shared
+    prefix, and once a prefix is beyond max_edits every term starting with it is skipped.
+    """
+    matches = []
+    rows = [list(range(len(term) + 1))]  # rows[k]: distances after the first k characters
+    previous = ''
+    i = 0
+    while i < len(sorted_terms):
+        candidate = sorted_terms[i]
+        common = 0
+        limit = min(len(previous), len(candidate), len(rows) - 1)
+        while common < limit and previous[common] == candidate[common]:
+            common += 1
+        del rows[common + 1:]
+
+        pruned = None
+        for k in range(common, len(candidate)):
+            c = candidate[k]
+            above = rows[-1]
+            row = [above[0] + 1]
+            for j in range(1, len(term) + 1):
+                value = min(above[j] + 1, row[j - 1] + 1, above[j - 1] + (term[j - 1] != c))
+                if k and j > 1 and c == term[j - 2] and candidate[k - 1] == term[j - 1]:
+                    value = min(value, rows[-2][j - 2] + 1)
+                row.append(value)
+            rows.append(row)
+            if min(row) > max_edits:
+                pruned = k + 1
+                break
+        previous = candidate
+
+        if pruned is not None:
+            i = bisect.bisect_left(sorted_terms, candidate[:pruned] + '\U0010ffff', i + 1)
+            continue
+        if rows[-1][-1] <= max_edits:
+            matches.append((candidate, rows[-1][-1]))
+        i += 1
+    return matches
+
+
+def auto_fuzziness(term: str, fuzziness: Union[str, int, None]) -> int:
+    """Edits allowed for a term: AUTO is 0 below 3 characters, 1 below 6, else 2"""
+    if fuzziness is None:
+        return 0
+    if str(fuzziness).upper().startswith('AUTO'):
+        return 0 if len(term) < 3 else 1 if len(term) < 6 else 2
+    return min(int(fuzziness), MAX_FUZZY_EDITS)
+
+
+def minimum_should_match(spec: Union[str, int, None], clauses: int) -> Union[int, None]:
+    """Resolve an ES minimum_should_match (3, -1, '75%', '-25%') against a clause count"""
+    if spec is None:
+        return None
+    spec = str(spec).strip()
+    if spec.endswith('%'):
+        value = int(float(spec[:-1]) * clauses / 100)  # ES rounds toward zero
+    else:
+        value = int(spec)
+    if value < 0:
+        value += clauses
+    return max(0, min(value, clauses))
+
+
+class LocalIndex:
+    """
+    In-memory inverted index with positions. The searcher only uses the methods below
+    (num_docs ... source), so another storage can serve the same queries (MmapIndex).
+    """
+
+    def __init__(self):
+        self.postings: Dict[str, Dict[int, List[int]]] = {}
+        self.doc_lens: List[int] = []
+        self.sources: List[Dict[str, Any]] = []
+        self.doc_ids: List[str] = []
+        self.total_len = 0
+        self.fingerprint = 'empty'
+        self._sorted_terms = None
+
+    @classmethod
+    def from_parquet(cls, path: str, text_column: str = 'text', max_docs: int = None) -> 'LocalIndex':
+        """Index the text column of a Parquet file or of every Parquet file under a directory"""
+        import pyarrow.parquet as pq
+        from parquet_files import list_parquet_files
+
+        files = list_parquet_files(path) if os.path.isdir(path) else [path]
+        if not files:
+            raise ValueError(f"No parquet files found in {path}")
+        index = cls()
+        digest = hashlib.sha1()
+        for file_path in files:
+            stat = os.stat(file_path)
+            digest.update(f"{os.path.abspath(file_path)}:{stat.st_size}:{stat.st_mtime_ns}".encode('utf-8'))
+            parquet_file = pq.ParquetFile(file_path)
+            columns = [c for c in parquet_file.schema_arrow.names if c in STORED_COLUMNS or c == text_column]
+            for batch in parquet_file.iter_batches(batch_size=10000, columns=columns):
+                for row in batch.to_pylist():
+                    if max_docs is not None and len(index.doc_lens) >= max_docs:
+                        break
+                    index.add(row.get(text_column) or '', row)
+        digest.update(f"{max_docs}:{len(index.doc_lens)}".encode('utf-8'))
+        index.fingerprint = digest.hexdigest()[:20]
+        return index
+
+    def add(self, text: str, source: Dict[str, Any]) -> int:
+        doc = len(self.doc_lens)
+        tokens = analyze(text)
+        for position, term in enumerate(tokens):
+            self.postings.setdefault(term, {}).setdefault(doc, []).append(position)
+        self.doc_lens.append(len(tokens))
+        self.total_len += len(tokens)
+        self.sources.append(source)
+        self.doc_ids.append(str(source.get('id') or doc))
+        return doc
+
+    # Storage interface used by LocalSearcher
+    @property
+    def num_docs(self) -> int:
+        return len(self.doc_lens)
+
+    @property
+    def num_terms(self) -> int:
+        return len(self.postings)
+
+    @property
+    def avg_doc_len(self) -> float:
+        return self.total_len / len(self.doc_lens) if self.doc_lens else 0.0
+
+    def doc_len(self, doc: int) -> int:
+        return self.doc_lens[doc]
+
+    def doc_freq(self, term: str) -> int:
+        return len(self.postings.get(term, ()))
+
+    def term_postings(self, term: str) -> Dict[int, List[int]]:
+        """doc -> sorted positions of term"""
+        return self.postings.get(term, {})
+
+    def term_freqs(self, term: str) -> Dict[int, int]:
+        """doc -> frequency of term, for scoring without positions"""
+        return {doc: len(positions) for doc, positions in self.postings.get(term, {}).items()}
+
+    def terms(self) -> Iterable[str]:
+        return self.postings.keys()
+
+    def sorted_terms(self) -> List[str]:
+        if self._sorted_terms is None or len(self._sorted_terms) != len(self.postings):
+            self._sorted_terms = sorted(self.postings)
+        return self._sorted_terms
+
+    def doc_id(self, doc: int) -> str:
+        return self.doc_ids[doc]
+
+    def source(self, doc: int) -> Dict[str, Any]:
+        return self.sources[doc]
+
+
+class LocalSearcher:
+    """Evaluates ES query DSL bodies against a LocalIndex and builds ES-shaped responses"""
+
+    def __init__(self, index: LocalIndex):
+        self.index = index
+        self.expand = lru_cache(maxsize=100000)(self._expand)
+
+    # Scoring
+    def _bm25(self, tf: float, doc: int, idf: float) -> float:
+        norm = K1 * (1 - B + B * self.index.doc_len(doc) / (self.index.avg_doc_len or 1))
+        return idf * tf * (K1 + 1) / (tf + norm)
+
+    def _idf(self, doc_freq: int) -> float:
+        return math.log(1 + (self.index.num_docs - doc_freq + 0.5) / (doc_freq + 0.5))
+
+    def _term_scores(self, term: str, boost: float = 1.0, doc_freq: int = None) -> Scores:
+        freqs = self.index.term_freqs(term)
+        idf = self._idf(doc_freq if doc_freq is not None else len(freqs)) * boost
+        return {doc: self._bm25(tf, doc, idf) for doc, tf in freqs.items()}
+
+    def _expand(self, term: str, edits: int, max_expansions: int) -> Tuple[Tuple[str, int], ...]:
+        """Index terms within `edits` of term, closest and most frequent first"""
+        if edits == 0:
+            return ((term, 0),) if self.index.doc_freq(term) else ()
+        candidates = [(distance, -self.index.doc_freq(candidate), candidate)
+                      for candidate, distance in fuzzy_terms(self.index.sorted_terms(), term, edits)]
+        return tuple((candidate, distance) for distance, _, candidate in sorted(candidates)[:max_expansions])
+
+    def _fuzzy_scores(self, term: str, edits: int, max_expansions: int = 50) -> Scores:
+        """Blended like Lucene's fuzzy rewrite: shared (max) doc freq, closer terms boosted"""
+        expansions = self.expand(term, edits, max_expansions)
+        if not expansions:
+            return {}
+        blended_df = max(self.index.doc_freq(candidate) for candidate, _ in expansions)
+        scores: Scores = {}
+        for candidate, distance in expansions:
+            boost = 1.0 - distance / max(min(len(term), len(candidate)), 1)
+            for doc, score in self._term_scores(candidate, max(boost, 0.1), blended_df).items():
+                scores[doc] = scores.get(doc, 0.0) + score
+        return scores
+
+    # Queries, each returns (doc -> score, matched terms for highlighting)
+    def _match(self, spec: Union[dict, str], fuzziness_default=None) -> Tuple[Scores, Set[str]]:
+        if not isinstance(spec, dict):
+            spec = {'query': spec}
+        terms = list(dict.fromkeys(analyze(str(spec.get('query', '')))))
+        if not terms:
+            return {}, set()
+        fuzziness = spec.get('fuzziness', fuzziness_default)
+        max_expansions = spec.get('max_expansions', 50)
+        matched_terms = set()
+        per_term = []
+        for term in terms:
+            edits = auto_fuzziness(term, fuzziness)
+            if edits:
+                scores = self._fuzzy_scores(term, edits, max_expansions)
+                matched_terms.update(candidate for candidate, _ in self.expand(term, edits, max_expansions))
+            else:
+                scores = self._term_scores(term)
+                matched_terms.add(term)
+            per_term.append(scores)
+
+        if str(spec.get('operator', 'or')).lower() == 'and':
+            required = len(terms)
+        else:
+            required = max(1, minimum_should_match(spec.get('minimum_should_match'), len(terms)) or 1)
+        return self._combine(per_term, required), matched_terms
+
+    @staticmethod
+    def _combine(clauses: List[Scores], required: int) -> Scores:
+        """Docs matching at least `required` clauses, scored by the sum of their clause scores"""
+        counts: Dict[int, int] = {}
+        totals: Scores = {}
+        for scores in clauses:
+            for doc, score in scores.items():
+                counts[doc] = counts.get(doc, 0) + 1
+                totals[doc] = totals.get(doc, 0.0) + score
+        return {doc: score for doc, score in totals.items() if counts[doc] >= required}
+
+    @staticmethod
+    def _phrase_freq(positions: List[List[int]], slop: int) -> float:
+        """
+        Phrase occurrences anchored on the first term; with slop each later term takes its
+        nearest position and an occurrence counts 1 / (1 + total displacement) if that is <= slop
+        """
+        if slop == 0:
+            later = [set(p) for p in positions[1:]]
+            return float(sum(1 for p in positions[0] if all(p + i in s for i, s in enumerate(later, start=1))))
+        freq = 0.0
+        for anchor in positions[0]:
+            displacement = 0
+            for i, term_positions in enumerate(positions[1:], start=1):
+                target = anchor + i
+                k = bisect.bisect_left(term_positions, target)
+                nearest = min((abs(term_positions[j] - target) for j in (k - 1, k) if 0 <= j < len(term_positions)))
+                displacement += nearest
+                if displacement > slop:
+                    break
+            else:
+                freq += 1.0 / (1 + displacement)
+        return freq
+
+    def _match_phrase(self, spec: Union[dict, str]) -> Tuple[Scores, Set[str]]:
+        if not isinstance(spec, dict):
+            spec = {'query': spec}
+        terms = analyze(str(spec.get('query', '')))
+        if not terms:
+            return {}, set()
+        if len(terms) == 1:
+            return self._term_scores(terms[0]), set(terms)
+        postings = [self.index.term_postings(term) for term in terms]
+        if any(not p for p in postings):
+            return {}, set()
+        candidates = set.intersection(*(set(p) for p in sorted(postings, key=len)))
+        idf = sum(self._idf(len(p)) for p in {term: p for term, p in zip(terms, postings)}.values())
+        slop = int(spec.get('slop', 0))
+        scores = {}
+        for doc in candidates:
+            freq = self._phrase_freq([p[doc] for p in postings], slop)
+            if freq > 0:
+                scores[doc] = self._bm25(freq, doc, idf)
+        return scores, set(terms)
+
+    def _term(self, value: Any) -> Tuple[Scores, Set[str]]:
+        term = str(value.get('value') if isinstance(value, dict) else value)
+        return self._term_scores(term), {term}
+
+    def _wildcard(self, value: Any) -> Tuple[Scores, Set[str]]:
+        pattern = str(value.get('value') if isinstance(value, dict) else value)
+        regex = re.compile(''.join('.*' if c == '*' else '.' if c == '?' else re.escape(c) for c in pattern) + r'\Z')
+        matched_terms = {term for term in self.index.terms() if regex.match(term)}
+        # Multi-term queries are constant score in ES
+        return {doc: 1.0 for term in matched_terms for doc in self.index.term_postings(term)}, matched_terms
+
+    def _fuzzy(self, value: Any) -> Tuple[Scores, Set[str]]:
+        spec = value if isinstance(value, dict) else {'value': value}
+        term = str(spec['value'])
+        edits = auto_fuzziness(term, spec.get('fuzziness', 'AUTO'))
+        max_expansions = spec.get('max_expansions', 50)
+        return (self._fuzzy_scores(term, edits, max_expansions),
+                {candidate for candidate, _ in self.expand(term, edits, max_expansions)})
+
+    def _bool(self, spec: dict) -> Tuple[Scores, Set[str]]:
+        def clauses(key):
+            value = spec.get(key) or []
+            return value if isinstance(value, list) else [value]
+
+        matched_terms: Set[str] = set()
+        result = None
+        for clause, scoring in [(c, True) for c in clauses('must')] + [(c, False) for c in clauses('filter')]:
+            scores, terms = self.evaluate(clause)
+            matched_terms |= terms
+            if result is None:
+                result = {doc: score if scoring else 0.0 for doc, score in scores.items()}
+            else:
+                result = {doc: total + (scores[doc] if scoring else 0.0)
+                          for doc, total in result.items() if doc in scores}
+
+        should = []
+        for clause in clauses('should'):
+            scores, terms = self.evaluate(clause)
+            matched_terms |= terms
+            should.append(scores)
+        if should:
+            required = minimum_should_match(spec.get('minimum_should_match'), len(should))
+            if required is None:
+                required = 0 if result is not None else 1
+            combined = self._combine(should, required) if required else None
+            if result is None:
+                result = combined
+            elif combined is not None:
+                result = {doc: total + combined[doc] for doc, total in result.items() if doc in combined}
+            else:
+                # Optional clauses only add to the score of required matches
+                for scores in should:
+                    for doc in result:
+                        result[doc] += scores.get(doc, 0.0)
+        if result is None:
+            result = {doc: 1.0 for doc in range(self.index.num_docs)}
+
+        for clause in clauses('must_not'):
+            excluded, _ = self.evaluate(clause)
+            result = {doc: score for doc, score in result.items() if doc not in excluded}
+        return result, matched_terms
+
+    def evaluate(self, query: dict) -> Tuple[Scores, Set[str]]:
+        """Scores of one query DSL node"""
+        (kind, spec), = query.items()
+        if kind == 'match_all':
+            return {doc: 1.0 for doc in range(self.index.num_docs)}, set()
+        if kind == 'bool':
+            return self._bool(spec)
+        if kind == 'multi_match':
+            return self._match(spec)
+        # Field queries: {"<kind>": {"text" | "text.exact": spec}}
+        (_, value), = spec.items()
+        if kind == 'match':
+            return self._match(value)
+        if kind == 'match_phrase':
+            return self._match_phrase(value)
+        if kind == 'term':
+            return self._term(value)
+        if kind == 'wildcard':
+            return self._wildcard(value)
+        if kind == 'fuzzy':
+            return self._fuzzy(value)
+        raise ValueError(f"query type '{kind}' is not supported by the local backend")
+
+    # Response
+    def _highlight(self, doc: int, terms: Set[str], fragment_size: int, number_of_fragments: int,
+                   pre_tag: str, post_tag: str) -> List[str]:
+        text = self.index.source(doc).get('text') or ''
+        matches = [m for m in TOKEN_PATTERN.finditer(text) if m.group().lower() in terms]
+        fragments = []
+        covered_until = -1
+        for match in matches:
+            if len(fragments) >= number_of_fragments:
+                break
+            if match.start() < covered_until:
+                continue
+            start = max(0, match.start() - fragment_size // 4)
+            end = min(len(text), start + fragment_size)
+            pieces, last = [], start
+            for inner in matches:
+                if inner.start() >= start and inner.end() <= end:
+                    pieces.append(text[last:inner.start()] + pre_tag + inner.group() + post_tag)
+                    last = inner.end()
+            pieces.append(text[last:end])
+            fragments.append(''.join(pieces))
+            covered_until = end
+        return fragments
+
+    def _source(self, doc: int, source_filter: Any) -> Union[dict, None]:
+        if source_filter is False:
+            return None
+        source = self.index.source(doc)
+        if isinstance(source_filter, list):
+            return {key: source[key] for key in source_filter if key in source}
+        return dict(source)
+
+    def search(self, body: dict, index_name: str) -> dict:
+        start = time.perf_counter()
+        scores, matched_terms = self.evaluate(body.get('query') or {'match_all': {}})
+        size = body.get('size', 10)
+        top = heapq.nlargest(size, scores.items(), key=lambda item: (item[1], -item[0])) if size else []
+
+        highlight = body.get('highlight', {})
+        text_highlight = highlight.get('fields', {}).get('text')
+        hits = []
+        for doc, score in top:
+            hit = {'_index': index_name, '_id': self.index.doc_id(doc), '_score': score}
+            source = self._source(doc, body.get('_source', True))
+            if source is not None:
+                hit['_source'] = source
+            if text_highlight is not None:
+                fragments = self._highlight(doc, matched_terms, text_highlight.get('fragment_size', 100),
+                                            text_highlight.get('number_of_fragments', 5),
+                                            text_highlight.get('pre_tags', ['<em>'])[0],
+                                            text_highlight.get('post_tags', ['</em>'])[0])
+                if fragments:
+                    hit['highlight'] = {'text': fragments}
+            hits.append(hit)
+
+        result_hits = {'max_score': top[0][1] if top else None, 'hits': hits}
+        track_total_hits = body.get('track_total_hits', DEFAULT_TRACK_TOTAL_HITS)
+        if track_total_hits is not False:
+            limit = len(scores) if track_total_hits is True else int(track_total_hits)
+            result_hits['total'] = {'value': min(len(scores), limit),
+                                    'relation': 'eq' if len(scores) <= limit else 'gte'}
+        return {
+            'took': int((time.perf_counter() - start) * 1000),
+            'timed_out': False,
+            '_shards': {'total': 1, 'successful': 1, 'skipped': 0, 'failed': 0},
+            'hits': result_hits
+        }
+
+
+class LocalResponse:
+    """The part of requests.Response that callers of the transport use"""
+
+    def __init__(self, status_code: int):
+        self.status_code = status_code
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status_code} Error: local backend", response=self)
+
+
+class LocalTransport:
+    """Drop-in for ESTransport that serves requests from a LocalSearcher in-process"""
+
+    def __init__(self, index: LocalIndex, name: str = 'local'):
+        self.es_url = f"local:{name}"
+        self.index = index
+        self.searcher = LocalSearcher(index)
+        self.scripts: Dict[str, str] = {}
+
+    @classmethod
+    def open(cls, location: str) -> 'LocalTransport':
+        """location: '<mmap index directory>' or '<parquet file or directory>[?max_docs=N]'"""
+        from mmap_index import MmapIndex, is_index_dir
+
+        path, _, query_string = location.partition('?')
+        start = time.perf_counter()
+        if is_index_dir(path):
+            index = MmapIndex(path)
+            print(f"Local backend: mapped {index.num_docs} documents, {index.num_terms} terms from {path}")
+            return cls(index, path)
+        options = {key: values[-1] for key, values in parse_qs(query_string).items()}
+        max_docs = int(options['max_docs']) if 'max_docs' in options else None
+        index = LocalIndex.from_parquet(path, max_docs=max_docs)
+        print(f"Local backend: indexed {index.num_docs} documents, {index.num_terms} terms from {path} "
+              f"in {time.perf_counter() - start:.1f}s")
+        return cls(index, path)
+
+    def encode(self, data: Any) -> bytes:
+        if data is None or isinstance(data, bytes):
+            return data
+        return dumps(data)
+
+    def _render(self, call: dict) -> dict:
+        """Render a stored mustache template the way my_search registers them (toJson slots)"""
+        source = self.scripts[call['id']]
+        return loads(_TO_JSON_TAG.sub(lambda m: dumps(call['params'][m.group(1)]).decode('utf-8'), source))
+
+    def _search_one(self, body: dict, index_name: str, template: bool) -> dict:
+        return self.searcher.search(self._render(body) if template else body, index_name)
+
+    def _dispatch(self, method: str, parts: List[str], options: Dict[str, str], body: bytes) -> Tuple[int, Any]:
+        if not parts:
+            return 200, {'name': 'local', 'cluster_name': 'local', 'version': {'number': 'local'},
+                         'tagline': 'You Know, for Search'}
+        if parts[0] == '_cluster' and parts[1:2] == ['health']:
+            return 200, {'cluster_name': 'local', 'status': 'green', 'timed_out': False,
+                         'number_of_nodes': 1, 'active_shards_percent_as_number': 100.0}
+        if parts[0] == '_scripts' and len(parts) == 2 and method in ('PUT', 'POST'):
+            self.scripts[parts[1]] = loads(body)['script']['source']
+            return 200, {'acknowledged': True}
+
+        index_name, api = parts[0], parts[1:]
+        if api in (['_search'], ['_search', 'template']):
+            return 200, self._search_one(loads(body) if body else {}, index_name, api[-1] == 'template')
+        if api in (['_msearch'], ['_msearch', 'template']):
+            lines = [line for line in body.split(b'\n') if line.strip()]
+            responses = []
+            for line in lines[1::2]:
+                try:
+                    responses.append(self._search_one(loads(line), index_name, api[-1] == 'template'))
+                except (ValueError, KeyError) as e:
+                    responses.append({'error': {'type': 'local_backend_exception', 'reason': str(e)},
+                                      'status': 400})
+            return 200, {'took': 0, 'responses': responses}
+        if api == ['_count']:
+            return 200, {'count': self.index.num_docs}
+        if api[:1] == ['_settings']:
+            settings = {'index.uuid': self.index.fingerprint, 'index.number_of_shards': '1',
+                        'index.number_of_replicas': '0', 'index.provided_name': index_name}
+            if options.get('flat_settings') != 'true':
+                settings = {'index': {key.split('.', 1)[1]: value for key, value in settings.items()}}
+            return 200, {index_name: {'settings': settings}}
+        if not api and method in ('GET', 'HEAD'):
+            return 200, {index_name: {'settings': {'index': {'uuid': self.index.fingerprint}}}}
+        return 404, {'error': {'type': 'resource_not_found_exception',
+                               'reason': f"{method} /{'/'.join(parts)} is not supported by the local backend"},
+                     'status': 404}
+
+    def request(self, method: str, endpoint: str, body: Union[dict, bytes, None] = None,
+                headers: Dict[str, str] = None,
+                timeout: float = None) -> Tuple[LocalResponse, Any, Dict[str, float]]:
+        """Same contract as ESTransport.request; the whole request is 'server' time"""
+        start = time.perf_counter()
+        path, _, query_string = endpoint.partition('?')
+        options = {key: values[-1] for key, values in parse_qs(query_string).items()}
+        try:
+            status, decoded = self._dispatch(method.upper(), [p for p in path.split('/') if p], options,
+                                             self.encode(body))
+        except (ValueError, KeyError) as e:
+            status, decoded = 400, {'error': {'type': 'local_backend_exception', 'reason': str(e)}, 'status': 400}
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        timings = {'connect_ms': 0.0, 'send_ms': 0.0, 'server_ms': round(elapsed_ms, 3), 'parse_ms': 0.0,
+                   'total_ms': elapsed_ms}
+        return LocalResponse(status), decoded, timings
+
+    def close(self):
+        pass
@@ -0,0 +1,400 @@
+#!/usr/bin/env python3
+"""
+Compact on-disk inverted index for the local search backend
+Built once from FineWeb Parquet text, then opened with mmap: every search process on a
+node reads the same page cache pages with zero-copy slices, and only the postings a query
+touches are paged in and decoded. Serves the LocalIndex storage interface, so
+local_backend.py runs the same queries against it ('local:<index directory>').
+
+Index directory:
+  meta.json                       format, document/term counts, total length, fingerprint
+  terms.dat, term_offsets.npy     sorted UTF-8 term dictionary (binary searched)
+  doc_freqs.npy                   documents per term
+  postings.dat, postings_offsets.npy
+                                  per term and document: varint(doc delta), varint(freq),
+                                  varint(byte length of its positions)
+  positions.dat, positions_offsets.npy
+                                  per term and document: varint(position delta)
+  norms.npy                       document lengths in tokens, for BM25
+  docs.dat, doc_offsets.npy       stored fields (id, url, text, date, language) as JSON
+
+The build is chunked like SPIMI: each chunk of documents is inverted in memory and spilled
+as a sorted run, and the runs are merged term by term, so memory is bounded by chunk_docs.
+"""
+
+import argparse
+import bisect
+import hashlib
+import heapq
+import itertools
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import time
+from array import array
+from collections.abc import Mapping, Sequence
+from functools import lru_cache
+from operator import itemgetter
+from typing import Any, Dict, Iterator, List, Tuple
+
+import numpy as np
+
+from es_transport import dumps, loads
+from local_backend import STORED_COLUMNS, analyze
+
+FORMAT = 'mmap-inverted-index-v1'
+META_FILE = 'meta.json'
+DEFAULT_CHUNK_DOCS = 50000
+
+
+def encode_varints(values, out: bytearray) -> int:
+    """Append LEB128 varints of non-negative ints to out; returns the bytes written"""
+    start = len(out)
+    for value in values:
+        while value >= 0x80:
+            out.append((value & 0x7F) | 0x80)
+            value >>= 7
+        out.append(value)
+    return len(out) - start
+
+
+def decode_varints(buffer: np.ndarray) -> np.ndarray:
+    """All varints of a uint8 buffer at once (vectorized: no Python loop per value)"""
+    if not len(buffer):
+        return np.zeros(0, dtype=np.int64)
+    ends = np.flatnonzero(buffer < 0x80)
+    starts = np.empty_like(ends)
+    starts[0] = 0
+    starts[1:] = ends[:-1] + 1
+    shifts = 7 * (np.arange(len(buffer)) - np.repeat(starts, ends - starts + 1))
+    payload = (buffer & 0x7F).astype(np.uint64) << shifts.astype(np.uint64)
+    return np.add.reduceat(payload, starts).astype(np.int64)
+
+
+def decode_positions(data) -> List[int]:
+    """Delta-coded varint positions of one document; a plain loop beats numpy call overhead here"""
+    positions = []
+    position = value = shift = 0
+    for byte in data:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        position += value
+        positions.append(position)
+        value = shift = 0
+    return positions
+
+
+def _varint_length(data: bytes) -> int:
+    length = 0
+    while data[length] & 0x80:
+        length += 1
+    return length + 1
+
+
+def is_index_dir(path: str) -> bool:
+    return os.path.isfile(os.path.join(path, META_FILE))
+
+
+# Build
+def _iter_documents(files: List[str], text_column: str, digest) -> Iterator[Dict[str, Any]]:
+    import pyarrow.parquet as pq
+
+    for file_path in files:
+        stat = os.stat(file_path)
+        digest.update(f"{os.path.abspath(file_path)}:{stat.st_size}:{stat.st_mtime_ns}".encode('utf-8'))
+        parquet_file = pq.ParquetFile(file_path)
+        columns = [c for c in parquet_file.schema_arrow.names if c in STORED_COLUMNS or c == text_column]
+        for batch in parquet_file.iter_batches(batch_size=10000, columns=columns):
+            yield from batch.to_pylist()
+
+
+def _write_run(chunk: Dict[str, Dict[int, List[int]]], path: str):
+    """Spill one chunk as (term, first doc, last doc, doc freq, postings bytes, positions bytes) in term order"""
+    with open(path, 'wb') as file:
+        for term in sorted(chunk):
+            docs = chunk[term]
+            postings, positions = bytearray(), bytearray()
+            previous_doc = 0  # The first delta is the absolute doc, rebased when runs are merged
+            for doc, doc_positions in docs.items():
+                length = encode_varints((p - q for p, q in zip(doc_positions, [0] + doc_positions[:-1])),
+                                        positions)
+                encode_varints((doc - previous_doc, len(doc_positions), length), postings)
+                previous_doc = doc
+            pickle.dump((term, next(iter(docs)), previous_doc, len(docs), bytes(postings), bytes(positions)),
+                        file, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _read_run(path: str) -> Iterator[Tuple]:
+    with open(path, 'rb') as file:
+        while True:
+            try:
+                yield pickle.load(file)
+            except EOFError:
+                return
+
+
+def _save(index_dir: str, name: str, values, dtype):
+    np.save(os.path.join(index_dir, name), np.asarray(values, dtype=dtype))
+
+
+def build_mmap_index(path: str, index_dir: str, text_column: str = 'text', max_docs: int = None,
+                     chunk_docs: int = DEFAULT_CHUNK_DOCS) -> Dict[str, Any]:
+    """Index the text column of a Parquet file or directory into index_dir; returns the metadata"""
+    from parquet_files import list_parquet_files
+
+    files = list_parquet_files(path) if os.path.isdir(path) else [path]
+    if not files:
+        raise ValueError(f"No parquet files found in {path}")
+    os.makedirs(index_dir, exist_ok=True)
+    run_dir = tempfile.mkdtemp(prefix='runs_', dir=index_dir)
+    start = time.perf_counter()
+    try:
+        digest = hashlib.sha1()
+        norms = array('I')
+        doc_offsets = array('Q', [0])
+        runs = []
+        chunk: Dict[str, Dict[int, List[int]]] = {}
+        with open(os.path.join(index_dir, 'docs.dat'), 'wb') as docs_file:
+            for row in itertools.islice(_iter_documents(files, text_column, digest), max_docs):
+                doc = len(norms)
+                tokens = analyze(row.get(text_column) or '')
+                for position, term in enumerate(tokens):
+                    chunk.setdefault(term, {}).setdefault(doc, []).append(position)
+                norms.append(len(tokens))
+                encoded = dumps(row)
+                docs_file.write(encoded)
+                doc_offsets.append(doc_offsets[-1] + len(encoded))
+                if len(norms) % chunk_docs == 0:
+                    runs.append(os.path.join(run_dir, f"run_{len(runs):05d}.pkl"))
+                    _write_run(chunk, runs[-1])
+                    chunk = {}
+                    print(f"Inverted {len(norms)} documents ({time.perf_counter() - start:.1f}s)")
+        if chunk:
+            runs.append(os.path.join(run_dir, f"run_{len(runs):05d}.pkl"))
+            _write_run(chunk, runs[-1])
+            chunk = {}
+
+        # Runs hold increasing doc ranges, and heapq.merge keeps run order for equal terms
+        term_offsets, postings_offsets, positions_offsets = array('Q', [0]), array('Q', [0]), array('Q', [0])
+        doc_freqs = array('I')
+        with open(os.path.join(index_dir, 'terms.dat'), 'wb') as terms_file, \
+                open(os.path.join(index_dir, 'postings.dat'), 'wb') as postings_file, \
+                open(os.path.join(index_dir, 'positions.dat'), 'wb') as positions_file:
+            merged = heapq.merge(*(_read_run(run) for run in runs), key=itemgetter(0))
+            for term, entries in itertools.groupby(merged, key=itemgetter(0)):
+                doc_freq, postings_size, positions_size = 0, 0, 0
+                previous_last = None
+                for _, first_doc, last_doc, run_doc_freq, postings, positions in entries:
+                    if previous_last is not None:
+                        rebased = bytearray()
+                        encode_varints((first_doc - previous_last,), rebased)
+                        postings = bytes(rebased) + postings[_varint_length(postings):]
+                    postings_file.write(postings)
+                    positions_file.write(positions)
+                    doc_freq += run_doc_freq
+                    postings_size += len(postings)
+                    positions_size += len(positions)
+                    previous_last = last_doc
+                encoded_term = term.encode('utf-8')
+                terms_file.write(encoded_term)
+                term_offsets.append(term_offsets[-1] + len(encoded_term))
+                postings_offsets.append(postings_offsets[-1] + postings_size)
+                positions_offsets.append(positions_offsets[-1] + positions_size)
+                doc_freqs.append(doc_freq)
+    finally:
+        shutil.rmtree(run_dir, ignore_errors=True)
+
+    _save(index_dir, 'term_offsets.npy', term_offsets, np.uint64)
+    _save(index_dir, 'doc_freqs.npy', doc_freqs, np.uint32)
+    _save(index_dir, 'postings_offsets.npy', postings_offsets, np.uint64)
+    _save(index_dir, 'positions_offsets.npy', positions_offsets, np.uint64)
+    _save(index_dir, 'norms.npy', norms, np.uint32)
+    _save(index_dir, 'doc_offsets.npy', doc_offsets, np.uint64)
+    digest.update(f"{max_docs}:{len(norms)}".encode('utf-8'))
+    meta = {
+        'format': FORMAT,
+        'source': os.path.abspath(path),
+        'text_column': text_column,
+        'num_docs': len(norms),
+        'num_terms': len(doc_freqs),
+        'total_len': int(sum(norms)),
+        'fingerprint': digest.hexdigest()[:20],
+        'build_time_s': round(time.perf_counter() - start, 2),
+    }
+    # Written last: a directory without meta.json is an unfinished build
+    with open(os.path.join(index_dir, META_FILE), 'w', encoding='utf-8') as file:
+        json.dump(meta, file, indent=2)
+    return meta
+
+
+# Read
+def _map_bytes(path: str) -> np.ndarray:
+    # np.memmap refuses empty files
+    return np.memmap(path, dtype=np.uint8, mode='r') if os.path.getsize(path) else np.zeros(0, dtype=np.uint8)
+
+
+class TermList(Sequence):
+    """Sorted term dictionary read in place; bisect and fuzzy_terms use it like a list"""
+
+    def __init__(self, data: np.ndarray, offsets: np.ndarray):
+        # Memoryviews of the same mapping: still zero-copy, but indexing them is ~10x
+        # cheaper than numpy scalar access, which matters in the fuzzy term walk
+        self.data = memoryview(data)
+        self.offsets = memoryview(offsets)
+        self.size = len(offsets) - 1
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __getitem__(self, i: int) -> str:
+        if not 0 <= i < self.size:
+            raise IndexError(i)
+        return str(self.data[self.offsets[i]:self.offsets[i + 1]], 'utf-8')
+
+    def __iter__(self) -> Iterator[str]:
+        data = self.data
+        offsets = self.offsets.tolist()
+        for start, end in zip(offsets, offsets[1:]):
+            yield str(data[start:end], 'utf-8')
+
+
+class Postings(Mapping):
+    """doc -> positions of one term; positions are decoded only for the docs looked up"""
+
+    def __init__(self, docs: List[int], position_ends: List[int], positions_data: memoryview):
+        self.docs = docs
+        self.position_ends = position_ends  # position_ends[i] is where doc i + 1 starts
+        self.positions_data = positions_data
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.docs)
+
+    def _find(self, doc) -> int:
+        i = bisect.bisect_left(self.docs, doc)
+        return i if i < len(self.docs) and self.docs[i] == doc else -1
+
+    def __contains__(self, doc) -> bool:
+        return self._find(doc) >= 0
+
+    def __getitem__(self, doc: int) -> List[int]:
+        i = self._find(doc)
+        if i < 0:
+            raise KeyError(doc)
+        return decode_positions(self.positions_data[self.position_ends[i]:self.position_ends[i + 1]])
+
+
+class MmapIndex:
+    """Memory-mapped index directory written by build_mmap_index (LocalIndex storage interface)"""
+
+    def __init__(self, index_dir: str):
+        with open(os.path.join(index_dir, META_FILE), encoding='utf-8') as file:
+            self.meta = json.load(file)
+        if self.meta.get('format') != FORMAT:
+            raise ValueError(f"{index_dir}: unsupported index format {self.meta.get('format')!r}")
+        self.index_dir = index_dir
+        self.fingerprint = self.meta['fingerprint']
+
+        def load(name):
+            return np.load(os.path.join(index_dir, name), mmap_mode='r')
+
+        self._terms = TermList(_map_bytes(os.path.join(index_dir, 'terms.dat')), load('term_offsets.npy'))
+        self._doc_freqs = load('doc_freqs.npy')
+        self._postings_offsets = load('postings_offsets.npy')
+        self._postings_data = _map_bytes(os.path.join(index_dir, 'postings.dat'))
+        self._positions_offsets = load('positions_offsets.npy')
+        self._positions_data = memoryview(_map_bytes(os.path.join(index_dir, 'positions.dat')))
+        self._norms = load('norms.npy')
+        self._doc_offsets = load('doc_offsets.npy')
+        self._docs_data = _map_bytes(os.path.join(index_dir, 'docs.dat'))
+        self.term_ordinal = lru_cache(maxsize=65536)(self._term_ordinal)
+        self._postings = lru_cache(maxsize=1024)(self._decode_postings)
+
+    def _term_ordinal(self, term: str) -> int:
+        """Position of term in the dictionary, -1 if absent"""
+        i = bisect.bisect_left(self._terms, term)
+        return i if i < len(self._terms) and self._terms[i] == term else -1
+
+    def _decode_postings(self, ordinal: int) -> Tuple[List[int], List[int], Postings]:
+        """(docs, freqs, Postings) of a term; positions stay encoded until a doc is looked up"""
+        start, end = int(self._postings_offsets[ordinal]), int(self._postings_offsets[ordinal + 1])
+        fields = decode_varints(self._postings_data[start:end]).reshape(-1, 3)
+        docs = np.cumsum(fields[:, 0]).tolist()
+        position_ends = np.concatenate(([0], np.cumsum(fields[:, 2]))) + int(self._positions_offsets[ordinal])
+        return docs, fields[:, 1].tolist(), Postings(docs, position_ends.tolist(), self._positions_data)
+
+    # Storage interface used by LocalSearcher
+    @property
+    def num_docs(self) -> int:
+        return self.meta['num_docs']
+
+    @property
+    def num_terms(self) -> int:
+        return self.meta['num_terms']
+
+    @property
+    def avg_doc_len(self) -> float:
+        return self.meta['total_len'] / self.meta['num_docs'] if self.meta['num_docs'] else 0.0
+
+    def doc_len(self, doc: int) -> int:
+        return int(self._norms[doc])
+
+    def doc_freq(self, term: str) -> int:
+        ordinal = self.term_ordinal(term)
+        return int(self._doc_freqs[ordinal]) if ordinal >= 0 else 0
+
+    def term_postings(self, term: str) -> Mapping:
+        """doc -> sorted positions of term"""
+        ordinal = self.term_ordinal(term)
+        return self._postings(ordinal)[2] if ordinal >= 0 else {}
+
+    def term_freqs(self, term: str) -> Dict[int, int]:
+        """doc -> frequency of term, for scoring without positions"""
+        ordinal = self.term_ordinal(term)
+        if ordinal < 0:
+            return {}
+        docs, freqs, _ = self._postings(ordinal)
+        return dict(zip(docs, freqs))
+
+    def terms(self) -> TermList:
+        return self._terms
+
+    def sorted_terms(self) -> TermList:
+        return self._terms
+
+    def doc_id(self, doc: int) -> str:
+        return str(self.source(doc).get('id') or doc)
+
+    def source(self, doc: int) -> Dict[str, Any]:
+        return loads(self._docs_data[int(self._doc_offsets[doc]):int(self._doc_offsets[doc + 1])].tobytes())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a memory-mapped inverted index for the local search backend")
+    parser.add_argument('input_path', help="Parquet file or directory")
+    parser.add_argument('index_dir', help="Output directory, then use es_url local:<index_dir>")
+    parser.add_argument('--text-column', default='text')
+    parser.add_argument('--max-docs', type=int, default=None)
+    parser.add_argument('--chunk-docs', type=int, default=DEFAULT_CHUNK_DOCS,
+                        help="Documents inverted in memory before spilling a sorted run")
+    args = parser.parse_args()
+
+    if is_index_dir(args.index_dir):
+        print(f"Error: {args.index_dir} already holds an index")
+        raise SystemExit(1)
+    meta = build_mmap_index(args.input_path, args.index_dir, args.text_column, args.max_docs, args.chunk_docs)
+    sizes = {name: os.path.getsize(os.path.join(args.index_dir, name)) for name in sorted(os.listdir(args.index_dir))}
+    print(f"Indexed {meta['num_docs']} documents, {meta['num_terms']} terms in {meta['build_time_s']}s")
+    for name, size in sizes.items():
+        print(f"  {name}: {size / 1024 ** 2:.2f} MB")
+    print(f"Total: {sum(sizes.values()) / 1024 ** 2:.2f} MB")
+
+
+if __name__ == "__main__":
+    main()
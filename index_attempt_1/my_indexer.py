@@ -0,0 +1,669 @@
+#!/usr/bin/env python3
+"""
+Parallel Parquet -> Elasticsearch bulk indexer
+Streams Parquet files row group by row group with pyarrow, builds bulk NDJSON
+in a process pool and sends it through a bounded pipeline of bulk sender
+threads whose batch size adapts to ES back-pressure (429s) and bulk latency
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import queue
+import signal
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Set, Tuple, Union
+
+import requests
+
+from es_transport import ESTransport, dumps, JSON_BACKEND
+from parquet_files import list_parquet_files
+
+BULK_HEADERS = {'Content-Type': 'application/x-ndjson'}
+
+# Index settings for the duration of a bulk load: no refreshes, no replicas,
+# translog fsync in the background instead of on every bulk request. Acknowledged
+# documents are then not durable until the next flush, so progress manifest records
+# are only written after a _flush (ParquetBulkIndexer.flush_progress)
+BULK_LOAD_SETTINGS = {
+    'index.refresh_interval': '-1',
+    'index.number_of_replicas': '0',
+    'index.translog.durability': 'async',
+}
+
+
+# How document _ids are derived: 'auto' uses FineWeb's id column, else url, else a content hash;
+# 'none' lets ES generate ids (re-sent documents are then duplicated)
+DOC_ID_STRATEGIES = ('auto', 'id', 'url', 'hash', 'none')
+
+
+def resolve_doc_id(strategy: str, column_names: List[str]) -> str:
+    """Concrete id strategy for a file with these columns"""
+    if strategy != 'auto':
+        return strategy
+    if 'id' in column_names:
+        return 'id'
+    if 'url' in column_names:
+        return 'url'
+    return 'hash'
+
+
+def document_id(doc: dict, strategy: str) -> Union[str, None]:
+    """Deterministic _id of a document, so re-sending it overwrites instead of duplicating"""
+    if strategy == 'none':
+        return None
+    value = doc.get(strategy) if strategy in ('id', 'url') else None
+    if value and strategy == 'id' and len(str(value).encode('utf-8')) <= 512:  # ES _id limit
+        return str(value)
+    if not value:
+        # Content hash: the text if there is one, otherwise the whole document
+        value = doc.get('text') or dumps(doc).decode('utf-8')
+    return hashlib.sha1(str(value).encode('utf-8')).hexdigest()
+
+
+def build_row_group_ndjson(path: str, row_group: int, columns: Union[List[str], None],
+                           read_batch_rows: int, doc_id: str = 'auto') -> Tuple[bytes, List[int]]:
+    """
+    Worker: read one row group and encode it as bulk NDJSON.
+    Returns (body, end offsets of each document's action+source lines) so the
+    sender can cut the body into bulks of any size without re-encoding.
+    """
+    import pyarrow.parquet as pq
+
+    parquet_file = pq.ParquetFile(path)
+    strategy = resolve_doc_id(doc_id, parquet_file.schema_arrow.names)
+    read_columns = columns
+    # The id column is read for the _id even when it is not indexed
+    if columns is not None and strategy in ('id', 'url') and strategy not in columns:
+        read_columns = columns + [strategy]
+
+    parts = []
+    offsets = []
+    position = 0
+    for batch in parquet_file.iter_batches(batch_size=read_batch_rows, row_groups=[row_group],
+                                           columns=read_columns):
+        for doc in batch.to_pylist():
+            _id = document_id(doc, strategy)
+            if read_columns is not columns:
+                doc.pop(strategy, None)
+            action = b'{"index":{}}\n' if _id is None else b'{"index":{"_id":' + dumps(_id) + b'}}\n'
+            line = action + dumps(doc) + b'\n'
+            parts.append(line)
+            position += len(line)
+            offsets.append(position)
+    return b''.join(parts), offsets
+
+
+class ProgressManifest:
+    """
+    Append-only JSONL record of the (file, row group) units fully indexed into one index.
+    Records carry the index uuid and file size, so a recreated index or a rewritten
+    file is indexed again instead of being skipped.
+    """
+
+    def __init__(self, path: str, index_uuid: str):
+        self.path = path
+        self.index_uuid = index_uuid
+        self.lock = threading.Lock()
+        self._file_bytes: Dict[str, int] = {}
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.file = open(path, 'a', encoding='utf-8')
+
+    def _size(self, path: str) -> int:
+        if path not in self._file_bytes:
+            self._file_bytes[path] = os.path.getsize(path)
+        return self._file_bytes[path]
+
+    def completed(self) -> Set[Tuple[str, int]]:
+        """Units already done for this index; a truncated last line (crash) is ignored"""
+        done = set()
+        with open(self.path, 'r', encoding='utf-8') as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if (record.get('index_uuid') == self.index_uuid and os.path.exists(record['file'])
+                        and record.get('file_bytes') == self._size(record['file'])):
+                    done.add((record['file'], record['row_group']))
+        return done
+
+    def mark_done(self, path: str, row_group: int, docs: int, failed: int):
+        record = {'file': path, 'row_group': row_group, 'docs': docs, 'failed': failed,
+                  'file_bytes': self._size(path), 'index_uuid': self.index_uuid,
+                  'time': datetime.now().isoformat()}
+        with self.lock:
+            self.file.write(json.dumps(record) + '\n')
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+class AdaptiveBatchSizer:
+    """
+    AIMD control of documents per bulk request: grow while bulks come back
+    under target_latency_ms, shrink when they are slow, halve on a 429.
+    """
+
+    def __init__(self, initial_docs: int, min_docs: int, max_docs: int, target_latency_ms: float):
+        self.min_docs = max(1, min_docs)
+        self.max_docs = max(self.min_docs, max_docs)
+        self.target_latency_ms = target_latency_ms
+        self.docs = min(max(initial_docs, self.min_docs), self.max_docs)
+        self.lock = threading.Lock()
+
+    def on_success(self, latency_ms: float):
+        with self.lock:
+            if latency_ms < self.target_latency_ms:
+                self.docs = min(self.max_docs, self.docs + max(1, self.docs // 4))
+            elif latency_ms > 2 * self.target_latency_ms:
+                self.docs = max(self.min_docs, self.docs * 3 // 4)
+
+    def on_rejected(self):
+        with self.lock:
+            self.docs = max(self.min_docs, self.docs // 2)
+
+
+class ParquetBulkIndexer:
+    def __init__(self, es_url: str, index_name: str, config: Dict = None):
+        self.es_url = es_url.rstrip('/')
+        self.index_name = index_name
+
+        # Default configuration
+        default_config = {
+            'workers': 1,  # Processes building NDJSON
+            'thread_count': 2,  # Concurrent bulk requests
+            'queue_size': 4,  # Bulks waiting for a sender (also bounds row groups in flight)
+            'batch_size': 1000,  # Initial documents per bulk request
+            'min_batch_size': 100,
+            'max_batch_size': 20000,
+            'max_chunk_bytes': 10 * 1024 * 1024,  # Hard cap on one bulk body
+            'target_latency_ms': 2000,  # Bulk latency the batch size is steered towards
+            'read_batch_rows': 10000,  # pyarrow record batch size inside a row group
+            'columns': None,  # Parquet columns to index, None = all
+            'doc_id': 'auto',  # One of DOC_ID_STRATEGIES
+            'max_retries': 5,  # Per bulk, for 429s and connection errors
+            'backoff_s': 0.5,  # First retry delay, doubled on every further attempt
+            'progress_interval_s': 30,
+            'manifest_flush_interval_s': 60,  # _flush, then record the units completed before it
+            'request_timeout': 120,
+            'settings_state_file': None,  # Original settings while the bulk-load profile is active
+            'force_merge_segments': 1,  # Force-merge to this many segments after the load, 0 = skip
+            'force_merge_timeout_s': 3600
+        }
+        if config:
+            default_config.update(config)
+        for key, value in default_config.items():
+            setattr(self, key, value)
+
+        self.transport = ESTransport(self.es_url, pool_size=self.thread_count, timeout=self.request_timeout)
+        self.sizer = AdaptiveBatchSizer(self.batch_size, self.min_batch_size, self.max_batch_size,
+                                        self.target_latency_ms)
+
+        self.stats_lock = threading.Lock()
+        self.docs_indexed = 0
+        self.docs_failed = 0
+        self.bulk_requests = 0
+        self.rejections = 0
+        self.bytes_sent = 0
+        self.errors_shown = 0
+        self.original_settings = None
+        self.progress = None
+        self.units_in_flight: Dict[Tuple[str, int], Dict[str, int]] = {}
+        self.units_skipped = 0
+        self.units_unflushed: List[Tuple[Tuple[str, int], int, int]] = []
+        self.flush_lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self.start_time = None
+        self._last_report = 0.0
+
+    def ensure_index(self, index_config_file: str = None):
+        """Create the index from the settings/mappings JSON if it does not exist yet"""
+        response, _, _ = self.transport.request('HEAD', self.index_name)
+        if response.status_code == 200:
+            print(f"Index '{self.index_name}' exists")
+            return
+        body = None
+        if index_config_file:
+            with open(index_config_file, 'r', encoding='utf-8') as file:
+                body = json.load(file)
+        response, decoded, _ = self.transport.request('PUT', self.index_name, body)
+        if response.status_code >= 300 and 'resource_already_exists_exception' not in str(decoded):
+            raise RuntimeError(f"Failed to create index '{self.index_name}': {decoded}")
+        print(f"Created index '{self.index_name}'" + (f" from {index_config_file}" if body else ""))
+
+    def index_uuid(self) -> str:
+        _, decoded, _ = self.transport.request('GET', f"{self.index_name}/_settings?flat_settings=true")
+        return next(iter(decoded.values()), {}).get('settings', {}).get('index.uuid', 'unknown')
+
+    def open_progress_manifest(self, path: str):
+        """Record completed row groups in path and skip those a previous run finished"""
+        self.progress = ProgressManifest(path, self.index_uuid())
+        print(f"Progress manifest: {path}")
+
+    def apply_bulk_load_settings(self):
+        """
+        Switch the index to BULK_LOAD_SETTINGS. The original values are saved to
+        settings_state_file first, so restore_index_settings (or `--restore-settings`
+        from the job's cleanup trap) can put them back even if this process is killed.
+        A state file left by a killed run is kept: it holds the real originals.
+        """
+        if self.settings_state_file and os.path.exists(self.settings_state_file):
+            print(f"Keeping original settings saved by a previous run in {self.settings_state_file}")
+        else:
+            _, decoded, _ = self.transport.request('GET', f"{self.index_name}/_settings?flat_settings=true")
+            current = next(iter(decoded.values()), {}).get('settings', {})
+            # None restores the ES default for settings that were not set explicitly
+            original = {key: current.get(key) for key in BULK_LOAD_SETTINGS}
+            if self.settings_state_file:
+                os.makedirs(os.path.dirname(os.path.abspath(self.settings_state_file)), exist_ok=True)
+                with open(self.settings_state_file, 'w', encoding='utf-8') as file:
+                    json.dump({'index_name': self.index_name, 'settings': original}, file, indent=2)
+            self.original_settings = original
+
+        response, decoded, _ = self.transport.request('PUT', f"{self.index_name}/_settings", BULK_LOAD_SETTINGS)
+        if response.status_code >= 300:
+            raise RuntimeError(f"Failed to apply bulk-load settings: {decoded}")
+        print(f"Bulk-load settings applied: {BULK_LOAD_SETTINGS}")
+
+    def restore_index_settings(self, force_merge: bool = True) -> bool:
+        """
+        Restore the settings saved by apply_bulk_load_settings, refresh, and
+        optionally force-merge. Returns False if the restore failed (the state
+        file is then kept for another attempt).
+        """
+        original = self.original_settings
+        if self.settings_state_file and os.path.exists(self.settings_state_file):
+            with open(self.settings_state_file, 'r', encoding='utf-8') as file:
+                original = json.load(file)['settings']
+        if original is None:
+            print("No saved index settings to restore")
+            return True
+
+        try:
+            response, decoded, _ = self.transport.request('PUT', f"{self.index_name}/_settings", original)
+            if response.status_code >= 300:
+                print(f"Failed to restore index settings: {decoded}")
+                return False
+            print(f"Index settings restored: {original}")
+            if self.settings_state_file and os.path.exists(self.settings_state_file):
+                os.remove(self.settings_state_file)
+            self.original_settings = None
+
+            start = time.perf_counter()
+            self.transport.request('POST', f"{self.index_name}/_refresh")
+            print(f"Refreshed in {time.perf_counter() - start:.1f}s")
+            if force_merge and self.force_merge_segments:
+                start = time.perf_counter()
+                response, decoded, _ = self.transport.request(
+                    'POST', f"{self.index_name}/_forcemerge?max_num_segments={self.force_merge_segments}",
+                    timeout=self.force_merge_timeout_s)
+                if response.status_code >= 300:
+                    print(f"Force merge failed: {decoded}")
+                else:
+                    print(f"Force-merged to {self.force_merge_segments} segment(s) in "
+                          f"{time.perf_counter() - start:.1f}s")
+            return True
+        except requests.exceptions.RequestException as e:
+            print(f"Failed to restore index settings: {e}")
+            return False
+
+    def _record(self, indexed: int = 0, failed: int = 0, nbytes: int = 0):
+        with self.stats_lock:
+            self.docs_indexed += indexed
+            self.docs_failed += failed
+            self.bytes_sent += nbytes
+            self.bulk_requests += 1
+
+    def send_bulk(self, body: bytes, offsets: List[int]) -> Tuple[int, int]:
+        """
+        Send one bulk body (documents end at offsets). Whole-request 429s and
+        connection errors are retried with backoff; documents rejected with an
+        item-level 429 are re-sent on their own, other item errors count as failed.
+        Returns (failed documents, documents given up on after max_retries).
+        """
+        failed_total = 0
+        for attempt in range(self.max_retries):
+            try:
+                response, decoded, timings = self.transport.request(
+                    'POST', f"{self.index_name}/_bulk", body, BULK_HEADERS)
+            except requests.exceptions.RequestException as e:
+                print(f"Bulk request failed (attempt {attempt + 1}): {e}")
+                time.sleep(self.backoff_s * 2 ** attempt)
+                continue
+
+            if response.status_code == 429:
+                with self.stats_lock:
+                    self.rejections += 1
+                self.sizer.on_rejected()
+                time.sleep(self.backoff_s * 2 ** attempt)
+                continue
+            if response.status_code >= 300:
+                print(f"Bulk request rejected with HTTP {response.status_code}: {str(decoded)[:500]}")
+                self._record(failed=len(offsets), nbytes=len(body))
+                return failed_total + len(offsets), 0
+
+            self.sizer.on_success(timings['total_ms'])
+            if not decoded.get('errors'):
+                self._record(indexed=len(offsets), nbytes=len(body))
+                return failed_total, 0
+
+            # Split the response into indexed, retryable (429) and failed documents
+            retry_parts = []
+            retry_offsets = []
+            failed = 0
+            start = 0
+            for item, end in zip(decoded.get('items', []), offsets):
+                result = next(iter(item.values()))
+                status = result.get('status', 500)
+                if status == 429:
+                    retry_parts.append(body[start:end])
+                    retry_offsets.append(sum(len(p) for p in retry_parts))
+                elif status >= 300:
+                    failed += 1
+                    with self.stats_lock:
+                        show = self.errors_shown < 10
+                        self.errors_shown += 1
+                    if show:
+                        print(f"Document rejected: {result.get('error')}")
+                start = end
+            self._record(indexed=len(offsets) - len(retry_offsets) - failed, failed=failed, nbytes=len(body))
+            failed_total += failed
+            if not retry_offsets:
+                return failed_total, 0
+            with self.stats_lock:
+                self.rejections += 1
+            self.sizer.on_rejected()
+            time.sleep(self.backoff_s * 2 ** attempt)
+            body, offsets = b''.join(retry_parts), retry_offsets
+
+        print(f"Giving up on a bulk of {len(offsets)} documents after {self.max_retries} attempts")
+        self._record(failed=len(offsets), nbytes=0)
+        return failed_total, len(offsets)
+
+    def _split(self, body: bytes, offsets: List[int]):
+        """Cut one row group's NDJSON into bulks of the current adaptive size, capped by bytes"""
+        first = 0
+        start = 0
+        while first < len(offsets):
+            last = min(len(offsets), first + self.sizer.docs)
+            # Respect the byte cap, but always send at least one document
+            while last - 1 > first and offsets[last - 1] - start > self.max_chunk_bytes:
+                last = first + max(1, (last - first) // 2)
+            end = offsets[last - 1]
+            yield body[start:end], [o - start for o in offsets[first:last]]
+            first = last
+            start = end
+
+    def _enqueue(self, unit: Tuple[str, int], body: bytes, offsets: List[int], bulks: queue.Queue):
+        """Queue one built row group as bulks; the unit is complete once all of them are acknowledged"""
+        chunks = list(self._split(body, offsets))
+        if not chunks:
+            self._unit_done(unit, 0, 0)
+            return
+        with self.stats_lock:
+            self.units_in_flight[unit] = {'bulks': len(chunks), 'docs': len(offsets), 'failed': 0, 'gave_up': 0}
+        for chunk_body, chunk_offsets in chunks:
+            bulks.put((chunk_body, chunk_offsets, unit))
+
+    def _bulk_done(self, unit: Tuple[str, int], failed: int, gave_up: int):
+        with self.stats_lock:
+            state = self.units_in_flight[unit]
+            state['bulks'] -= 1
+            state['failed'] += failed
+            state['gave_up'] += gave_up
+            if state['bulks'] > 0:
+                return
+            del self.units_in_flight[unit]
+        # Documents given up on (429s, connection errors) must be re-sent by the next run
+        if state['gave_up'] == 0:
+            self._unit_done(unit, state['docs'], state['failed'])
+
+    def _unit_done(self, unit: Tuple[str, int], docs: int, failed: int):
+        if self.progress is not None:
+            with self.stats_lock:
+                self.units_unflushed.append((unit, docs, failed))
+
+    def flush_progress(self, final: bool = False):
+        """
+        Make the acknowledged documents durable with a _flush (the translog is async during
+        the load), then record the units completed before it in the progress manifest. If
+        the flush fails the units stay unrecorded and a resumed run sends them again.
+        """
+        if self.progress is None:
+            return
+        with self.stats_lock:
+            if not self.units_unflushed or (
+                    not final and time.monotonic() - self._last_flush < self.manifest_flush_interval_s):
+                return
+        if not self.flush_lock.acquire(blocking=final):
+            return  # Another sender is flushing
+        try:
+            with self.stats_lock:
+                units, self.units_unflushed = self.units_unflushed, []
+                self._last_flush = time.monotonic()
+            try:
+                response, decoded, _ = self.transport.request('POST', f"{self.index_name}/_flush")
+                flushed = response.status_code < 300
+                if not flushed:
+                    print(f"Flush failed: {str(decoded)[:500]}")
+            except (requests.exceptions.RequestException, ValueError) as e:  # ValueError: non-JSON body
+                print(f"Flush failed: {e}")
+                flushed = False
+            if not flushed:
+                with self.stats_lock:
+                    self.units_unflushed = units + self.units_unflushed
+                return
+            for unit, docs, failed in units:
+                self.progress.mark_done(unit[0], unit[1], docs, failed)
+        finally:
+            self.flush_lock.release()
+
+    def _sender(self, bulks: queue.Queue):
+        while True:
+            item = bulks.get()
+            if item is None:
+                return
+            body, offsets, unit = item
+            try:
+                result = self.send_bulk(body, offsets)
+            except Exception as e:
+                # E.g. an HTML 502 from a proxy (not JSON) or an unexpected response shape. A dead
+                # sender would leave the main thread blocked on a full queue, so the bulk is
+                # given up on instead and its unit is left for the next run
+                print(f"Bulk of {len(offsets)} documents failed: {type(e).__name__}: {e}")
+                self._record(failed=len(offsets))
+                result = (0, len(offsets))
+            self._bulk_done(unit, *result)
+            self.report_progress()
+            self.flush_progress()
+
+    def report_progress(self, final: bool = False):
+        now = time.monotonic()
+        with self.stats_lock:
+            if not final and now - self._last_report < self.progress_interval_s:
+                return
+            self._last_report = now
+        elapsed = now - self.start_time
+        rate = self.docs_indexed / elapsed if elapsed > 0 else 0.0
+        prefix = "Done" if final else "Progress"
+        print(f"{prefix}: {self.docs_indexed} docs indexed, {self.docs_failed} failed, "
+              f"{self.bulk_requests} bulks ({self.rejections} rejected), "
+              f"{self.bytes_sent / 1e6:.1f} MB in {elapsed:.1f}s, {rate:.0f} docs/s, "
+              f"batch size {self.sizer.docs}", flush=True)
+
+    def index_files(self, files: List[str]):
+        """Index every row group of files: build in the process pool, send from sender threads"""
+        import pyarrow.parquet as pq
+
+        completed = self.progress.completed() if self.progress is not None else set()
+        units = []
+        for path in files:
+            for row_group in range(pq.ParquetFile(path).num_row_groups):
+                if (path, row_group) in completed:
+                    self.units_skipped += 1
+                else:
+                    units.append((path, row_group))
+        if self.units_skipped:
+            print(f"Skipping {self.units_skipped} row groups completed by a previous run")
+        print(f"{len(files)} files, {len(units)} row groups to index with {self.workers} build workers, "
+              f"{self.thread_count} bulk senders (JSON backend: {JSON_BACKEND})")
+
+        self.start_time = time.monotonic()
+        self._last_report = self.start_time
+        bulks = queue.Queue(maxsize=self.queue_size)
+        senders = [threading.Thread(target=self._sender, args=(bulks,), daemon=True)
+                   for _ in range(self.thread_count)]
+        for sender in senders:
+            sender.start()
+
+        executor = ProcessPoolExecutor(max_workers=self.workers)
+        try:
+            # Bounded in-flight row groups: memory stays flat however many files there are
+            pending = deque()
+            for unit in units:
+                pending.append((unit, executor.submit(build_row_group_ndjson, *unit, self.columns,
+                                                      self.read_batch_rows, self.doc_id)))
+                if len(pending) < self.workers + self.queue_size:
+                    continue
+                done_unit, future = pending.popleft()
+                self._enqueue(done_unit, *future.result(), bulks)
+            while pending:
+                done_unit, future = pending.popleft()
+                self._enqueue(done_unit, *future.result(), bulks)
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+            for _ in senders:
+                bulks.put(None)
+            for sender in senders:
+                sender.join()
+            self.flush_progress(final=True)
+            self.report_progress(final=True)
+
+    def close(self):
+        if self.progress is not None:
+            self.progress.close()
+        self.transport.close()
+
+
+def main():
+    cpus = int(os.environ.get('SLURM_CPUS_PER_TASK', os.cpu_count() or 1))
+
+    parser = argparse.ArgumentParser(description="Parallel Parquet -> Elasticsearch bulk indexer")
+    parser.add_argument('--data-dir', required=True, help="Directory searched recursively for *.parquet")
+    parser.add_argument('--es-host', default='localhost')
+    parser.add_argument('--es-port', type=int, default=9200)
+    parser.add_argument('--index-name', required=True)
+    parser.add_argument('--index-config', default=None, help="Settings/mappings JSON used to create the index")
+    parser.add_argument('--file-range-start', type=int, default=None, help="First file (sorted order) to index")
+    parser.add_argument('--file-range-end', type=int, default=None, help="Stop before this file")
+    parser.add_argument('--manifest', default=None,
+                        help="shard_planner.py manifest: index this task's files into its task index")
+    parser.add_argument('--task-id', type=int, default=int(os.environ.get('SLURM_ARRAY_TASK_ID', 0)))
+    # ES runs on the same node, leave it half of the CPUs by default
+    parser.add_argument('--workers', type=int, default=max(1, cpus // 2), help="NDJSON build processes")
+    parser.add_argument('--thread-count', type=int, default=2, help="Concurrent bulk requests")
+    parser.add_argument('--queue-size', type=int, default=4, help="Bulks buffered ahead of the senders")
+    parser.add_argument('--batch-size', type=int, default=1000, help="Initial documents per bulk")
+    parser.add_argument('--min-batch-size', type=int, default=100)
+    parser.add_argument('--max-batch-size', type=int, default=20000)
+    parser.add_argument('--max-chunk-bytes', type=float, default=10, help="Max bulk body size in MB")
+    parser.add_argument('--target-latency-ms', type=float, default=2000, help="Bulk latency to steer towards")
+    parser.add_argument('--chunk-size', type=int, default=10000, help="Rows per pyarrow read batch")
+    parser.add_argument('--doc-id', choices=DOC_ID_STRATEGIES, default='auto',
+                        help="Document _id source: id column, url hash, content hash, or ES generated")
+    parser.add_argument('--progress-manifest', default=None,
+                        help="JSONL of completed row groups; a rerun skips them")
+    parser.add_argument('--columns', default=None, help="Comma separated columns to index (default: all)")
+    parser.add_argument('--progress-interval-s', type=float, default=30)
+    parser.add_argument('--no-bulk-load-settings', action='store_true',
+                        help="Index with the current settings instead of the bulk-load profile")
+    parser.add_argument('--settings-state-file', default=None,
+                        help="Where the original settings are kept while the bulk-load profile is active")
+    parser.add_argument('--force-merge-segments', type=int, default=1, help="0 skips the final force merge")
+    parser.add_argument('--restore-settings', action='store_true',
+                        help="Only restore settings saved in --settings-state-file and refresh (cleanup trap)")
+    parser.add_argument('--log-level', default='INFO', help="Accepted for compatibility, output is always INFO")
+    args = parser.parse_args()
+
+    es_url = f"http://{args.es_host}:{args.es_port}"
+
+    if args.restore_settings:
+        indexer = ParquetBulkIndexer(es_url, args.index_name, {'settings_state_file': args.settings_state_file})
+        try:
+            restored = indexer.restore_index_settings(force_merge=False)
+        finally:
+            indexer.close()
+        sys.exit(0 if restored else 1)
+
+    if args.manifest:
+        with open(args.manifest, 'r', encoding='utf-8') as file:
+            task = json.load(file)['tasks'][args.task_id]
+        files = task['files']
+        args.index_name = task['index_name']
+        print(f"Manifest {args.manifest}, task {args.task_id}")
+    else:
+        files = list_parquet_files(args.data_dir, args.file_range_start, args.file_range_end)
+
+    print("Parquet Bulk Indexer Starting...")
+    print(f"Data directory: {args.data_dir}")
+    print(f"Index: {args.index_name}")
+    print(f"ES URL: {es_url}")
+    print(f"Files: {len(files)} (range {args.file_range_start}:{args.file_range_end})")
+    print("=" * 50)
+    if not files:
+        print("No parquet files to index")
+        sys.exit(1)
+
+    indexer = ParquetBulkIndexer(es_url, args.index_name, {
+        'workers': args.workers,
+        'thread_count': args.thread_count,
+        'queue_size': args.queue_size,
+        'batch_size': args.batch_size,
+        'min_batch_size': args.min_batch_size,
+        'max_batch_size': args.max_batch_size,
+        'max_chunk_bytes': int(args.max_chunk_bytes * 1024 * 1024),
+        'target_latency_ms': args.target_latency_ms,
+        'read_batch_rows': args.chunk_size,
+        'columns': args.columns.split(',') if args.columns else None,
+        'doc_id': args.doc_id,
+        'progress_interval_s': args.progress_interval_s,
+        'settings_state_file': args.settings_state_file,
+        'force_merge_segments': args.force_merge_segments
+    })
+    # Let the finally blocks report progress when SLURM kills the job
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(143))
+
+    completed = False
+    bulk_profile = False
+    try:
+        indexer.ensure_index(args.index_config)
+        if args.progress_manifest:
+            indexer.open_progress_manifest(args.progress_manifest)
+        if not args.no_bulk_load_settings:
+            indexer.apply_bulk_load_settings()
+            bulk_profile = True
+        indexer.index_files(files)
+        completed = True
+    finally:
+        if bulk_profile:
+            # Only a finished load is worth force-merging; on failure just make it searchable again
+            indexer.restore_index_settings(force_merge=completed)
+        indexer.close()
+
+    if indexer.docs_failed:
+        print(f"{indexer.docs_failed} documents failed to index")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
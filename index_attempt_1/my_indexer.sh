@@ -21,7 +21,7 @@ INDEX_CONFIG_FILE="${INDEX_CONFIG_FILE:-/users/anastasiia_kucherenko/index_ines_
 # Default parameters (modify as needed)
 # DATA_DIR="${DATA_DIR:-/capstor/store/cscs/swissai/a06/datasets_swissai/swissai-fineweb-2-quality_33-filterrobots/data/output/fra_Latn}"
 DATA_DIR="${DATA_DIR:-/capstor/scratch/cscs/anastasiia_kucherenko/index_attempt_1}"
-BATCH_SIZE="${BATCH_SIZE:-1000}"        # Bulk indexing batch size, prev 2500
+BATCH_SIZE="${BATCH_SIZE:-1000}"        # Initial bulk batch size (adapted at runtime), prev 2500
 ES_HOST="${ES_HOST:-localhost}"         # Elasticsearch host (container internal)
 ES_PORT="${ES_PORT:-9200}"             # Elasticsearch port
 INDEX_NAME="${INDEX_NAME:-fineweb_test_1}"     # Index name
@@ -32,13 +32,55 @@ LOG_LEVEL="${LOG_LEVEL:-INFO}"         # Logging level
 FILE_RANGE_START="${FILE_RANGE_START:-0}"     # Starting file index
 FILE_RANGE_END="${FILE_RANGE_END:-1}"         # Ending file index
 
-# Elasticsearch bulk indexing parameters
-#MAX_CHUNK_BYTES="${MAX_CHUNK_BYTES:-75}"    # Max chunk size in MB
-#THREAD_COUNT="${THREAD_COUNT:-8}"           # Number of parallel threads
-#QUEUE_SIZE="${QUEUE_SIZE:-8}"               # Queue size for parallel bulk
-MAX_CHUNK_BYTES="5"    # Max chunk size in MB
-THREAD_COUNT="1"           # Number of parallel threads
-QUEUE_SIZE="2"               # Queue size for parallel bulk
+# Job array sharding (see submit_index_array.sh): with MANIFEST set, array task k indexes the
+# files shard_planner.py assigned to it into ${INDEX_NAME}_task<k> instead of FILE_RANGE_*,
+# then snapshots that index to SNAPSHOT_REPO_DIR. INDEX_STAGE=finalize restores all task
+# snapshots into a fresh ES and aliases them as INDEX_NAME (FINALIZE_MODE=alias) or reindexes
+# them into one index (FINALIZE_MODE=reindex)
+MANIFEST="${MANIFEST:-}"
+SNAPSHOT_REPO_DIR="${SNAPSHOT_REPO_DIR:-}"   # Shared filesystem directory, passed to ES as path.repo
+INDEX_STAGE="${INDEX_STAGE:-index}"          # 'index' or 'finalize'
+FINALIZE_MODE="${FINALIZE_MODE:-alias}"
+TASK_ID="${SLURM_ARRAY_TASK_ID:-0}"
+if [ -n "$MANIFEST" ] && [ "$INDEX_STAGE" = "index" ]; then
+    INDEX_NAME="${INDEX_NAME}_task${TASK_ID}"  # Same naming as shard_planner.task_index_name
+fi
+
+# Idempotent ingest: documents get deterministic _ids (DOC_ID: auto = FineWeb id column, else url
+# hash, else content hash; none = ES generated) and every fully indexed (file, row group) is
+# appended to PROGRESS_MANIFEST, so a rerun on the same ES data directory skips finished row groups.
+# Array tasks keep their data directory per task index so a resubmitted task resumes;
+# set ES_DATA_DIR/ES_LOGS_DIR to reuse a directory for single jobs too
+DOC_ID="${DOC_ID:-auto}"
+if [ -n "$MANIFEST" ] && [ "$INDEX_STAGE" = "index" ]; then
+    ES_DATA_DIR="${ES_DATA_DIR:-/iopsstor/scratch/cscs/anastasiia_kucherenko/es-data-${INDEX_NAME}}"
+    ES_LOGS_DIR="${ES_LOGS_DIR:-/iopsstor/scratch/cscs/anastasiia_kucherenko/es-logs-${INDEX_NAME}}"
+else
+    ES_DATA_DIR="${ES_DATA_DIR:-/iopsstor/scratch/cscs/anastasiia_kucherenko/es-data-${SLURM_JOB_ID}}"
+    ES_LOGS_DIR="${ES_LOGS_DIR:-/iopsstor/scratch/cscs/anastasiia_kucherenko/es-logs-${SLURM_JOB_ID}}"
+fi
+PROGRESS_MANIFEST="${PROGRESS_MANIFEST:-${ES_DATA_DIR}_progress_${INDEX_NAME}.jsonl}"
+
+# Elasticsearch bulk indexing parameters (my_indexer.py)
+# NDJSON is built by BUILD_WORKERS processes, sent by THREAD_COUNT concurrent bulk requests;
+# the bulk size adapts between MIN/MAX_BATCH_SIZE from 429s and bulk latency vs TARGET_BULK_LATENCY_MS.
+# ES runs on the same node, so by default half of the allocated CPUs build bulks
+CPUS="${SLURM_CPUS_PER_TASK:-$(nproc)}"
+BUILD_WORKERS="${BUILD_WORKERS:-$(( CPUS / 2 > 0 ? CPUS / 2 : 1 ))}"
+THREAD_COUNT="${THREAD_COUNT:-2}"           # Concurrent bulk requests
+QUEUE_SIZE="${QUEUE_SIZE:-4}"               # Bulks buffered ahead of the senders
+MAX_CHUNK_BYTES="${MAX_CHUNK_BYTES:-10}"    # Max bulk body size in MB
+MIN_BATCH_SIZE="${MIN_BATCH_SIZE:-100}"
+MAX_BATCH_SIZE="${MAX_BATCH_SIZE:-20000}"
+TARGET_BULK_LATENCY_MS="${TARGET_BULK_LATENCY_MS:-2000}"
+READ_CHUNK_ROWS="${READ_CHUNK_ROWS:-12000}"  # Rows per pyarrow read batch
+
+# Bulk-load profile: refresh_interval -1, 0 replicas, async translog while indexing.
+# Original settings are saved to BULK_SETTINGS_STATE_FILE and restored afterwards (also by the
+# cleanup trap if the job is killed), then the index is refreshed and force-merged
+BULK_LOAD_SETTINGS="${BULK_LOAD_SETTINGS:-true}"
+FORCE_MERGE_SEGMENTS="${FORCE_MERGE_SEGMENTS:-1}"   # 0 = skip force merge
+BULK_SETTINGS_STATE_FILE="${BULK_SETTINGS_STATE_FILE:-${ES_LOGS_DIR}/bulk_settings_${INDEX_NAME}.json}"
 
 # Colors for output
 RED='\033[0;31m'
@@ -125,8 +167,8 @@ start_elasticsearch() {
     #    local job_data_dir="/iopsstor/scratch/cscs/inesaltemir/es-data-${SLURM_JOB_ID}-swissai-fineweb-2-quality_33-filterrobots-${INDEX_NAME}"
     #    local job_logs_dir="/iopsstor/scratch/cscs/inesaltemir/es-logs-${SLURM_JOB_ID}-swissai-fineweb-2-quality_33-filterrobots-${INDEX_NAME}"
     #fi
-    local job_data_dir="/iopsstor/scratch/cscs/anastasiia_kucherenko/es-data-${SLURM_JOB_ID}"
-    local job_logs_dir="/iopsstor/scratch/cscs/anastasiia_kucherenko/es-logs-${SLURM_JOB_ID}"
+    local job_data_dir="$ES_DATA_DIR"
+    local job_logs_dir="$ES_LOGS_DIR"
     
     mkdir -p "$job_data_dir"
     mkdir -p "$job_logs_dir"
@@ -135,6 +177,14 @@ start_elasticsearch() {
     log_info "ES Logs Directory: $job_logs_dir"
 
 
+    # Snapshot repository for job array builds
+    local es_extra_opts=()
+    if [ -n "$SNAPSHOT_REPO_DIR" ]; then
+        mkdir -p "$SNAPSHOT_REPO_DIR"
+        es_extra_opts+=(-E path.repo="$SNAPSHOT_REPO_DIR")
+        log_info "ES Snapshot Repository: $SNAPSHOT_REPO_DIR"
+    fi
+
     ES_JAVA_OPTS="$CUSTOM_HEAP" \
     /usr/share/elasticsearch/bin/elasticsearch \
         -E path.data="$job_data_dir" \
@@ -153,7 +203,8 @@ start_elasticsearch() {
         -E cluster.routing.allocation.disk.watermark.flood_stage=95% \
         -E bootstrap.memory_lock=false \
         -E logger.root=INFO \
-        -E http.max_content_length=200mb &
+        -E http.max_content_length=200mb \
+        "${es_extra_opts[@]}" &
 
     ES_PID=$!
     
@@ -234,11 +285,20 @@ show_configuration() {
     
     log_info "=== Indexing Configuration ==="
     echo "Data Directory: $DATA_DIR"
-    echo "Batch Size: $BATCH_SIZE" 
+    echo "Batch Size: $BATCH_SIZE (adaptive, $MIN_BATCH_SIZE-$MAX_BATCH_SIZE, target ${TARGET_BULK_LATENCY_MS}ms)"
+    echo "Build Workers: $BUILD_WORKERS, Bulk Threads: $THREAD_COUNT, Queue: $QUEUE_SIZE, Max Chunk: ${MAX_CHUNK_BYTES}MB"
     echo "Elasticsearch: $ES_HOST:$ES_PORT" 
     echo "Index Name: $INDEX_NAME"
-    echo "File Start Range: $FILE_RANGE_START"
-    echo "File End Range: $FILE_RANGE_END"
+    if [ -n "$MANIFEST" ]; then
+        echo "Manifest: $MANIFEST (task $TASK_ID, stage $INDEX_STAGE)"
+        echo "Snapshot Repository: ${SNAPSHOT_REPO_DIR:-'(not set)'}"
+    else
+        echo "File Start Range: $FILE_RANGE_START"
+        echo "File End Range: $FILE_RANGE_END"
+    fi
+    echo "Bulk-Load Settings: $BULK_LOAD_SETTINGS (force merge to: $FORCE_MERGE_SEGMENTS segments)"
+    echo "Document IDs: $DOC_ID"
+    echo "Progress Manifest: $PROGRESS_MANIFEST"
     echo "Log Level: $LOG_LEVEL" 
     echo "ES Java Opts: $ES_JAVA_OPTS"
     echo "ES Java Opts: $INDEX_CONFIG_FILE"
@@ -264,10 +324,14 @@ run_indexing() {
     
       
     # Base Python command
-    base_cmd="python3 /users/anastasiia_kucherenko/index_ines_version/elasticsearch_alps/scripts/index_index/no_leak_with_file_range.py \
+    base_cmd="python3 /capstor/scratch/cscs/anastasiia_kucherenko/index_attempt_1/my_indexer.py \
         --data-dir \"$DATA_DIR\" \
         --batch-size \"$BATCH_SIZE\" \
-        --chunk-size 12000 \
+        --min-batch-size \"$MIN_BATCH_SIZE\" \
+        --max-batch-size \"$MAX_BATCH_SIZE\" \
+        --target-latency-ms \"$TARGET_BULK_LATENCY_MS\" \
+        --chunk-size \"$READ_CHUNK_ROWS\" \
+        --workers \"$BUILD_WORKERS\" \
         --es-host \"$ES_HOST\" \
         --es-port \"$ES_PORT\" \
         --index-name \"$INDEX_NAME\" \
@@ -275,10 +339,22 @@ run_indexing() {
         --index-config \"$INDEX_CONFIG_FILE\" \
         --max-chunk-bytes \"$MAX_CHUNK_BYTES\" \
         --thread-count \"$THREAD_COUNT\" \
-        --queue-size \"$QUEUE_SIZE\""
+        --queue-size \"$QUEUE_SIZE\" \
+        --settings-state-file \"$BULK_SETTINGS_STATE_FILE\" \
+        --force-merge-segments \"$FORCE_MERGE_SEGMENTS\" \
+        --doc-id \"$DOC_ID\" \
+        --progress-manifest \"$PROGRESS_MANIFEST\""
     
+    if [ "$BULK_LOAD_SETTINGS" != "true" ]; then
+        base_cmd+=" --no-bulk-load-settings"
+    fi
+    
+    # Files from the job array manifest, otherwise the file range
+    if [ -n "$MANIFEST" ]; then
+        base_cmd+=" --manifest \"$MANIFEST\" --task-id \"$TASK_ID\""
+        log_info "Using manifest $MANIFEST, task $TASK_ID"
     # Add file range arguments only if both are set and not empty
-    if [[ -n "$FILE_RANGE_START" && -n "$FILE_RANGE_END" ]]; then
+    elif [[ -n "$FILE_RANGE_START" && -n "$FILE_RANGE_END" ]]; then
         base_cmd+=" --file-range-start \"$FILE_RANGE_START\" --file-range-end \"$FILE_RANGE_END\""
         log_info "Using file range: $FILE_RANGE_START to $FILE_RANGE_END"
     else
@@ -301,6 +377,29 @@ run_indexing() {
     fi
 }
 
+# Snapshot this array task's index so the finalize job can restore it
+snapshot_task_index() {
+    log_info "Snapshotting $INDEX_NAME to $SNAPSHOT_REPO_DIR..."
+    python3 /capstor/scratch/cscs/anastasiia_kucherenko/index_attempt_1/shard_planner.py snapshot \
+        --manifest "$MANIFEST" \
+        --repo-dir "$SNAPSHOT_REPO_DIR" \
+        --task-id "$TASK_ID" \
+        --es-host "$ES_HOST" \
+        --es-port "$ES_PORT"
+}
+
+# Restore every task snapshot and combine them under INDEX_NAME
+run_finalize() {
+    log_info "Finalizing $INDEX_NAME from task snapshots ($FINALIZE_MODE)..."
+    python3 /capstor/scratch/cscs/anastasiia_kucherenko/index_attempt_1/shard_planner.py finalize \
+        --manifest "$MANIFEST" \
+        --repo-dir "$SNAPSHOT_REPO_DIR" \
+        --mode "$FINALIZE_MODE" \
+        --index-config "$INDEX_CONFIG_FILE" \
+        --es-host "$ES_HOST" \
+        --es-port "$ES_PORT"
+}
+
 # Function to show final index location
 show_index_location() {
     log_info "=== Index Storage Information ==="
@@ -318,9 +417,28 @@ show_index_location() {
     echo "INDEX_NAME is: '$INDEX_NAME'" 
 }
 
+# Put back index settings left in the bulk-load profile by an interrupted indexer
+restore_index_settings() {
+    if [ -f "$BULK_SETTINGS_STATE_FILE" ] && [ ! -z "$ES_PID" ] && kill -0 $ES_PID 2>/dev/null; then
+        log_warn "Index '$INDEX_NAME' still has bulk-load settings, restoring..."
+        if python3 /capstor/scratch/cscs/anastasiia_kucherenko/index_attempt_1/my_indexer.py \
+            --restore-settings \
+            --es-host "$ES_HOST" \
+            --es-port "$ES_PORT" \
+            --index-name "$INDEX_NAME" \
+            --data-dir "$DATA_DIR" \
+            --settings-state-file "$BULK_SETTINGS_STATE_FILE"; then
+            log_success "Index settings restored"
+        else
+            log_error "Failed to restore index settings, originals kept in $BULK_SETTINGS_STATE_FILE"
+        fi
+    fi
+}
+
 # Function to cleanup on exit
 cleanup() {
     log_info "Cleaning up..."
+    restore_index_settings
     stop_elasticsearch
     show_index_location
 }
@@ -332,8 +450,9 @@ main() {
     log_info "Script: $0"
     log_info "Working directory: $(pwd)"
     
-    # Set trap for cleanup
+    # Set trap for cleanup (SLURM sends SIGTERM at the time limit)
     trap cleanup EXIT
+    trap 'exit 143' TERM INT
     
     # Show configuration
     show_configuration
@@ -341,6 +460,22 @@ main() {
     # System resource monitoring
     monitor_resources
     
+    # Finalize stage of a job array build: no data to index, only snapshots to combine
+    if [ "$INDEX_STAGE" = "finalize" ]; then
+        if ! start_elasticsearch; then
+            log_error "Failed to start Elasticsearch"
+            exit 1
+        fi
+        if run_finalize; then
+            log_success "=== Index $INDEX_NAME finalized ==="
+            show_index_location
+            exit 0
+        else
+            log_error "=== Finalize failed ==="
+            exit 1
+        fi
+    fi
+    
     # Validate data directory
     validate_data_directory
     
@@ -354,6 +489,13 @@ main() {
     if run_indexing; then
         log_success "=== Indexing process completed successfully ==="
         
+        if [ -n "$MANIFEST" ] && [ -n "$SNAPSHOT_REPO_DIR" ]; then
+            if ! snapshot_task_index; then
+                log_error "Snapshot of $INDEX_NAME failed"
+                exit 1
+            fi
+        fi
+        
         # Show where the index is stored
         show_index_location
         
@@ -12,10 +12,30 @@ import time
 import requests
 import sys
 import re 
-import statistics
+import os
+import signal
 from datetime import datetime
-from typing import Dict, List, Tuple, Any, Union
+from typing import Dict, List, Tuple, Any, Union, Callable, Iterable, Iterator
 import ast
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from es_transport import open_transport, JSON_BACKEND
+from result_stream import (StreamingResultWriter, RunningSummary, ProgressReporter, read_completed_results,
+                           DETAILED_FIELDNAMES, SUMMARY_FIELDNAMES)
+from query_source import iter_query_rows, count_rows, detect_format
+from query_cache import QueryResultCache
+from query_templates import Slot, QueryTemplate, CompiledQuery
+from hybrid_search import FUSION_METHODS, fuse_hits
+
+# What each search returns, cheapest last (see ElasticsearchQueryBenchmark._response_options)
+RESPONSE_PROFILES = ('full', 'snippets', 'ids', 'counts')
+
+WORD_PATTERN = re.compile(r'\b\w+\b')
+
+# Lexical query plus FAISS k-NN lookup, fused (see ElasticsearchQueryBenchmark._run_hybrid_query)
+HYBRID_QUERY_TYPE = 'hybrid_query'
+HYBRID_LEXICAL_QUERIES = ('match_query', 'match_phrase_query', 'fuzzy_query', 'bool_must_query')
 
 # TO DO:
 # REMOVE WILDCARD QUERY?
@@ -24,7 +44,21 @@ class ElasticsearchQueryBenchmark:
     def __init__(self, es_url: str, index_name: str, config: Dict[str, Any] = None):
         self.es_url = es_url.rstrip('/')
         self.index_name = index_name
+        # Only used when no result stream is open (e.g. library use of run_all_queries)
         self.results = []
+        self.result_writer = None
+        self.summary = RunningSummary()
+        # (segment_id, query_type) pairs already done by a previous run when resuming
+        self.completed = set()
+        self.query_cache = None
+        # Measured pass number in benchmark mode, 0 for a normal run
+        self.current_repetition = 0
+        # Query types compiled once (see _build_query_methods), keyed by type and parameters
+        self._compiled_queries = {}
+        self._query_methods = None
+        # Vector stage of hybrid queries (dense_index.DenseSearcher), loaded with the query plan
+        self._dense_searcher = None
+        self._vector_executor = None
 
         # Optimizations for large index (large timemout)
         self.request_timeout = 60  
@@ -42,7 +76,44 @@ class ElasticsearchQueryBenchmark:
             'match_phrase_slop': [0],  # Can be single value or list
             'bool_must_operator': 'and',  # 'and' or 'or'
             'bool_must_max_words': 3,  # Maximum words to use in bool query
-            'bool_must_minimum_should_match': None  # For 'or' operator
+            'bool_must_minimum_should_match': None,  # For 'or' operator
+            'concurrency_mode': 'serial',  # 'serial' or 'thread'
+            'max_in_flight': 4,  # Max concurrent requests in 'thread' mode
+            'http_pool_size': None,  # Pooled keep-alive connections, defaults to max_in_flight
+            'msearch_batch_size': 0,  # >1 packs that many (segment x query type) searches per _msearch
+            'flush_every_rows': 100,  # Flush streamed results after this many rows...
+            'flush_interval_s': 5,  # ...or after this many seconds, whichever comes first
+            'resume': False,  # Append to a previous run's output and skip work already done
+            'run_name': None,  # Stable output file name used for resumable runs
+            'row_start': 0,  # First data row of the query file to process (0-based)
+            'row_end': None,  # Stop before this data row (None = end of file)
+            'shard_index': None,  # Process every num_shards-th row starting at shard_index
+            'num_shards': None,
+            'progress_interval_s': 30,  # Seconds between progress lines
+            'verbose': False,  # Print a line per query (slow on shared filesystems)
+            'use_query_cache': True,  # Reuse responses of identical queries on an unchanged index
+            'query_cache_path': None,  # SQLite file, None = query_cache.sqlite next to the output directory
+            'query_cache_memory_entries': 10000,  # In-memory LRU size
+            'query_cache_clear': False,  # Drop cached entries of this index before running
+            'benchmark_mode': False,  # Warmup passes + repeated measured passes, JSON latency report
+            'warmup_rounds': 1,  # Unrecorded passes over the query file before measuring
+            'repetitions': 5,  # Measured passes over the query file
+            'request_cache': None,  # True/False sets ES request_cache per search, None = index default
+            'response_profile': 'full',  # 'full', 'snippets', 'ids' or 'counts', see _response_options
+            'response_top_k': 5,  # Hits returned by the 'snippets' and 'ids' profiles
+            'track_total_hits': None,  # True = exact counts, int = count up to that, None = profile default
+            'search_templates': False,  # Store the compiled queries as ES search templates, send only parameters
+            'execute_hybrid_query': False,  # Lexical query and FAISS k-NN lookup run concurrently, then fused
+            'hybrid_vector_index': None,  # FAISS index written by dense_index.py build
+            'hybrid_lexical_query': 'match_query',  # One of HYBRID_LEXICAL_QUERIES, first operator/slop
+            'hybrid_fusion': 'rrf',  # 'rrf' (reciprocal rank) or 'weighted' (normalized scores)
+            'hybrid_k': 10,  # Vector candidates per segment and fused hits kept
+            'hybrid_rrf_k': 60,  # RRF rank constant
+            'hybrid_lexical_weight': 0.5,  # Weight of the lexical side in 'weighted' fusion
+            'hybrid_nprobe': None,  # IVF lists probed, None = index default
+            'hybrid_ef_search': None,  # HNSW efSearch, None = index default
+            'hybrid_embedding_cache': None,  # Directory of segment embeddings kept across runs (embedding_cache.py)
+            'hybrid_model_dir': None  # Local copies of the query encoder, saved on first use
         }
         
         # Update with provided config
@@ -61,6 +132,28 @@ class ElasticsearchQueryBenchmark:
         if not isinstance(self.match_query_operator, list):
             self.match_query_operator = [self.match_query_operator]
         
+        if self.response_profile not in RESPONSE_PROFILES:
+            raise ValueError(f"Unknown response_profile '{self.response_profile}', "
+                             f"expected one of {', '.join(RESPONSE_PROFILES)}")
+        
+        if self.execute_hybrid_query:
+            if self.response_profile == 'counts':
+                raise ValueError("execute_hybrid_query needs lexical hits to fuse, "
+                                 "response_profile 'counts' returns none")
+            if not self.hybrid_vector_index:
+                raise ValueError("execute_hybrid_query needs hybrid_vector_index (a FAISS index from dense_index.py)")
+            if self.hybrid_fusion not in FUSION_METHODS:
+                raise ValueError(f"Unknown hybrid_fusion '{self.hybrid_fusion}', "
+                                 f"expected one of {', '.join(FUSION_METHODS)}")
+            if self.hybrid_lexical_query not in HYBRID_LEXICAL_QUERIES:
+                raise ValueError(f"Unknown hybrid_lexical_query '{self.hybrid_lexical_query}', "
+                                 f"expected one of {', '.join(HYBRID_LEXICAL_QUERIES)}")
+        
+        # Persistent pooled connections, sized so every in-flight request has its own socket
+        pool_size = self.http_pool_size or max(self.max_in_flight, 1)
+        # local:<parquet> selects the in-process backend instead of an ES cluster (local_backend.py)
+        self.transport = open_transport(self.es_url, pool_size=pool_size, timeout=self.request_timeout)
+        
         # Update query types to include variations
         self.query_types = [
             'match_query',
@@ -88,36 +181,42 @@ class ElasticsearchQueryBenchmark:
         elif len(self.match_phrase_slop) == 1 and self.match_phrase_slop[0] != 0:
             self.query_types.remove('match_phrase_query')
             self.query_types.append(f'match_phrase_query_slop_{self.match_phrase_slop[0]}')
+        
+        if self.execute_hybrid_query:
+            self.query_types.append(HYBRID_QUERY_TYPE)
 
+    def _log(self, message: str):
+        """Per-query output, only printed in verbose mode"""
+        if self.verbose:
+            print(message)
+    
     def _is_single_word(self, text: str) -> bool:
         """
         Check if the text contains only a single word (no spaces, punctuation creates separate tokens)
         """
-        # Remove punctuation and split into words
-        words = re.findall(r'\b\w+\b', text.strip())
-        return len(words) == 1
+        # Punctuation separates words; stop as soon as a second word is found
+        words = WORD_PATTERN.finditer(text)
+        return next(words, None) is not None and next(words, None) is None
          
-    def _make_request(self, method: str, endpoint: str, data: dict = None) -> Tuple[dict, float]:
-        """Make HTTP request to Elasticsearch and measure response time"""
-        url = f"{self.es_url}/{endpoint}"
-        headers = {
-            'Content-Type': 'application/json',
-            'Connection': 'keep-alive'  # Reuse connections
-        }
+    def _make_request(self, method: str, endpoint: str, data: Union[dict, bytes] = None,
+                      headers: Dict[str, str] = None) -> Tuple[dict, float]:
+        """
+        Make HTTP request to Elasticsearch through the pooled transport and measure response time.
+        Client-side phase timings are attached to the response under '_client_timings'.
+        """
+        # Encode once, reused across retries (data may already be pre-encoded bytes)
+        body = self.transport.encode(data)
         
         for attempt in range(self.max_retries):
             start_time = time.time()
             try:
-                if method.upper() == 'GET':
-                    response = requests.get(url, headers=headers, timeout=self.request_timeout)
-                elif method.upper() == 'POST':
-                    response = requests.post(url, headers=headers, json=data, timeout=self.request_timeout)
-                
-                end_time = time.time()
-                query_time = (end_time - start_time) * 1000
+                response, response_json, timings = self.transport.request(method, endpoint, body, headers)
+                query_time = timings['total_ms']
                 
                 response.raise_for_status()
-                return response.json(), query_time
+                if isinstance(response_json, dict):
+                    response_json['_client_timings'] = timings
+                return response_json, query_time
                 
             except requests.exceptions.Timeout:
                 if attempt < self.max_retries - 1:
@@ -134,11 +233,164 @@ class ElasticsearchQueryBenchmark:
                 query_time = (end_time - start_time) * 1000
                 print(f"Request failed: {e}")
                 return {"error": str(e)}, query_time
+    
+    def _search(self, query: Union[dict, None]) -> Tuple[dict, float]:
+        """Send a query body to the index; None means the query was skipped"""
+        if query is None:
+            return self._empty_response(), 0.0
+        
+        api = '_search/template' if self._is_template_call(query) else '_search'
+        if self.query_cache is None:
+            return self._make_request('POST', self._search_endpoint(api), query)
+        
+        start_time = time.perf_counter()
+        key = self.query_cache.key(query)
+        cached = self.query_cache.get(key)
+        if cached is not None:
+            cached['_cache_hit'] = True
+            return cached, (time.perf_counter() - start_time) * 1000
+        
+        response, query_time = self._make_request('POST', self._search_endpoint(api), query)
+        self.query_cache.put(key, response)
+        return response, query_time
+    
+    @staticmethod
+    def _is_template_call(query: dict) -> bool:
+        """Stored search template reference ({"id", "params"}) rather than a full query body"""
+        return "id" in query and "params" in query
+    
+    def _search_endpoint(self, api: str) -> str:
+        """Search endpoint of the index, with the request_cache override if configured"""
+        endpoint = f"{self.index_name}/{api}"
+        # The search template APIs take no request_cache parameter
+        if self.request_cache is not None and not api.endswith('/template'):
+            endpoint += f"?request_cache={'true' if self.request_cache else 'false'}"
+        return endpoint
+    
+    def _empty_response(self) -> dict:
+        """Empty result structure for skipped queries"""
+        return {
+            "hits": {"total": {"value": 0}, "max_score": None, "hits": []},
+            "took": 0,
+            "timed_out": False
+        }
+    
+    def _msearch(self, queries: List[dict]) -> Tuple[List[dict], float]:
+        """
+        Send several query bodies in one _msearch NDJSON request.
+        Returns one response dict per query, in the same order.
+        """
+        lines = []
+        header = self.transport.encode({})
+        for query in queries:
+            lines.append(header)
+            lines.append(self.transport.encode(query))
+        body = b'\n'.join(lines) + b'\n'
+        
+        api = '_msearch/template' if self._is_template_call(queries[0]) else '_msearch'
+        response, query_time = self._make_request('POST', self._search_endpoint(api), body,
+                                                  headers={'Content-Type': 'application/x-ndjson'})
+        if "error" in response:
+            # Whole batch failed: every query in it gets the same error
+            return [{"error": response["error"]} for _ in queries], query_time
+        
+        responses = response.get("responses", [])
+        if len(responses) != len(queries):
+            error = f"_msearch returned {len(responses)} responses for {len(queries)} queries"
+            return [{"error": error} for _ in queries], query_time
+        
+        timings = response.get('_client_timings', {})
+        for item in responses:
+            if "error" in item:
+                # Per-item failures come back as {"error": {...}, "status": ...}
+                item["error"] = json.dumps(item["error"]) if isinstance(item["error"], dict) else item["error"]
+            else:
+                item['_client_timings'] = timings
+        return responses, query_time
+    
+    def index_fingerprint(self) -> str:
+        """Identify the index contents: name, uuid (changes on re-create) and doc count"""
+        settings, _ = self._make_request('GET', f"{self.index_name}/_settings")
+        count, _ = self._make_request('GET', f"{self.index_name}/_count")
+        if "error" in settings or "error" in count:
+            raise RuntimeError(f"cannot read settings/count of index '{self.index_name}'")
+        
+        index_settings = next(iter(settings.values()), {}).get('settings', {}).get('index', {})
+        return f"{self.index_name}:{index_settings.get('uuid', 'unknown')}:{count.get('count', 0)}"
+    
+    def open_query_cache(self, path: str):
+        """Enable the result cache for the current index contents"""
+        try:
+            fingerprint = self.index_fingerprint()
+        except Exception as e:
+            print(f"Query cache disabled: {e}")
+            return
+        
+        self.query_cache = QueryResultCache(path, fingerprint, max_memory_entries=self.query_cache_memory_entries)
+        if self.query_cache_clear:
+            self.query_cache.clear()
+        print(f"Query cache: {path} (index fingerprint {fingerprint})")
+    
+    def close(self):
+        """Release pooled HTTP connections, the query cache and the vector search thread"""
+        if self._vector_executor is not None:
+            self._vector_executor.shutdown()
+            if self.hybrid_embedding_cache:
+                print(self._dense_searcher.encoder.cache.stats_line())
+        if self.query_cache is not None:
+            print(self.query_cache.stats_line())
+            self.query_cache.close()
+        self.transport.close()
 
-    def match_query(self, text: str, operator: str = 'or') -> Tuple[dict, float]:
+    def _response_options(self, size: int, fragment_size: int = 150, number_of_fragments: int = 3,
+                          source: Union[list, None] = ('url',)) -> dict:
+        """
+        size/_source/track_total_hits/highlight part of a query body for the response profile.
+        'full' keeps each builder's own size and highlight settings, 'snippets' highlights only
+        the top response_top_k hits, 'ids' returns hit ids and scores without _source or
+        highlighting, 'counts' returns no hits at all, just took and an exact total.
+        """
+        profile = self.response_profile
+        if profile == 'counts':
+            return {
+                "size": 0,
+                "_source": False,
+                "track_total_hits": True if self.track_total_hits is None else self.track_total_hits
+            }
+        
+        options = {"size": size if profile == 'full' else self.response_top_k}
+        if profile == 'ids':
+            options["_source"] = False
+        elif source is not None:
+            # Don't return full text source, just highlights, and yes url
+            options["_source"] = list(source)
+        if self.track_total_hits is not None:
+            options["track_total_hits"] = self.track_total_hits
+        if profile != 'ids':
+            options["highlight"] = {
+                "fields": {
+                    "text": {
+                        "fragment_size": fragment_size,
+                        "number_of_fragments": number_of_fragments,
+                        "pre_tags": ["<MATCH>"],
+                        "post_tags": ["</MATCH>"],
+                        "require_field_match": True
+                    }
+                }
+            }
+        return options
+
+    def _compiled(self, key: tuple, compile_query: Callable[..., CompiledQuery], *args) -> CompiledQuery:
+        """Compile a query type once per parameter set; later segments only fill its templates"""
+        compiled = self._compiled_queries.get(key)
+        if compiled is None:
+            compiled = self._compiled_queries[key] = compile_query(*args)
+        return compiled
+
+    def compile_match_query(self, operator: str = 'or') -> CompiledQuery:
         """Standard match query using the main text field with configurable operator"""
         match_config = {
-            "query": text
+            "query": Slot('text')
         }
         
         # Add operator if not default 'or'
@@ -151,27 +403,23 @@ class ElasticsearchQueryBenchmark:
                     "text": match_config
                 }
             },
-            "size": 50,
-            "_source": ["url"],  # Don't return full text source, just highlights, and yes url
-            "highlight": {
-                "fields": {
-                    "text": {
-                        "fragment_size": 150,
-                        "number_of_fragments": 3,
-                        "pre_tags": ["<MATCH>"],
-                        "post_tags": ["</MATCH>"],
-                        "require_field_match": True
-                    }
-                }
-            },
+            **self._response_options(50),
             "timeout": "30s"  # Query timeout
         }
-        return self._make_request('POST', f"{self.index_name}/_search", query)
+        name = f'match_query_{operator.lower()}'
+        return CompiledQuery(name, {name: QueryTemplate(name, query)}, lambda text: (name, {'text': text}))
+
+    def build_match_query(self, text: str, operator: str = 'or') -> Union[dict, None]:
+        return self._compiled(('match_query', operator), self.compile_match_query, operator).build(text)
+
+    def match_query(self, text: str, operator: str = 'or') -> Tuple[dict, float]:
+        """Run build_match_query against the index"""
+        return self._search(self.build_match_query(text, operator))
     
-    def match_phrase_query(self, text: str, slop: int = 0) -> Tuple[dict, float]:
+    def compile_match_phrase_query(self, slop: int = 0) -> CompiledQuery:
         """Match phrase query for exact phrase matching with configurable slop"""
         match_phrase_config = {
-            "query": text
+            "query": Slot('text')
         }
         
         # Add slop parameter if not 0
@@ -184,209 +432,157 @@ class ElasticsearchQueryBenchmark:
                     "text": match_phrase_config  # If set to text.exact, unable to retrieve highlights on text field or text.exact field. set to text and correct highlights
                 }
             },
-            "size": 50,
-            "_source": ["url"],
-            "highlight": {
-                "fields": {
-                    "text": {
-                        "fragment_size": 150,
-                        "number_of_fragments": 3,
-                        "pre_tags": ["<MATCH>"],
-                        "post_tags": ["</MATCH>"],
-                        "require_field_match": True
-                    }
-                }
-            },
+            **self._response_options(50),
             "timeout": "30s"  # Query timeout
         }
-        return self._make_request('POST', f"{self.index_name}/_search", query)
+        name = f'match_phrase_query_slop_{slop}'
+        return CompiledQuery(name, {name: QueryTemplate(name, query)}, lambda text: (name, {'text': text}))
+
+    def build_match_phrase_query(self, text: str, slop: int = 0) -> Union[dict, None]:
+        return self._compiled(('match_phrase_query', slop), self.compile_match_phrase_query, slop).build(text)
+
+    def match_phrase_query(self, text: str, slop: int = 0) -> Tuple[dict, float]:
+        """Run build_match_phrase_query against the index"""
+        return self._search(self.build_match_phrase_query(text, slop))
         
-    def term_query_exact(self, text: str) -> Tuple[dict, float]:
+    def compile_term_query_exact(self) -> CompiledQuery:
         """Term query - ONLY executes on single words, returns empty result for multi-word"""
-        
-        if not self._is_single_word(text):
-            print(f"    SKIPPING term_query_exact for multi-word text: '{text[:50]}...'")
-            print(f"    Returning empty result (no fallback)")
-            # Return empty result structure
-            return {
-                "hits": {"total": {"value": 0}, "max_score": None, "hits": []},
-                "took": 0,
-                "timed_out": False
-            }, 0.0
-        else:
-            print(f"    Executing term_query_exact on single word: '{text}'")
-            query = {
-                "query": {
-                    "term": {
-                        "text.exact": text.lower()
-                    }
-                },
-                "size": 100,
-                "_source": ["url"],
-                "highlight": {
-                    "fields": {
-                        "text": {
-                            "fragment_size": 200,
-                            "number_of_fragments": 5,
-                            "pre_tags": ["<MATCH>"],
-                            "post_tags": ["</MATCH>"],
-                            "require_field_match": True
-                        }
-                    }
+        query = {
+            "query": {
+                "term": {
+                    "text.exact": Slot('term')
                 }
-            }
-            
-            return self._make_request('POST', f"{self.index_name}/_search", query)
+            },
+            **self._response_options(100, fragment_size=200, number_of_fragments=5)
+        }
+        
+        def select(text: str):
+            if not self._is_single_word(text):
+                self._log(f"    SKIPPING term_query_exact for multi-word text: '{text[:50]}...'")
+                self._log(f"    Returning empty result (no fallback)")
+                # No query to send, _search returns an empty result structure
+                return None
+            self._log(f"    Executing term_query_exact on single word: '{text}'")
+            return 'term_query_exact', {'term': text.lower()}
+        
+        return CompiledQuery('term_query_exact', {'term_query_exact': QueryTemplate('term_query_exact', query)},
+                             select)
+
+    def build_term_query_exact(self, text: str) -> Union[dict, None]:
+        return self._compiled(('term_query_exact',), self.compile_term_query_exact).build(text)
+
+    def term_query_exact(self, text: str) -> Tuple[dict, float]:
+        """Run build_term_query_exact against the index"""
+        return self._search(self.build_term_query_exact(text))
       
-    def wildcard_query(self, text: str) -> Tuple[dict, float]:
+    def compile_wildcard_query(self) -> CompiledQuery:
         """Wildcard query - ONLY executes on single words, returns empty result for multi-word"""
-        
-        if not self._is_single_word(text):
-            print(f"    SKIPPING wildcard_query for multi-word text: '{text[:50]}...'")
-            print(f"    Returning empty result (no fallback)")
-            # Return empty result structure
-            return {
-                "hits": {"total": {"value": 0}, "max_score": None, "hits": []},
-                "took": 0,
-                "timed_out": False
-            }, 0.0
-        else:
-            print(f"    Executing wildcard_query on single word: '{text}'")
-            wildcard_text = f"*{text.lower()}*"
-            query = {
-                "query": {
-                    "wildcard": {
-                        "text.exact": wildcard_text
-                    }
-                },
-                "size": 100,
-                "highlight": {
-                    "fields": {
-                        "text": {
-                            "fragment_size": 200,
-                            "number_of_fragments": 5,
-                            "pre_tags": ["<MATCH>"],
-                            "post_tags": ["</MATCH>"],
-                            "require_field_match": True
-                        }
-                    }
+        query = {
+            "query": {
+                "wildcard": {
+                    "text.exact": Slot('pattern')
                 }
-            }
-            
-            return self._make_request('POST', f"{self.index_name}/_search", query)
+            },
+            **self._response_options(100, fragment_size=200, number_of_fragments=5, source=None)
+        }
+        
+        def select(text: str):
+            if not self._is_single_word(text):
+                self._log(f"    SKIPPING wildcard_query for multi-word text: '{text[:50]}...'")
+                self._log(f"    Returning empty result (no fallback)")
+                # No query to send, _search returns an empty result structure
+                return None
+            self._log(f"    Executing wildcard_query on single word: '{text}'")
+            return 'wildcard_query', {'pattern': f"*{text.lower()}*"}
+        
+        return CompiledQuery('wildcard_query', {'wildcard_query': QueryTemplate('wildcard_query', query)}, select)
+
+    def build_wildcard_query(self, text: str) -> Union[dict, None]:
+        return self._compiled(('wildcard_query',), self.compile_wildcard_query).build(text)
+
+    def wildcard_query(self, text: str) -> Tuple[dict, float]:
+        """Run build_wildcard_query against the index"""
+        return self._search(self.build_wildcard_query(text))
      
 
-    def fuzzy_query(self, text: str) -> Tuple[dict, float]:
+    def compile_fuzzy_query(self) -> CompiledQuery:
         """Fuzzy query - ONLY executes on single words, uses multi_match fallback for multi-word"""
+        multi_word = {
+            "query": {
+                "multi_match": {
+                    "query": Slot('text'),
+                    "fields": ["text"],
+                    "fuzziness": "AUTO",  
+                    "operator": "or",
+                    "max_expansions": 50,  # Limit term expansions (can be too much pressure)
+                    "minimum_should_match": Slot('minimum_should_match')
+                }
+            },
+            **self._response_options(50),
+            "timeout": "30s"
+        }
+        single_word = {
+            "query": {
+                "fuzzy": {
+                    "text": {
+                        "value": Slot('text'),
+                        "fuzziness": "AUTO"
+                    }
+                }
+            },
+            **self._response_options(50)
+        }
         
-        if not self._is_single_word(text):
+        def select(text: str):
+            if self._is_single_word(text):
+                self._log(f"    Executing fuzzy_query on single word: '{text}'")
+                return 'fuzzy_query_single', {'text': text}
+            
             words = text.split()
-            query_text = " ".join(words)
-            print(f"    SKIPPING fuzzy_query for multi-word text: '{text[:50]}...'")
-            print(f"    Using multi_match with fuzziness fallback instead")
+            word_count = len(words)
+            self._log(f"    SKIPPING fuzzy_query for multi-word text: '{text[:50]}...'")
+            self._log(f"    Using multi_match with fuzziness fallback instead")
             if word_count <= 2:
                 min_should_match = "100%"    # Short queries: all words
             elif word_count <= 4: 
                 min_should_match = "75%"     # Medium queries: most words
             else:
                 min_should_match = "60%"     # Long queries: majority of words
-            
-           
-            query = {
-                "query": {
-                    "multi_match": {
-                        "query": query_text,
-                        "fields": ["text"],
-                        "fuzziness": "AUTO",  
-                        "operator": "or",
-                        "max_expansions": 50,  # Limit term expansions (can be too much pressure)
-                        "minimum_should_match": min_should_match
-                    }
-                },
-                "size": 50,
-                "_source": ["url"],
-                "highlight": {
-                    "fields": {
-                        "text": {
-                            "fragment_size": 150,
-                            "number_of_fragments": 3,
-                            "pre_tags": ["<MATCH>"],
-                            "post_tags": ["</MATCH>"],
-                            "require_field_match": True
-                        }
-                    }
-                },
-                "timeout": "30s"
-            }
-        else:
-            print(f"    Executing fuzzy_query on single word: '{text}'")
-            query = {
-                "query": {
-                    "fuzzy": {
-                        "text": {
-                            "value": text,
-                            "fuzziness": "AUTO"
-                        }
-                    }
-                },
-                "size": 50,
-                "_source": ["url"],
-                "highlight": {
-                    "fields": {
-                        "text": {
-                            "fragment_size": 150,
-                            "number_of_fragments": 3,
-                            "pre_tags": ["<MATCH>"],
-                            "post_tags": ["</MATCH>"],
-                            "require_field_match": True
-                        }
-                    }
-                }
-            }
-        return self._make_request('POST', f"{self.index_name}/_search", query)
+            return 'fuzzy_query_multi', {'text': " ".join(words), 'minimum_should_match': min_should_match}
+        
+        return CompiledQuery('fuzzy_query', {
+            'fuzzy_query_single': QueryTemplate('fuzzy_query_single', single_word),
+            'fuzzy_query_multi': QueryTemplate('fuzzy_query_multi', multi_word)
+        }, select)
+
+    def build_fuzzy_query(self, text: str) -> Union[dict, None]:
+        return self._compiled(('fuzzy_query',), self.compile_fuzzy_query).build(text)
+
+    def fuzzy_query(self, text: str) -> Tuple[dict, float]:
+        """Run build_fuzzy_query against the index"""
+        return self._search(self.build_fuzzy_query(text))
         
     
-    def bool_must_query(self, text: str) -> Tuple[dict, float]:
+    def compile_bool_must_query(self) -> CompiledQuery:
         """Boolean query with configurable parameters"""
         if self.bool_must_operator.lower() == 'and':
             # For AND: limit words to avoid too complex queries
-            words = text.split()[:self.bool_must_max_words]
-            if len(words) < 2:
-                words = [text, text]  # Duplicate if single word
-            
-            must_clauses = [{"match": {"text": word}} for word in words]
+            max_words = self.bool_must_max_words
             # fallsback to a simple match prhase query, not FUN
             # see what more complex stuff you can do
             query = {
                 "query": {
                     "bool": {
-                        "must": must_clauses
+                        "must": Slot('clauses')
                     }
                 },
-                "size": 50,
-                "_source": ["url"],
-                "highlight": {
-                    "fields": {
-                        "text": {
-                            "fragment_size": 150,
-                            "number_of_fragments": 3,
-                            "pre_tags": ["<MATCH>"],
-                            "post_tags": ["</MATCH>"],
-                            "require_field_match": True
-                        }
-                    }
-                }
+                **self._response_options(50)
             }
         else:
             # For OR: use all words, don't limit upfront
-            words = text.split()
-            if len(words) < 2:
-                words = [text, text]  # Duplicate if single word
-            
-            should_clauses = [{"match": {"text": word}} for word in words]
-            
+            max_words = None
             bool_query = {
-                "should": should_clauses
+                "should": Slot('clauses')
             }
             
             # Add minimum_should_match if specified
@@ -397,22 +593,23 @@ class ElasticsearchQueryBenchmark:
                 "query": {
                     "bool": bool_query
                 },
-                "size": 50,
-                "_source": ["url"],
-                "highlight": {
-                    "fields": {
-                        "text": {
-                            "fragment_size": 150,
-                            "number_of_fragments": 3,
-                            "pre_tags": ["<MATCH>"],
-                            "post_tags": ["</MATCH>"],
-                            "require_field_match": True
-                        }
-                    }
-                }
+                **self._response_options(50)
             }
+        
+        def select(text: str):
+            words = text.split()[:max_words]
+            if len(words) < 2:
+                words = [text, text]  # Duplicate if single word
+            return 'bool_must_query', {'clauses': [{"match": {"text": word}} for word in words]}
             
-        return self._make_request('POST', f"{self.index_name}/_search", query)
+        return CompiledQuery('bool_must_query', {'bool_must_query': QueryTemplate('bool_must_query', query)}, select)
+
+    def build_bool_must_query(self, text: str) -> Union[dict, None]:
+        return self._compiled(('bool_must_query',), self.compile_bool_must_query).build(text)
+
+    def bool_must_query(self, text: str) -> Tuple[dict, float]:
+        """Run build_bool_must_query against the index"""
+        return self._search(self.build_bool_must_query(text))
     
     def extract_hit_snippets(self, hits_data: list, max_hits: int = 5) -> str:
         """Extract top N hit snippets with scores and highlighting"""
@@ -433,12 +630,16 @@ class ElasticsearchQueryBenchmark:
                 highlighted_fragments = hit['highlight']['text']
                 text_snippet = ' | '.join(highlighted_fragments)
                 snippet_source = "HIGHLIGHTED"
-            else:
+            elif hit.get('_source', {}).get('text'):
                 # Fallback to source text if highlighting failed
-                source_text = hit.get('_source', {}).get('text', '')
+                source_text = hit['_source']['text']
                 # For fallback, try to find query terms in the text
                 text_snippet = source_text[:300] + ('...' if len(source_text) > 300 else '')
                 snippet_source = "SOURCE_TEXT"
+            else:
+                # 'ids' response profile: no source or highlight was requested
+                text_snippet = f"_id={hit.get('_id', '')}"
+                snippet_source = "ID"
             
             # Clean up the snippet (remove extra whitespace and newlines)
             text_snippet = ' '.join(text_snippet.split())
@@ -458,7 +659,8 @@ class ElasticsearchQueryBenchmark:
                 "took_ms": 0,
                 "timed_out": False,
                 "error": response["error"],
-                "hit_snippets": ""
+                "hit_snippets": "",
+                "client_timings": {}
             }
         
         hits = response.get("hits", {})
@@ -470,15 +672,13 @@ class ElasticsearchQueryBenchmark:
             "took_ms": response.get("took", 0),
             "timed_out": response.get("timed_out", False),
             "error": None,
-            "hit_snippets": self.extract_hit_snippets(hits_data)
+            "hit_snippets": self.extract_hit_snippets(hits_data),
+            "client_timings": response.get("_client_timings", {})
         }
     
-    def run_all_queries(self, segment_text: str, row_id: str, segment_id: str) -> List[dict]:
-        """Run all enabled query types for a given segment text"""
-        query_results = []
-        
-        # Build query methods based on configuration
-        query_methods = {}
+    def compile_query_plan(self) -> Dict[str, CompiledQuery]:
+        """Compile every enabled query type once from the config, in execution order"""
+        plan = {}
         
         if self.execute_match_query:
             # Handle multiple operators
@@ -487,205 +687,557 @@ class ElasticsearchQueryBenchmark:
                     query_name = 'match_query'
                 else:
                     query_name = f'match_query_{operator}'
-                query_methods[query_name] = lambda text, op=operator: self.match_query(text, op)
+                plan[query_name] = self._compiled(('match_query', operator), self.compile_match_query, operator)
             
         if self.execute_match_phrase_query:
-            # Handle multiple slop values
+            # Handle multiple slop values, named like self.query_types
             for slop in self.match_phrase_slop:
-                if slop == 0:
+                if slop == 0 and len(self.match_phrase_slop) == 1:
                     query_name = 'match_phrase_query'
                 else:
                     query_name = f'match_phrase_query_slop_{slop}'
-                query_methods[query_name] = lambda text, s=slop: self.match_phrase_query(text, s)
+                plan[query_name] = self._compiled(('match_phrase_query', slop), self.compile_match_phrase_query, slop)
                 
         if self.execute_term_query_exact:
-            query_methods['term_query_exact'] = lambda text: self.term_query_exact(text)
+            plan['term_query_exact'] = self._compiled(('term_query_exact',), self.compile_term_query_exact)
             
         if self.execute_wildcard_query:
-            query_methods['wildcard_query'] = lambda text: self.wildcard_query(text)
+            plan['wildcard_query'] = self._compiled(('wildcard_query',), self.compile_wildcard_query)
             
         if self.execute_fuzzy_query:
-            query_methods['fuzzy_query'] = lambda text: self.fuzzy_query(text)
+            plan['fuzzy_query'] = self._compiled(('fuzzy_query',), self.compile_fuzzy_query)
             
         if self.execute_bool_must_query:
-            query_methods['bool_must_query'] = lambda text: self.bool_must_query(text)
+            plan['bool_must_query'] = self._compiled(('bool_must_query',), self.compile_bool_must_query)
+        
+        if self.execute_hybrid_query:
+            plan[HYBRID_QUERY_TYPE] = self.compile_hybrid_lexical_query()
         
-        for query_type, method in query_methods.items():
-            print(f"  Running {query_type}...")
+        return plan
+    
+    def compile_hybrid_lexical_query(self) -> CompiledQuery:
+        """
+        Lexical side of the hybrid query: the same compiled query (and cache entries) as the
+        plain query type, so hybrid rows compare directly with it. Where that returns fewer
+        than hybrid_k hits (e.g. response_top_k of the 'snippets' and 'ids' profiles), its
+        templates are copied with size hybrid_k, so fusion ranks as many candidates per side.
+        """
+        if self.hybrid_lexical_query == 'match_query':
+            operator = self.match_query_operator[0]
+            compiled = self._compiled(('match_query', operator), self.compile_match_query, operator)
+        elif self.hybrid_lexical_query == 'match_phrase_query':
+            slop = self.match_phrase_slop[0]
+            compiled = self._compiled(('match_phrase_query', slop), self.compile_match_phrase_query, slop)
+        elif self.hybrid_lexical_query == 'fuzzy_query':
+            compiled = self._compiled(('fuzzy_query',), self.compile_fuzzy_query)
+        else:
+            compiled = self._compiled(('bool_must_query',), self.compile_bool_must_query)
+        if all(template.body['size'] >= self.hybrid_k for template in compiled.templates.values()):
+            return compiled
+        templates = {variant: QueryTemplate(f"{template.name}_hybrid", {**template.body, 'size': self.hybrid_k})
+                     if template.body['size'] < self.hybrid_k else template
+                     for variant, template in compiled.templates.items()}
+        return CompiledQuery(HYBRID_QUERY_TYPE, templates, compiled.select)
+    
+    def open_vector_search(self):
+        """Load the FAISS index and query encoder of the hybrid query type"""
+        from dense_index import DenseSearcher
+        
+        start_time = time.perf_counter()
+        self._dense_searcher = DenseSearcher(self.hybrid_vector_index, nprobe=self.hybrid_nprobe,
+                                             ef_search=self.hybrid_ef_search,
+                                             cache_dir=self.hybrid_embedding_cache,
+                                             model_dir=self.hybrid_model_dir)
+        # One thread: the tokenizer is not safe for concurrent use, and torch/FAISS use every core
+        # for a batch anyway. It runs next to the request threads, so both stages overlap
+        self._vector_executor = ThreadPoolExecutor(max_workers=1)
+        info = self._dense_searcher.info
+        print(f"Hybrid query: {info['index_type']} index of {info['rows']} vectors ({info['model']}) loaded in "
+              f"{time.perf_counter() - start_time:.1f}s, fusion {self.hybrid_fusion}, "
+              f"lexical side {self.hybrid_lexical_query}")
+    
+    def _vector_search(self, texts: List[str]) -> Tuple[List[List[dict]], float]:
+        """k-NN hits of each text (documents collapsed) and the stage time in ms"""
+        start_time = time.perf_counter()
+        hits = self._dense_searcher.search(texts, self.hybrid_k)
+        return hits, (time.perf_counter() - start_time) * 1000
+    
+    def _fuse_response(self, lexical_response: dict, lexical_ms: float, vector_hits: List[dict],
+                       vector_ms: float) -> dict:
+        """ES-shaped response of a hybrid query, with the per-stage times under '_stages'"""
+        if "error" in lexical_response:
+            return lexical_response
+        
+        start_time = time.perf_counter()
+        fused, candidates = fuse_hits(lexical_response.get("hits", {}).get("hits", []), vector_hits,
+                                      self.hybrid_fusion, self.hybrid_k, self.hybrid_rrf_k,
+                                      self.hybrid_lexical_weight)
+        fusion_ms = (time.perf_counter() - start_time) * 1000
+        return {
+            "hits": {"total": {"value": candidates}, "max_score": fused[0]['_score'] if fused else None,
+                     "hits": fused},
+            "took": lexical_response.get("took", 0),
+            "timed_out": lexical_response.get("timed_out", False),
+            "_client_timings": lexical_response.get("_client_timings", {}),
+            "_cache_hit": lexical_response.get("_cache_hit", False),
+            "_stages": {"lexical_ms": lexical_ms, "vector_ms": vector_ms, "fusion_ms": fusion_ms}
+        }
+    
+    def register_search_templates(self, plan: Dict[str, CompiledQuery]) -> bool:
+        """Store every template of the plan under _scripts/<template_id>; False if any failed"""
+        # The hybrid query shares its lexical templates with the plain query type
+        templates = list({template.template_id: template for compiled in plan.values()
+                          for template in compiled.templates.values()}.values())
+        for template in templates:
+            body = {"script": {"lang": "mustache", "source": template.source}}
+            response, _ = self._make_request('PUT', f"_scripts/{template.template_id}", body)
+            if "error" in response:
+                print(f"Registering search template {template.template_id} failed: {response['error']}")
+                return False
+        print(f"Registered {len(templates)} search templates, sending parameters only")
+        if self.request_cache is not None:
+            print("Search templates: request_cache override is not supported and is ignored")
+        return True
+    
+    def _build_query_methods(self) -> Dict[str, Callable[[str], Union[dict, None]]]:
+        """
+        Ordered mapping of enabled query types to their query body builders. The query
+        types are compiled on first use and reused for every segment afterwards.
+        """
+        if self._query_methods is None:
+            plan = self.compile_query_plan()
+            if self.execute_hybrid_query and self._dense_searcher is None:
+                self.open_vector_search()
+            if self.search_templates and not self.register_search_templates(plan):
+                print("Falling back to full query bodies")
+                self.search_templates = False
+            self._query_methods = {
+                query_name: compiled.build_template_call if self.search_templates else compiled.build
+                for query_name, compiled in plan.items()
+            }
+        return self._query_methods
+    
+    def _build_result(self, work_item: tuple, response: dict, query_time: float) -> dict:
+        """Turn one ES response into a result row attributed to its segment"""
+        row_id, segment_id, segment_text, query_type, _ = work_item
+        stats = self.extract_response_stats(response)
+        timings = stats['client_timings']
+        stages = response.get('_stages', {})
+        
+        return {
+            'timestamp': datetime.now().isoformat(),
+            'row_id': row_id,
+            'segment_id': segment_id,
+            'segment_text': segment_text,
+            'query_type': query_type,
+            'repetition': self.current_repetition,
+            'query_time_ms': round(query_time, 2),
+            'connect_ms': round(timings.get('connect_ms', 0), 2),
+            'send_ms': round(timings.get('send_ms', 0), 2),
+            'server_ms': round(timings.get('server_ms', 0), 2),
+            'parse_ms': round(timings.get('parse_ms', 0), 2),
+            'es_took_ms': stats['took_ms'],
+            # Hybrid queries only: stage times (query_time_ms is their overlapped wall time plus fusion)
+            'lexical_ms': round(stages['lexical_ms'], 2) if stages else None,
+            'vector_ms': round(stages['vector_ms'], 2) if stages else None,
+            'fusion_ms': round(stages['fusion_ms'], 3) if stages else None,
+            'total_hits': stats['total_hits'],
+            'max_score': stats['max_score'],
+            'timed_out': stats['timed_out'],
+            'cache_hit': bool(response.get('_cache_hit')),
+            'error': stats['error'],
+            'top_5_hits': stats['hit_snippets']
+        }
+    
+    def _build_error_result(self, work_item: tuple, error: Exception) -> dict:
+        """Result row for a query that raised before producing a response"""
+        row_id, segment_id, segment_text, query_type, _ = work_item
+        print(f"    Error in {query_type}: {error}")
+        return {
+            'timestamp': datetime.now().isoformat(),
+            'row_id': row_id,
+            'segment_id': segment_id,
+            'segment_text': segment_text,
+            'query_type': query_type,
+            'repetition': self.current_repetition,
+            'query_time_ms': 0,
+            'connect_ms': 0,
+            'send_ms': 0,
+            'server_ms': 0,
+            'parse_ms': 0,
+            'es_took_ms': 0,
+            'lexical_ms': None,
+            'vector_ms': None,
+            'fusion_ms': None,
+            'total_hits': 0,
+            'max_score': 0,
+            'timed_out': False,
+            'cache_hit': False,
+            'error': str(error),
+            'top_5_hits': ''
+        }
+    
+    def _run_single_query(self, work_item: tuple) -> dict:
+        """Execute one (segment, query_type) work item and build its result row"""
+        _, segment_id, segment_text, query_type, builder = work_item
+        self._log(f"  Running {query_type} for segment {segment_id}...")
+        if query_type == HYBRID_QUERY_TYPE:
+            return self._run_hybrid_query(work_item)
+        
+        try:
+            response, query_time = self._search(builder(segment_text))
+            return self._build_result(work_item, response, query_time)
+        except Exception as e:
+            return self._build_error_result(work_item, e)
+    
+    def _run_hybrid_query(self, work_item: tuple) -> dict:
+        """
+        Hybrid work item: the k-NN lookup is handed to the vector thread, the lexical search
+        runs meanwhile on this thread, then both result lists are fused
+        """
+        _, _, segment_text, _, builder = work_item
+        try:
+            start_time = time.perf_counter()
+            vector_future = self._vector_executor.submit(self._vector_search, [segment_text])
+            lexical_response, lexical_ms = self._search(builder(segment_text))
+            vector_hits, vector_ms = vector_future.result()
+            response = self._fuse_response(lexical_response, lexical_ms, vector_hits[0], vector_ms)
+            return self._build_result(work_item, response, (time.perf_counter() - start_time) * 1000)
+        except Exception as e:
+            return self._build_error_result(work_item, e)
+    
+    def _run_batch(self, work_items: List[tuple]) -> List[dict]:
+        """
+        Execute a batch of work items as one _msearch request.
+        query_time_ms and client phase timings are amortized over the queries in the batch,
+        es_took_ms is the per-query 'took' reported by ES. The lexical searches of hybrid
+        work items go into the same _msearch, while their texts are embedded and looked up
+        in one batch on the vector thread.
+        """
+        results = [None] * len(work_items)
+        queries = []
+        positions = []
+        cache_keys = []
+        # Hybrid work items: lexical (response, ms) collected here, fused once the vector batch is done
+        hybrid = [i for i, work_item in enumerate(work_items) if work_item[3] == HYBRID_QUERY_TYPE]
+        lexical = {}
+        if hybrid:
+            vector_future = self._vector_executor.submit(self._vector_search, [work_items[i][2] for i in hybrid])
+        
+        def finish(i: int, response: dict, query_time: float):
+            if work_items[i][3] == HYBRID_QUERY_TYPE:
+                lexical[i] = (response, query_time)
+            else:
+                results[i] = self._build_result(work_items[i], response, query_time)
+        
+        for i, work_item in enumerate(work_items):
+            _, _, segment_text, _, builder = work_item
+            try:
+                query = builder(segment_text)
+            except Exception as e:
+                results[i] = self._build_error_result(work_item, e)
+                continue
+            if query is None:
+                finish(i, self._empty_response(), 0.0)
+                continue
             
+            if self.query_cache is not None:
+                # Cache hits are answered locally, only misses go into the _msearch body
+                start_time = time.perf_counter()
+                key = self.query_cache.key(query)
+                cached = self.query_cache.get(key)
+                if cached is not None:
+                    cached['_cache_hit'] = True
+                    finish(i, cached, (time.perf_counter() - start_time) * 1000)
+                    continue
+                cache_keys.append(key)
+            queries.append(query)
+            positions.append(i)
+        
+        if queries:
+            self._log(f"  Running _msearch batch of {len(queries)} queries...")
             try:
-                response, query_time = method(segment_text)
-                stats = self.extract_response_stats(response)
-                
-                result = {
-                    'timestamp': datetime.now().isoformat(),
-                    'row_id': row_id,
-                    'segment_id': segment_id,
-                    'segment_text': segment_text,
-                    'query_type': query_type,
-                    'query_time_ms': round(query_time, 2),
-                    'es_took_ms': stats['took_ms'],
-                    'total_hits': stats['total_hits'],
-                    'max_score': stats['max_score'],
-                    'timed_out': stats['timed_out'],
-                    'error': stats['error'],
-                    'top_5_hits': stats['hit_snippets']
-                }
-                
-                query_results.append(result)
-                self.results.append(result)
-                
+                responses, batch_time = self._msearch(queries)
+                share = len(queries)
+                if self.query_cache is not None:
+                    for key, response in zip(cache_keys, responses):
+                        self.query_cache.put(key, response)
+                for i, response in zip(positions, responses):
+                    timings = response.get('_client_timings')
+                    if timings:
+                        response['_client_timings'] = {k: v / share for k, v in timings.items()}
+                    finish(i, response, batch_time / share)
             except Exception as e:
-                print(f"    Error in {query_type}: {e}")
-                error_result = {
-                    'timestamp': datetime.now().isoformat(),
-                    'row_id': row_id,
-                    'segment_id': segment_id,
-                    'segment_text': segment_text,
-                    'query_type': query_type,
-                    'query_time_ms': 0,
-                    'es_took_ms': 0,
-                    'total_hits': 0,
-                    'max_score': 0,
-                    'timed_out': False,
-                    'error': str(e),
-                    'top_5_hits': ''
-                }
-                query_results.append(error_result)
-                self.results.append(error_result)
+                for i in positions:
+                    results[i] = self._build_error_result(work_items[i], e)
         
+        if hybrid:
+            try:
+                vector_hits, vector_ms = vector_future.result()
+                for i, hits in zip(hybrid, vector_hits):
+                    if i not in lexical:
+                        continue  # Failed before the lexical stage
+                    lexical_response, lexical_ms = lexical[i]
+                    response = self._fuse_response(lexical_response, lexical_ms, hits, vector_ms / len(hybrid))
+                    stages = response.get('_stages', {})
+                    # The stages overlap: the slower one plus fusion is the query's share of the batch
+                    query_time = max(lexical_ms, stages.get('vector_ms', 0)) + stages.get('fusion_ms', 0)
+                    results[i] = self._build_result(work_items[i], response, query_time)
+            except Exception as e:
+                for i in hybrid:
+                    if results[i] is None:
+                        results[i] = self._build_error_result(work_items[i], e)
+        
+        return results
+    
+    def _iter_work_items(self, segments: Iterable[Tuple[str, str, str]]) -> Iterator[tuple]:
+        """Fan out (row_id, segment_id, segment_text) into one work item per enabled query type"""
+        query_methods = self._build_query_methods()
+        for row_id, segment_id, segment_text in segments:
+            for query_type, builder in query_methods.items():
+                if (segment_id, query_type, self.current_repetition) in self.completed:
+                    continue  # Done by a previous run
+                yield (row_id, segment_id, segment_text, query_type, builder)
+    
+    def _iter_batches(self, work_items: Iterable[tuple]) -> Iterator[List[tuple]]:
+        """Group work items into lists of msearch_batch_size"""
+        batch = []
+        for work_item in work_items:
+            batch.append(work_item)
+            if len(batch) >= self.msearch_batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+    
+    def _execute_units(self, units: Iterable[Any], run_unit: Callable[[Any], Any]) -> Iterator[Any]:
+        """
+        Run units of work and yield their outputs in submission order.
+        In 'thread' mode at most max_in_flight units are outstanding at once;
+        outputs are still yielded in input order so output stays deterministic.
+        """
+        if self.concurrency_mode != 'thread' or self.max_in_flight <= 1:
+            for unit in units:
+                yield run_unit(unit)
+            return
+        
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as executor:
+            in_flight = deque()
+            for unit in units:
+                in_flight.append(executor.submit(run_unit, unit))
+                if len(in_flight) >= self.max_in_flight:
+                    yield in_flight.popleft().result()
+            while in_flight:
+                yield in_flight.popleft().result()
+    
+    def _execute_work_items(self, work_items: Iterable[tuple]) -> Iterator[dict]:
+        """Execute work items one request each, or packed into _msearch batches, yielding results in order"""
+        if self.msearch_batch_size and self.msearch_batch_size > 1:
+            for batch_results in self._execute_units(self._iter_batches(work_items), self._run_batch):
+                yield from batch_results
+        else:
+            yield from self._execute_units(work_items, self._run_single_query)
+    
+    def run_all_queries(self, segment_text: str, row_id: str, segment_id: str) -> List[dict]:
+        """Run all enabled query types for a given segment text"""
+        work_items = self._iter_work_items([(row_id, segment_id, segment_text)])
+        query_results = list(self._execute_work_items(work_items))
+        for result in query_results:
+            self._record_result(result)
         return query_results
     
-    def process_csv(self, csv_file: str):
-        """Process the CSV file and run queries for each segment"""
-        print(f"Processing CSV file: {csv_file}")
+    def open_result_stream(self, filename: str, resume: bool = False):
+        """
+        Stream results to the detailed CSV as they complete instead of keeping them in memory.
+        With resume=True an existing file is appended to and its queries are skipped.
+        """
+        last_segment = self.load_checkpoint(filename) if resume else None
+        self.result_writer = StreamingResultWriter(filename, DETAILED_FIELDNAMES,
+                                                   flush_every_rows=self.flush_every_rows,
+                                                   flush_interval_s=self.flush_interval_s,
+                                                   append=resume, last_segment=last_segment)
+        print(f"Streaming detailed results to {filename}")
+    
+    def load_checkpoint(self, filename: str) -> Union[str, None]:
+        """
+        Read a previous run's streamed output: mark its (segment_id, query_type) pairs as done
+        and fold its rows into the running summary. Returns the last segment_id written.
+        """
+        last_segment = None
+        for result in read_completed_results(filename, DETAILED_FIELDNAMES):
+            self.completed.add((result['segment_id'], result['query_type'], result['repetition']))
+            self.summary.add(result)
+            last_segment = result['segment_id']
+        
+        if self.completed:
+            print(f"Resuming: {len(self.completed)} queries already done in {filename}")
+        else:
+            print(f"Resuming: no previous results in {filename}, starting from scratch")
+        return last_segment
+    
+    def _record_result(self, result: dict):
+        """Update running statistics and write the result out (or keep it if not streaming)"""
+        self.summary.add(result)
+        if self.result_writer is not None:
+            self.result_writer.write(result)
+        else:
+            self.results.append(result)
+    
+    def process_csv(self, csv_file: str, record: bool = True):
+        """
+        Stream the query file (CSV, JSONL or Parquet) in a single pass and run queries for each segment.
+        Only the rows selected by row_start/row_end and shard_index/num_shards are processed.
+        With record=False (warmup) the queries run but their results are discarded.
+        """
+        print(f"Processing query file: {csv_file} ({detect_format(csv_file)})")
         
         try:
-            with open(csv_file, 'r', encoding='utf-8') as file:
-                reader = csv.DictReader(file)
-                
-                total_rows = 0
-                processed_rows = 0
-                
-                # Count total rows first
-                for row in reader:
-                    total_rows += 1
-                
-                # Reset file pointer
-                file.seek(0)
-                reader = csv.DictReader(file)
-                
-                print(f"Found {total_rows} segments to process")
-                print("=" * 50)
-                
-                for row in reader:
-                    processed_rows += 1
-                    segment_text = row.get('segment_text', '').strip()
-                    row_id = row.get('row_id', '')
-                    segment_id = row.get('segment_id', '')
-                    
+            total_rows = count_rows(csv_file)
+            if total_rows is not None:
+                print(f"Found {total_rows} segments in file")
+            if self.row_start or self.row_end is not None:
+                print(f"Row range: [{self.row_start or 0}, {'end' if self.row_end is None else self.row_end})")
+            if self.num_shards and self.num_shards > 1:
+                print(f"Shard: {self.shard_index} of {self.num_shards}")
+            if self.concurrency_mode == 'thread':
+                print(f"Concurrency: thread pool with max {self.max_in_flight} requests in flight")
+            if self.msearch_batch_size and self.msearch_batch_size > 1:
+                print(f"Batching: up to {self.msearch_batch_size} searches per _msearch request")
+            print("=" * 50)
+            
+            progress = ProgressReporter(interval_s=self.progress_interval_s)
+            
+            def iter_segments():
+                rows = iter_query_rows(csv_file, self.row_start, self.row_end,
+                                       self.shard_index, self.num_shards)
+                for row in rows:
+                    segment_text = row['segment_text'].strip()
                     if not segment_text:
-                        print(f"Skipping empty segment at row {processed_rows}")
+                        progress.segment_skipped()
                         continue
-                    
-                    print(f"Processing segment {processed_rows}/{total_rows}: '{segment_text[:50]}{'...' if len(segment_text) > 50 else ''}'")
-                    
-                    self.run_all_queries(segment_text, row_id, segment_id)
-                    
-                    # Progress indicator
-                    if processed_rows % 10 == 0:
-                        print(f"Progress: {processed_rows}/{total_rows} segments processed")
+                    progress.segment_read()
+                    yield row['row_id'], row['segment_id'], segment_text
+            
+            # Segments x query types are fanned out as independent work items
+            for result in self._execute_work_items(self._iter_work_items(iter_segments())):
+                if record:
+                    self._record_result(result)
+                progress.query_done(result)
+            progress.report(final=True)
                         
         except FileNotFoundError:
-            print(f"Error: CSV file '{csv_file}' not found")
+            print(f"Error: query file '{csv_file}' not found")
             sys.exit(1)
         except Exception as e:
-            print(f"Error processing CSV file: {e}")
+            print(f"Error processing query file: {e}")
             sys.exit(1)
     
-    def save_detailed_results(self, filename: str = 'search_results_detailed.csv'):
-        """Save detailed results to CSV file with enhanced formatting"""
-        print(f"Saving detailed results to {filename}...")
+    def run_benchmark(self, csv_file: str):
+        """
+        Benchmark mode: warmup_rounds unrecorded passes over the query file (index loading,
+        caches, JIT), then `repetitions` measured passes. Every measured row carries its pass number.
+        """
+        self.pass_times_s = []
+        for round_number in range(1, self.warmup_rounds + 1):
+            print(f"\n=== Warmup pass {round_number}/{self.warmup_rounds} (not recorded) ===")
+            self.process_csv(csv_file, record=False)
         
-        fieldnames = [
-            'timestamp', 'row_id', 'segment_id', 'segment_text', 'query_type',
-            'query_time_ms', 'es_took_ms', 'total_hits', 'max_score', 
-            'timed_out', 'error', 'top_5_hits'
-        ]
+        for repetition in range(1, self.repetitions + 1):
+            print(f"\n=== Measured pass {repetition}/{self.repetitions} ===")
+            self.current_repetition = repetition
+            start_time = time.time()
+            self.process_csv(csv_file)
+            self.pass_times_s.append(time.time() - start_time)
+    
+    def write_benchmark_report(self, filename: str, extra: Dict[str, Any] = None):
+        """Machine-readable latency report: percentiles and 95% confidence intervals per query type"""
+        def describe(stats):
+            return {
+                'count': stats.count,
+                'mean': round(stats.mean, 3),
+                'stdev': round(stats.stdev, 3),
+                'ci95_low': round(stats.mean - stats.ci95_half_width, 3),
+                'ci95_high': round(stats.mean + stats.ci95_half_width, 3),
+                'min': round(stats.min or 0, 3),
+                'p50': round(stats.quantile(0.5), 3),
+                'p90': round(stats.quantile(0.9), 3),
+                'p99': round(stats.quantile(0.99), 3),
+                'max': round(stats.max or 0, 3),
+            }
         
-        with open(filename, 'w', newline='', encoding='utf-8') as file:
-            writer = csv.DictWriter(file, fieldnames=fieldnames)
-            writer.writeheader()
-            
-            # Group results by segment for better readability
-            current_segment = None
-            for result in self.results:
-                # Add separator row between different segments
-                if current_segment != result['segment_id'] and current_segment is not None:
-                    separator_row = {field: '---' if field != 'top_5_hits' else '' for field in fieldnames}
-                    separator_row['segment_text'] = f"--- END SEGMENT {current_segment} ---"
-                    writer.writerow(separator_row)
-                
-                writer.writerow(result)
-                current_segment = result['segment_id']
+        report = {
+            'timestamp': datetime.now().isoformat(),
+            'es_url': self.es_url,
+            'index_name': self.index_name,
+            'config': {
+                'warmup_rounds': self.warmup_rounds,
+                'repetitions': self.repetitions,
+                'request_cache': self.request_cache,
+                'response_profile': self.response_profile,
+                'search_templates': self.search_templates,
+                'concurrency_mode': self.concurrency_mode,
+                'max_in_flight': self.max_in_flight,
+                'msearch_batch_size': self.msearch_batch_size,
+                'hybrid_query': {
+                    'vector_index': self.hybrid_vector_index,
+                    'lexical_query': self.hybrid_lexical_query,
+                    'fusion': self.hybrid_fusion,
+                    'k': self.hybrid_k,
+                    'nprobe': self.hybrid_nprobe,
+                    'ef_search': self.hybrid_ef_search,
+                    'embedding_cache': self.hybrid_embedding_cache,
+                } if self.execute_hybrid_query else None,
+            },
+            'pass_times_s': [round(t, 3) for t in getattr(self, 'pass_times_s', [])],
+            'total_queries': self.summary.total_queries,
+            'successful_queries': self.summary.successful_queries,
+            'query_types': {
+                query_type: {
+                    'errors': stats.errors,
+                    'query_time_ms': describe(stats.query_time),
+                    'es_took_ms': describe(stats.es_time),
+                    **{f"{stage}_ms": describe(stage_stats) for stage, stage_stats in stats.stages.items()
+                       if stage_stats.count},
+                }
+                for query_type, stats in self.summary.by_type.items()
+            }
+        }
+        if extra:
+            report.update(extra)
         
-        print(f"Detailed results saved to {filename}")
+        with open(filename, 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=2)
+        print(f"Benchmark report saved to {filename}")
+    
+    def save_detailed_results(self, filename: str = 'search_results_detailed.csv'):
+        """Finish the streamed detailed CSV, or write buffered results if nothing was streamed"""
+        if self.result_writer is not None and self.result_writer.filename == filename:
+            self.result_writer.close()
+            print(f"Detailed results streamed to {filename} ({self.result_writer.rows_written} rows)")
+        else:
+            print(f"Saving detailed results to {filename}...")
+            writer = StreamingResultWriter(filename, DETAILED_FIELDNAMES)
+            for result in self.results:
+                writer.write(result)
+            writer.close()
+            print(f"Detailed results saved to {filename}")
         print(f"Results include top 5 hit snippets with scores and highlighting")
     
     def generate_summary_stats(self, filename: str = 'search_results_summary.csv'):
-        """Generate and save summary statistics"""
+        """Generate and save summary statistics from the running counters"""
         print(f"Generating summary statistics...")
         
-        if not self.results:
+        if self.summary.total_queries == 0:
             print("No results to analyze")
             return
         
-        # Group results by query type
-        stats_by_type = {}
-        total_queries = len(self.results)
-        successful_queries = len([r for r in self.results if r['error'] is None])
-        
-        for query_type in self.query_types:
-            type_results = [r for r in self.results if r['query_type'] == query_type and r['error'] is None]
-            
-            if type_results:
-                query_times = [r['query_time_ms'] for r in type_results]
-                es_times = [r['es_took_ms'] for r in type_results]
-                hit_counts = [r['total_hits'] for r in type_results]
-                
-                stats_by_type[query_type] = {
-                    'total_queries': len(type_results),
-                    'avg_query_time_ms': round(statistics.mean(query_times), 2),
-                    'median_query_time_ms': round(statistics.median(query_times), 2),
-                    'min_query_time_ms': round(min(query_times), 2),
-                    'max_query_time_ms': round(max(query_times), 2),
-                    'avg_es_time_ms': round(statistics.mean(es_times), 2),
-                    'avg_hits': round(statistics.mean(hit_counts), 2),
-                    'total_hits': sum(hit_counts),
-                    'errors': len([r for r in self.results if r['query_type'] == query_type and r['error'] is not None])
-                }
-            else:
-                stats_by_type[query_type] = {
-                    'total_queries': 0,
-                    'avg_query_time_ms': 0,
-                    'median_query_time_ms': 0,
-                    'min_query_time_ms': 0,
-                    'max_query_time_ms': 0,
-                    'avg_es_time_ms': 0,
-                    'avg_hits': 0,
-                    'total_hits': 0,
-                    'errors': len([r for r in self.results if r['query_type'] == query_type])
-                }
+        stats_by_type = self.summary.rows(self.query_types)
+        total_queries = self.summary.total_queries
+        successful_queries = self.summary.successful_queries
         
         # Save summary statistics
         with open(filename, 'w', newline='', encoding='utf-8') as file:
-            fieldnames = [
-                'query_type', 'total_queries', 'avg_query_time_ms', 'median_query_time_ms',
-                'min_query_time_ms', 'max_query_time_ms', 'avg_es_time_ms',
-                'avg_hits', 'total_hits', 'errors'
-            ]
-            
-            writer = csv.DictWriter(file, fieldnames=fieldnames)
+            writer = csv.DictWriter(file, fieldnames=SUMMARY_FIELDNAMES)
             writer.writeheader()
             
             for query_type, stats in stats_by_type.items():
@@ -708,6 +1260,10 @@ class ElasticsearchQueryBenchmark:
             print(f"{query_type}:")
             print(f"  Queries: {stats['total_queries']}")
             print(f"  Avg Time: {stats['avg_query_time_ms']}ms")
+            print(f"  Avg Server Wait: {stats['avg_server_ms']}ms (client overhead: {stats['avg_client_overhead_ms']}ms)")
+            if stats['avg_vector_ms'] != '':
+                print(f"  Avg Stages: lexical {stats['avg_lexical_ms']}ms, vector {stats['avg_vector_ms']}ms, "
+                      f"fusion {stats['avg_fusion_ms']}ms")
             print(f"  Avg Hits: {stats['avg_hits']}")
             print(f"  Errors: {stats['errors']}")
             print()
@@ -741,7 +1297,7 @@ def parse_config_value(value_str: str) -> Union[bool, int, str, List]:
 
 def main():
     if len(sys.argv) < 5:
-        print("Usage: python3 search_with_highlight.py <csv_file> <index_name> <es_url> <output_dir> [config_json]")
+        print("Usage: python3 my_search.py <query_file.csv|.jsonl|.parquet> <index_name> <es_url> <output_dir> [config_json]")
         sys.exit(1)
     
     csv_file = sys.argv[1]
@@ -759,15 +1315,15 @@ def main():
             sys.exit(1)
     
     print("Elasticsearch Search Pipeline Starting...")
-    print(f"CSV File: {csv_file}")
+    print(f"Query File: {csv_file}")
     print(f"Index: {index_name}")
     print(f"ES URL: {es_url}")
     print(f"Output Directory: {output_dir}")
     print(f"Configuration: {config}")
+    print(f"JSON backend: {JSON_BACKEND}")
     print("=" * 50)
     
     # Create output directory if it doesn't exist
-    import os
     os.makedirs(output_dir, exist_ok=True)
     
     # Initialize benchmark with configuration
@@ -781,24 +1337,56 @@ def main():
         print(f"Failed to connect to Elasticsearch: {e}")
         sys.exit(1)
     
-    # Process CSV and run queries
-    start_time = time.time()
-    benchmark.process_csv(csv_file)
-    end_time = time.time()
+    if benchmark.benchmark_mode and benchmark.use_query_cache:
+        # Cached answers would measure the cache, not Elasticsearch
+        print("Benchmark mode: query result cache disabled")
+        benchmark.use_query_cache = False
+    
+    if benchmark.use_query_cache:
+        cache_path = benchmark.query_cache_path or os.path.join(
+            os.path.dirname(os.path.abspath(output_dir.rstrip('/'))), 'query_cache.sqlite')
+        benchmark.open_query_cache(cache_path)
     
-    total_time = end_time - start_time
-    print(f"\nTotal execution time: {total_time:.2f} seconds")
+    # Output files are named up front so results can be streamed as they complete.
+    # Resumable runs use a stable name so the next allocation finds the previous output
+    if benchmark.resume:
+        run_name = benchmark.run_name or f"{index_name}_{os.path.splitext(os.path.basename(csv_file))[0]}"
+        if benchmark.num_shards and benchmark.num_shards > 1:
+            # Every array task resumes its own shard's output
+            run_name += f"_shard{benchmark.shard_index}of{benchmark.num_shards}"
+    else:
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        job_id = os.environ.get('SLURM_JOB_ID', 'local')
+        run_name = f"{job_id}_{timestamp}"
     
-    # Save results with timestamps for uniqueness
-    from datetime import datetime
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    job_id = os.environ.get('SLURM_JOB_ID', 'local')
+    detailed_filename = os.path.join(output_dir, f"search_results_detailed_{run_name}.csv")
+    summary_filename = os.path.join(output_dir, f"search_results_summary_{run_name}.csv")
+    benchmark.open_result_stream(detailed_filename, resume=benchmark.resume)
     
-    detailed_filename = os.path.join(output_dir, f"search_results_detailed_{job_id}_{timestamp}.csv")
-    summary_filename = os.path.join(output_dir, f"search_results_summary_{job_id}_{timestamp}.csv")
+    # SLURM sends SIGTERM at the time limit: exit through the finally block so
+    # buffered rows are flushed and a summary of the partial run is written
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(128 + signum))
     
-    benchmark.save_detailed_results(detailed_filename)
-    benchmark.generate_summary_stats(summary_filename)
+    # Process CSV and run queries
+    start_time = time.time()
+    try:
+        if benchmark.benchmark_mode:
+            benchmark.run_benchmark(csv_file)
+        else:
+            benchmark.process_csv(csv_file)
+    finally:
+        end_time = time.time()
+        
+        total_time = end_time - start_time
+        print(f"\nTotal execution time: {total_time:.2f} seconds")
+        
+        benchmark.save_detailed_results(detailed_filename)
+        benchmark.generate_summary_stats(summary_filename)
+        if benchmark.benchmark_mode:
+            report_filename = os.path.join(output_dir, f"search_results_benchmark_{run_name}.json")
+            benchmark.write_benchmark_report(report_filename, {'query_file': csv_file,
+                                                               'total_time_s': round(total_time, 3)})
+        benchmark.close()
     
     print("\nPipeline completed successfully!")
     print(f"Enhanced results with hit snippets saved to: {detailed_filename}")
@@ -51,6 +51,33 @@ BOOL_MUST_OPERATOR="${BOOL_MUST_OPERATOR:-or}"  # "and" or "or", should leave by
 BOOL_MUST_MAX_WORDS="${BOOL_MUST_MAX_WORDS:-3}"  # Maximum words to use in bool "and" query
 BOOL_MUST_MINIMUM_SHOULD_MATCH="${BOOL_MUST_MINIMUM_SHOULD_MATCH:-50%}"  # For "or" operator (e.g., "2" or "50%")
 
+# Query execution concurrency
+# "serial" runs one query at a time (default, latencies comparable with earlier runs),
+# "thread" fans out (segment x query type) work items
+CONCURRENCY_MODE="${CONCURRENCY_MODE:-serial}"
+MAX_IN_FLIGHT="${MAX_IN_FLIGHT:-4}"  # Max concurrent requests to ES in "thread" mode
+HTTP_POOL_SIZE="${HTTP_POOL_SIZE:-null}"  # Pooled keep-alive connections (null = MAX_IN_FLIGHT)
+
+# Batch searches into _msearch requests: 0 sends one _search per query,
+# N > 1 packs N (segment x query type) searches into one NDJSON request
+MSEARCH_BATCH_SIZE="${MSEARCH_BATCH_SIZE:-0}"
+
+# Hybrid retrieval: per segment the HYBRID_LEXICAL_QUERY ES query and a FAISS k-NN lookup in
+# HYBRID_VECTOR_INDEX (built by dense_index.py) run concurrently, then the two result lists are fused
+# by reciprocal rank ("rrf") or by normalized scores ("weighted", HYBRID_LEXICAL_WEIGHT on the lexical side).
+# Stage latencies go to the lexical_ms/vector_ms/fusion_ms columns. Needs torch, transformers and faiss
+EXECUTE_HYBRID_QUERY="${EXECUTE_HYBRID_QUERY:-false}"
+HYBRID_VECTOR_INDEX="${HYBRID_VECTOR_INDEX:-}"
+HYBRID_LEXICAL_QUERY="${HYBRID_LEXICAL_QUERY:-match_query}"  # match_query, match_phrase_query, fuzzy_query or bool_must_query
+HYBRID_FUSION="${HYBRID_FUSION:-rrf}"
+HYBRID_K="${HYBRID_K:-10}"  # Vector candidates and fused hits per segment
+HYBRID_RRF_K="${HYBRID_RRF_K:-60}"
+HYBRID_LEXICAL_WEIGHT="${HYBRID_LEXICAL_WEIGHT:-0.5}"
+HYBRID_NPROBE="${HYBRID_NPROBE:-null}"  # IVF lists probed (null = index default)
+HYBRID_EF_SEARCH="${HYBRID_EF_SEARCH:-null}"  # HNSW efSearch (null = index default)
+HYBRID_EMBEDDING_CACHE="${HYBRID_EMBEDDING_CACHE:-}"  # Segment embeddings reused by later runs (shareable by array tasks)
+HYBRID_MODEL_DIR="${HYBRID_MODEL_DIR:-}"  # Local encoder copy: later jobs skip the model hub
+
 # =============================================================================
 # ELASTICSEARCH CONFIGURATION
 # =============================================================================
@@ -68,8 +95,84 @@ CSV_FILE="${CSV_FILE:-/capstor/scratch/cscs/anastasiia_kucherenko/index_attempt_
 INDEX_NAME="${INDEX_NAME:-fineweb_test_1}"
 
 
+# Resume mode: append to a previous run's results and skip (segment, query type) pairs already done,
+# so a long query list can be spread over several short allocations.
+# Resumable runs use a stable output directory and file name (RUN_NAME) instead of the job id
+RESUME="${RESUME:-false}"
+RUN_NAME="${RUN_NAME:-}"
+
+# Query file ingestion: CSV_FILE may also be a .jsonl or .parquet file
+# Row range (0-based data rows, end exclusive) and sharding for job arrays:
+# by default each array task processes every SLURM_ARRAY_TASK_COUNT-th row, task ids counted
+# from SLURM_ARRAY_TASK_MIN (so --array=1-N works too; arrays with steps or gaps are refused)
+ROW_START="${ROW_START:-0}"
+ROW_END="${ROW_END:-null}"
+ARRAY_SHARDS=false
+if [ -z "${SHARD_INDEX:-}" ] && [ -n "${SLURM_ARRAY_TASK_ID:-}" ]; then
+    ARRAY_SHARDS=true
+    SHARD_INDEX=$((SLURM_ARRAY_TASK_ID - ${SLURM_ARRAY_TASK_MIN:-0}))
+fi
+SHARD_INDEX="${SHARD_INDEX:-null}"
+NUM_SHARDS="${NUM_SHARDS:-${SLURM_ARRAY_TASK_COUNT:-null}}"
+PROGRESS_INTERVAL_S="${PROGRESS_INTERVAL_S:-30}"  # Seconds between progress lines
+
+# Query result cache: identical queries against an unchanged index (same uuid and doc count)
+# are answered from an in-memory LRU / SQLite store that persists across jobs.
+# Default store: query_cache.sqlite next to the output directory
+USE_QUERY_CACHE="${USE_QUERY_CACHE:-true}"
+QUERY_CACHE_PATH="${QUERY_CACHE_PATH:-}"
+QUERY_CACHE_CLEAR="${QUERY_CACHE_CLEAR:-false}"  # Drop this index's cached entries first
+
+# Latency benchmark mode: WARMUP_ROUNDS unrecorded passes over the query file, then
+# REPETITIONS measured passes; writes p50/p90/p99/max + 95% CI to a JSON report next to the CSVs.
+# The query result cache is disabled in this mode
+BENCHMARK_MODE="${BENCHMARK_MODE:-false}"
+WARMUP_ROUNDS="${WARMUP_ROUNDS:-1}"
+REPETITIONS="${REPETITIONS:-5}"
+REQUEST_CACHE="${REQUEST_CACHE:-null}"  # ES shard request cache: true, false (cache busting) or null (index default)
+
+# Response profile: what each search returns
+#   full     - per query type size (50/100) with highlighting (original behaviour)
+#   snippets - top RESPONSE_TOP_K hits with url and highlighting
+#   ids      - top RESPONSE_TOP_K hit ids and scores, no _source or highlighting
+#   counts   - total hits and took only (size 0, exact track_total_hits)
+RESPONSE_PROFILE="${RESPONSE_PROFILE:-full}"
+RESPONSE_TOP_K="${RESPONSE_TOP_K:-5}"
+TRACK_TOTAL_HITS="${TRACK_TOTAL_HITS:-null}"  # true, false, a number, or null (profile default)
+# Store the compiled query types as ES search templates (_scripts) and send only their parameters
+SEARCH_TEMPLATES="${SEARCH_TEMPLATES:-false}"
+
+# Load test: RUN_MODE=load runs load_generator.py instead of the search pipeline.
+# closed = LOAD_USERS concurrent virtual users, open = Poisson arrivals at TARGET_QPS
+# (a JSON list such as [10,50,100,200] runs one LOAD_DURATION_S step per rate to find saturation)
+RUN_MODE="${RUN_MODE:-search}"
+LOAD_MODE="${LOAD_MODE:-closed}"
+LOAD_USERS="${LOAD_USERS:-4}"
+TARGET_QPS="${TARGET_QPS:-10}"
+LOAD_DURATION_S="${LOAD_DURATION_S:-60}"
+LOAD_WINDOW_S="${LOAD_WINDOW_S:-5}"  # Width of the latency-over-time windows
+
+# Startup: ES and the index are polled with a doubling interval (1s, 2s, 4s, ... up to READY_POLL_MAX_S),
+# then the index is warmed before anything is measured (es_warmup.py):
+#   queries - run INDEX_WARMUP_QUERIES segments sampled from the query file with the configured query types
+#   files   - read the index's hot Lucene files (INDEX_WARMUP_EXTENSIONS) into the page cache, up to
+#             INDEX_WARMUP_MAX_GB (with node.store.allow_mmap=false reads go through the page cache)
+#   all / none
+ES_START_TIMEOUT_S="${ES_START_TIMEOUT_S:-1200}"
+READY_POLL_MAX_S="${READY_POLL_MAX_S:-30}"
+INDEX_READY_STATUS="${INDEX_READY_STATUS:-yellow}"  # 'yellow' or 'green'
+INDEX_READY_TIMEOUT_S="${INDEX_READY_TIMEOUT_S:-600}"
+INDEX_WARMUP="${INDEX_WARMUP:-queries}"
+INDEX_WARMUP_QUERIES="${INDEX_WARMUP_QUERIES:-200}"
+INDEX_WARMUP_EXTENSIONS="${INDEX_WARMUP_EXTENSIONS:-tip,tim,nvm,nvd,cfs,doc}"
+INDEX_WARMUP_MAX_GB="${INDEX_WARMUP_MAX_GB:-8}"
+
 CSV_BASENAME=$(basename "$CSV_FILE" .txt)
-OUTPUT_DIR="${OUTPUT_DIR:-/capstor/scratch/cscs/anastasiia_kucherenko/index_attempt_1/search_results/${INDEX_NAME}_${CSV_BASENAME}_${SLURM_JOB_ID}/}"
+if [ "$RESUME" = "true" ]; then
+    OUTPUT_DIR="${OUTPUT_DIR:-/capstor/scratch/cscs/anastasiia_kucherenko/index_attempt_1/search_results/${INDEX_NAME}_${CSV_BASENAME}/}"
+else
+    OUTPUT_DIR="${OUTPUT_DIR:-/capstor/scratch/cscs/anastasiia_kucherenko/index_attempt_1/search_results/${INDEX_NAME}_${CSV_BASENAME}_${SLURM_JOB_ID}/}"
+fi
 
 # Build Elasticsearch URL
 ES_URL="http://${ES_HOST}:${ES_PORT}"
@@ -143,7 +246,40 @@ build_config_json() {
     "match_query_operator": $MATCH_QUERY_OPERATOR,
     "match_phrase_slop": $MATCH_PHRASE_SLOP,
     "bool_must_operator": "$BOOL_MUST_OPERATOR",
-    "bool_must_max_words": $BOOL_MUST_MAX_WORDS
+    "bool_must_max_words": $BOOL_MUST_MAX_WORDS,
+    "concurrency_mode": "$CONCURRENCY_MODE",
+    "max_in_flight": $MAX_IN_FLIGHT,
+    "http_pool_size": $HTTP_POOL_SIZE,
+    "msearch_batch_size": $MSEARCH_BATCH_SIZE,
+    "execute_hybrid_query": $EXECUTE_HYBRID_QUERY,
+    "hybrid_lexical_query": "$HYBRID_LEXICAL_QUERY",
+    "hybrid_fusion": "$HYBRID_FUSION",
+    "hybrid_k": $HYBRID_K,
+    "hybrid_rrf_k": $HYBRID_RRF_K,
+    "hybrid_lexical_weight": $HYBRID_LEXICAL_WEIGHT,
+    "hybrid_nprobe": $HYBRID_NPROBE,
+    "hybrid_ef_search": $HYBRID_EF_SEARCH,
+    "resume": $RESUME,
+    "row_start": $ROW_START,
+    "row_end": $ROW_END,
+    "shard_index": $SHARD_INDEX,
+    "num_shards": $NUM_SHARDS,
+    "progress_interval_s": $PROGRESS_INTERVAL_S,
+    "use_query_cache": $USE_QUERY_CACHE,
+    "query_cache_clear": $QUERY_CACHE_CLEAR,
+    "benchmark_mode": $BENCHMARK_MODE,
+    "warmup_rounds": $WARMUP_ROUNDS,
+    "repetitions": $REPETITIONS,
+    "request_cache": $REQUEST_CACHE,
+    "response_profile": "$RESPONSE_PROFILE",
+    "response_top_k": $RESPONSE_TOP_K,
+    "track_total_hits": $TRACK_TOTAL_HITS,
+    "search_templates": $SEARCH_TEMPLATES,
+    "load_mode": "$LOAD_MODE",
+    "virtual_users": $LOAD_USERS,
+    "target_qps": $TARGET_QPS,
+    "duration_s": $LOAD_DURATION_S,
+    "window_s": $LOAD_WINDOW_S
 EOF
 
     # Add minimum_should_match only if not empty
@@ -160,6 +296,29 @@ EOF
         fi
     fi
     
+    # Add query_cache_path only if set (otherwise next to the output directory)
+    if [ -n "$QUERY_CACHE_PATH" ]; then
+        echo "    ,\"query_cache_path\": \"$QUERY_CACHE_PATH\"" >> "$temp_json"
+    fi
+    
+    # Add hybrid_vector_index only if set (required by EXECUTE_HYBRID_QUERY=true)
+    if [ -n "$HYBRID_VECTOR_INDEX" ]; then
+        echo "    ,\"hybrid_vector_index\": \"$HYBRID_VECTOR_INDEX\"" >> "$temp_json"
+    fi
+    
+    # Add hybrid_embedding_cache / hybrid_model_dir only if set
+    if [ -n "$HYBRID_EMBEDDING_CACHE" ]; then
+        echo "    ,\"hybrid_embedding_cache\": \"$HYBRID_EMBEDDING_CACHE\"" >> "$temp_json"
+    fi
+    if [ -n "$HYBRID_MODEL_DIR" ]; then
+        echo "    ,\"hybrid_model_dir\": \"$HYBRID_MODEL_DIR\"" >> "$temp_json"
+    fi
+    
+    # Add run_name only if set (otherwise derived from index and CSV names)
+    if [ -n "$RUN_NAME" ]; then
+        echo "    ,\"run_name\": \"$RUN_NAME\"" >> "$temp_json"
+    fi
+    
     echo "}" >> "$temp_json"
     
     # Validate JSON and output
@@ -226,6 +385,42 @@ if [ -z "$PATH_DATA" ]; then
     log_info "  BOOL_MUST_OPERATOR=and                  # Boolean operator: 'and' or 'or'"
     log_info "  BOOL_MUST_MAX_WORDS=3                   # Max words for boolean query"
     log_info "  BOOL_MUST_MINIMUM_SHOULD_MATCH=         # Minimum should match (for 'or' operator)"
+    log_info "  CONCURRENCY_MODE=serial                 # Query execution: 'serial' or 'thread' (opt-in)"
+    log_info "  MAX_IN_FLIGHT=4                         # Max concurrent requests in 'thread' mode"
+    log_info "  HTTP_POOL_SIZE=null                     # Pooled HTTP connections (null = MAX_IN_FLIGHT)"
+    log_info "  MSEARCH_BATCH_SIZE=0                    # Searches per _msearch request (0 = no batching)"
+    log_info "  EXECUTE_HYBRID_QUERY=false              # Lexical + FAISS k-NN query, fused per segment"
+    log_info "  HYBRID_VECTOR_INDEX=                    # FAISS index from dense_index.py build"
+    log_info "  HYBRID_LEXICAL_QUERY=match_query        # Lexical side of the hybrid query"
+    log_info "  HYBRID_FUSION=rrf HYBRID_K=10           # 'rrf' or 'weighted' fusion, candidates/hits kept"
+    log_info "  HYBRID_RRF_K=60 HYBRID_LEXICAL_WEIGHT=0.5  # RRF rank constant / lexical weight ('weighted')"
+    log_info "  HYBRID_NPROBE=null HYBRID_EF_SEARCH=null   # IVF / HNSW search breadth"
+    log_info "  HYBRID_EMBEDDING_CACHE= HYBRID_MODEL_DIR=  # Embedding cache / local model copies"
+    log_info "  RESUME=false                            # Skip queries already in a previous run's output"
+    log_info "  RUN_NAME=                               # Stable output name for resumable runs"
+    log_info "  ROW_START=0 ROW_END=null                # Row range of the query file to process"
+    log_info "  SHARD_INDEX/NUM_SHARDS                  # Shard k of n (default: array task offset/count)"
+    log_info "  PROGRESS_INTERVAL_S=30                  # Seconds between progress lines"
+    log_info "  USE_QUERY_CACHE=true                    # Reuse results of identical queries"
+    log_info "  QUERY_CACHE_PATH=                       # SQLite cache file (default: next to output dir)"
+    log_info "  QUERY_CACHE_CLEAR=false                 # Drop cached entries for this index first"
+    log_info "  BENCHMARK_MODE=false                    # Warmup + repeated passes, JSON latency report"
+    log_info "  WARMUP_ROUNDS=1 REPETITIONS=5           # Unrecorded / measured passes in benchmark mode"
+    log_info "  REQUEST_CACHE=null                      # ES request cache: true, false or null"
+    log_info "  RESPONSE_PROFILE=full                   # Search response: full, snippets, ids or counts"
+    log_info "  RESPONSE_TOP_K=5 TRACK_TOTAL_HITS=null  # Hits for snippets/ids, total hit counting"
+    log_info "  SEARCH_TEMPLATES=false                  # Send query parameters to stored ES search templates"
+    log_info "  RUN_MODE=search                         # 'search' pipeline or 'load' test"
+    log_info "  LOAD_MODE=closed                        # Load test: 'closed' (virtual users) or 'open' (target QPS)"
+    log_info "  LOAD_USERS=4 TARGET_QPS=10              # Closed loop users / open loop rate (list = sweep)"
+    log_info "  LOAD_DURATION_S=60 LOAD_WINDOW_S=5      # Load test (step) duration / reporting window"
+    log_info "  ES_START_TIMEOUT_S=1200                 # Give up if ES does not answer by then"
+    log_info "  READY_POLL_MAX_S=30                     # Cap of the doubling readiness poll interval"
+    log_info "  INDEX_READY_STATUS=yellow               # Index health to wait for: yellow or green"
+    log_info "  INDEX_READY_TIMEOUT_S=600               # Give up if the index is not ready by then"
+    log_info "  INDEX_WARMUP=queries                    # Warm-up before measuring: none, queries, files or all"
+    log_info "  INDEX_WARMUP_QUERIES=200                # Sampled segments run by the query warm-up"
+    log_info "  INDEX_WARMUP_MAX_GB=8                   # Page cache budget of the file warm-up"
     exit 1
 fi
 
@@ -235,6 +430,13 @@ if [ -z "$CSV_FILE" ]; then
     exit 1
 fi
 
+if [ "$ARRAY_SHARDS" = "true" ] && \
+   [ $((SLURM_ARRAY_TASK_MAX - SLURM_ARRAY_TASK_MIN + 1)) -ne "${SLURM_ARRAY_TASK_COUNT:-0}" ]; then
+    log_error "Job array $SLURM_ARRAY_TASK_MIN-$SLURM_ARRAY_TASK_MAX has steps or gaps ($SLURM_ARRAY_TASK_COUNT tasks)"
+    log_info "Use a contiguous --array, or set SHARD_INDEX and NUM_SHARDS explicitly"
+    exit 1
+fi
+
 # Check if CSV file exists
 if [ ! -f "$CSV_FILE" ]; then
     log_error "CSV file '$CSV_FILE' not found"
@@ -269,6 +471,23 @@ log_info "  Bool Must Query: $EXECUTE_BOOL_MUST_QUERY"
 log_info "  Bool Must Operator: $BOOL_MUST_OPERATOR"
 log_info "  Bool Must Max Words: $BOOL_MUST_MAX_WORDS"
 log_info "  Bool Must Min Should Match: ${BOOL_MUST_MINIMUM_SHOULD_MATCH:-'(not set)'}"
+log_info "  Concurrency Mode: $CONCURRENCY_MODE"
+log_info "  Max In Flight: $MAX_IN_FLIGHT"
+log_info "  HTTP Pool Size: $HTTP_POOL_SIZE"
+log_info "  Msearch Batch Size: $MSEARCH_BATCH_SIZE"
+log_info "  Hybrid Query: $EXECUTE_HYBRID_QUERY ${HYBRID_VECTOR_INDEX:+(index: $HYBRID_VECTOR_INDEX, lexical: $HYBRID_LEXICAL_QUERY, fusion: $HYBRID_FUSION, k: $HYBRID_K)}"
+log_info "  Resume: $RESUME ${RUN_NAME:+(run name: $RUN_NAME)}"
+log_info "  Row Range: [$ROW_START, $ROW_END)"
+log_info "  Shard: $SHARD_INDEX of $NUM_SHARDS"
+log_info "  Query Cache: $USE_QUERY_CACHE ${QUERY_CACHE_PATH:+($QUERY_CACHE_PATH)}"
+log_info "  Benchmark Mode: $BENCHMARK_MODE (warmup: $WARMUP_ROUNDS, repetitions: $REPETITIONS, request_cache: $REQUEST_CACHE)"
+log_info "  Response Profile: $RESPONSE_PROFILE (top k: $RESPONSE_TOP_K, track_total_hits: $TRACK_TOTAL_HITS, search templates: $SEARCH_TEMPLATES)"
+log_info "  Run Mode: $RUN_MODE"
+log_info "  Readiness: index $INDEX_READY_STATUS within ${INDEX_READY_TIMEOUT_S}s (ES start timeout ${ES_START_TIMEOUT_S}s, max poll ${READY_POLL_MAX_S}s)"
+log_info "  Index Warm-up: $INDEX_WARMUP (queries: $INDEX_WARMUP_QUERIES, files: $INDEX_WARMUP_EXTENSIONS up to ${INDEX_WARMUP_MAX_GB}GB)"
+if [ "$RUN_MODE" = "load" ]; then
+    log_info "  Load Test: $LOAD_MODE (users: $LOAD_USERS, target QPS: $TARGET_QPS, duration: ${LOAD_DURATION_S}s, window: ${LOAD_WINDOW_S}s)"
+fi
 log_info "========================================================================="
 
 # Elasticsearch optimizations for large index
@@ -323,19 +542,20 @@ start_elasticsearch() {
     ES_PID=$!
     log_info "Elasticsearch started with PID: $ES_PID (optimized for 400GB index)"
     
-    # Extended wait time for large index startup
+    # Extended wait time for large index startup, polling with a doubling interval
     log_info "Waiting for large index to load (this may take several minutes)..."
-    max_retries=120  
+    local start_time=$SECONDS
+    local poll_s=1
     retry_count=0
     
-    while [ $retry_count -lt $max_retries ]; do
+    while [ $((SECONDS - start_time)) -lt "$ES_START_TIMEOUT_S" ]; do
         if ! kill -0 $ES_PID 2>/dev/null; then
             log_error "Elasticsearch process died! PID $ES_PID is no longer running"
             return 1
         fi
         
         if curl --noproxy "127.0.0.1" -s "http://127.0.0.1:9200/_cluster/health" > /dev/null 2>&1; then
-            log_success "Elasticsearch is ready!"
+            log_success "Elasticsearch is ready after $((SECONDS - start_time))s!"
             
             # Show memory and performance stats
             log_info "=== Cluster Health ==="
@@ -347,15 +567,16 @@ start_elasticsearch() {
             return 0
         else
             retry_count=$((retry_count + 1))
-            if [ $((retry_count % 10)) -eq 0 ]; then
-                log_info "Still waiting for large index to load... attempt $retry_count/$max_retries"
+            if [ $((retry_count % 5)) -eq 0 ]; then
+                log_info "Still waiting for large index to load... attempt $retry_count, $((SECONDS - start_time))s/${ES_START_TIMEOUT_S}s"
                 log_info "This is normal for such large indices - please be patient"
             fi
-            sleep 10
+            sleep $poll_s
+            poll_s=$((poll_s * 2 > READY_POLL_MAX_S ? READY_POLL_MAX_S : poll_s * 2))
         fi
     done
     
-    log_error "Elasticsearch failed to start after $max_retries attempts"
+    log_error "Elasticsearch failed to start within ${ES_START_TIMEOUT_S}s"
     return 1
 }
 
@@ -437,15 +658,51 @@ cleanup() {
 # Set trap to cleanup on exit
 trap cleanup EXIT
 
+# Wall time of each startup/run phase, printed at the end
+PHASE_TIMINGS=()
+record_phase() {
+    local phase="$1"
+    local start="$2"
+    PHASE_TIMINGS+=("$phase: $((SECONDS - start))s")
+    log_info "Phase '$phase' took $((SECONDS - start))s"
+}
+
+print_phase_timings() {
+    log_info "=== Phase timings ==="
+    for timing in "${PHASE_TIMINGS[@]}"; do
+        log_info "  $timing"
+    done
+}
+
+# Wait for the index and warm it up so measured latencies reflect steady state
+warmup_index() {
+    log_info "Waiting for index '$INDEX_NAME' ($INDEX_READY_STATUS) and warming up ($INDEX_WARMUP)..."
+    mkdir -p "$OUTPUT_DIR"
+    python3 /capstor/scratch/cscs/anastasiia_kucherenko/index_attempt_1/es_warmup.py "$ES_URL" "$INDEX_NAME" \
+        --status "$INDEX_READY_STATUS" \
+        --timeout-s "$INDEX_READY_TIMEOUT_S" \
+        --max-poll-s "$READY_POLL_MAX_S" \
+        --mode "$INDEX_WARMUP" \
+        --query-file "$CSV_FILE" \
+        --queries "$INDEX_WARMUP_QUERIES" \
+        --config-json "$CONFIG_JSON" \
+        --data-path "$PATH_DATA" \
+        --extensions "$INDEX_WARMUP_EXTENSIONS" \
+        --max-gb "$INDEX_WARMUP_MAX_GB" \
+        --report "$OUTPUT_DIR/warmup_${SLURM_JOB_ID:-local}.json"
+}
+
 # Main execution function
 main() {
     configure_proxy_bypass
 
     # Start Elasticsearch
+    local phase_start=$SECONDS
     if ! start_elasticsearch; then
         log_error "Failed to start Elasticsearch"
         exit 1
     fi
+    record_phase "es_start" $phase_start
     
     # Test connection after proxy fix
     log_info "=== Testing connection after proxy fix ==="
@@ -486,9 +743,32 @@ main() {
         exit 1
     fi
     
+    phase_start=$SECONDS
+    if ! warmup_index; then
+        log_error "Index '$INDEX_NAME' did not become $INDEX_READY_STATUS"
+        exit 1
+    fi
+    record_phase "index_ready_and_warmup" $phase_start
+    
+    # Load test instead of the search pipeline
+    if [ "$RUN_MODE" = "load" ]; then
+        log_info "Starting $LOAD_MODE loop load test..."
+        phase_start=$SECONDS
+        if python3 /capstor/scratch/cscs/anastasiia_kucherenko/index_attempt_1/load_generator.py "$CSV_FILE" "$INDEX_NAME" "$ES_URL" "$OUTPUT_DIR" "$CONFIG_JSON"; then
+            log_success "Load test completed successfully!"
+            log_info "Report saved to: $OUTPUT_DIR"
+            record_phase "load_test" $phase_start
+            print_phase_timings
+        else
+            log_error "Load test failed!"
+            exit 1
+        fi
+        return
+    fi
     
     # Run Python search script with configuration
     log_info "Starting search queries execution with configurable parameters..."
+    phase_start=$SECONDS
     if python3 /capstor/scratch/cscs/anastasiia_kucherenko/index_attempt_1/my_search.py "$CSV_FILE" "$INDEX_NAME" "$ES_URL" "$OUTPUT_DIR" "$CONFIG_JSON"; then
         log_success ""
         log_success "Search pipeline completed successfully!"
@@ -497,6 +777,8 @@ main() {
         log_info ""
         log_info "Query configuration used:"
         echo "$CONFIG_JSON" | python3 -m json.tool 2>/dev/null || echo "$CONFIG_JSON"
+        record_phase "search" $phase_start
+        print_phase_timings
     else
         log_error "Search pipeline failed!"
         exit 1
@@ -0,0 +1,16 @@
+"""
+Parquet file listing shared by the indexer, inspectors and local backends
+Standard library only, so tools that just read Parquet don't import the ES client stack.
+"""
+
+import glob
+import os
+from typing import List
+
+
+def list_parquet_files(data_dir: str, file_range_start: int = None, file_range_end: int = None) -> List[str]:
+    """Sorted Parquet files under data_dir, optionally the [start, end) slice of that list"""
+    files = sorted(glob.glob(os.path.join(data_dir, '**', '*.parquet'), recursive=True))
+    start = file_range_start or 0
+    end = len(files) if file_range_end is None else file_range_end
+    return files[start:end]
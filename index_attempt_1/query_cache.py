@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Query result cache for the search pipeline
+In-memory LRU in front of a SQLite store that persists across jobs.
+Entries are keyed by an index fingerprint (name, uuid, doc count) and the
+canonical query JSON, so re-indexing or adding documents invalidates them.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Union
+
+from es_transport import dumps, loads
+
+
+def canonical_query_key(index_fingerprint: str, query: dict) -> str:
+    """Stable key for a query body: key order and whitespace do not matter"""
+    canonical = json.dumps(query, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha1(f"{index_fingerprint}\n{canonical}".encode('utf-8')).hexdigest()
+
+
+class QueryResultCache:
+    """
+    Two-level cache of ES responses: LRU dict of encoded responses in memory,
+    SQLite on disk. Thread-safe; disk writes are committed in batches.
+    """
+
+    def __init__(self, path: str, index_fingerprint: str, max_memory_entries: int = 10000,
+                 commit_every: int = 100):
+        self.path = path
+        self.index_fingerprint = index_fingerprint
+        self.max_memory_entries = max_memory_entries
+        self.commit_every = commit_every
+
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self._uncommitted = 0
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, fingerprint TEXT, response BLOB, created REAL)"
+        )
+        self.db.commit()
+
+    def key(self, query: dict) -> str:
+        return canonical_query_key(self.index_fingerprint, query)
+
+    def get(self, key: str) -> Union[dict, None]:
+        """Decoded copy of the cached response, or None on a miss"""
+        with self.lock:
+            encoded = self.memory.get(key)
+            if encoded is not None:
+                self.memory.move_to_end(key)
+                self.memory_hits += 1
+            else:
+                row = self.db.execute("SELECT response FROM results WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    self.misses += 1
+                    return None
+                encoded = row[0]
+                self._remember(key, encoded)
+                self.disk_hits += 1
+        return loads(encoded)
+
+    def put(self, key: str, response: dict):
+        """Store a successful response (client-side timing fields are not cached)"""
+        if "error" in response or response.get("timed_out"):
+            return
+        encoded = dumps({k: v for k, v in response.items() if not k.startswith('_client')})
+        with self.lock:
+            self._remember(key, encoded)
+            self.db.execute(
+                "INSERT OR REPLACE INTO results (key, fingerprint, response, created) VALUES (?, ?, ?, ?)",
+                (key, self.index_fingerprint, encoded, time.time())
+            )
+            self.stores += 1
+            self._uncommitted += 1
+            if self._uncommitted >= self.commit_every:
+                self.db.commit()
+                self._uncommitted = 0
+
+    def _remember(self, key: str, encoded: bytes):
+        self.memory[key] = encoded
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_memory_entries:
+            self.memory.popitem(last=False)
+
+    def clear(self):
+        """Drop every entry of this index fingerprint"""
+        with self.lock:
+            self.memory.clear()
+            self.db.execute("DELETE FROM results WHERE fingerprint = ?", (self.index_fingerprint,))
+            self.db.commit()
+
+    @property
+    def lookups(self) -> int:
+        return self.memory_hits + self.disk_hits + self.misses
+
+    @property
+    def hit_rate(self) -> float:
+        return (self.memory_hits + self.disk_hits) / self.lookups if self.lookups else 0.0
+
+    def stats_line(self) -> str:
+        return (f"Query cache: {self.lookups} lookups, hit rate {self.hit_rate:.1%} "
+                f"({self.memory_hits} memory, {self.disk_hits} disk, {self.misses} misses), "
+                f"{self.stores} stored in {self.path}")
+
+    def close(self):
+        with self.lock:
+            self.db.commit()
+            self.db.close()
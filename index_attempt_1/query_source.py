@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Query file ingestion for the search pipeline
+Streams (row_id, segment_id, segment_text) rows from CSV, JSONL or Parquet
+in a single pass, with optional row range / shard selection for job arrays
+"""
+
+import csv
+import json
+import os
+from typing import Dict, Iterator, Union
+
+QUERY_COLUMNS = ['row_id', 'segment_id', 'segment_text']
+
+
+def detect_format(path: str) -> str:
+    """Query file format from its extension: 'csv', 'jsonl' or 'parquet'"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext in ('.jsonl', '.ndjson', '.json'):
+        return 'jsonl'
+    if ext in ('.parquet', '.pq'):
+        return 'parquet'
+    return 'csv'
+
+
+def count_rows(path: str) -> Union[int, None]:
+    """Row count when it is known without reading the data (Parquet footer), else None"""
+    if detect_format(path) != 'parquet':
+        return None
+    import pyarrow.parquet as pq
+    return pq.ParquetFile(path).metadata.num_rows
+
+
+def _normalize(row: Dict[str, object]) -> Dict[str, str]:
+    # Header cells like "segment_text " (trailing space) must still match
+    row = {str(k).strip(): v for k, v in row.items() if k is not None}
+    return {col: '' if row.get(col) is None else str(row.get(col)) for col in QUERY_COLUMNS}
+
+
+def _iter_csv(path: str, start: int) -> Iterator[Dict[str, str]]:
+    with open(path, 'r', encoding='utf-8', newline='') as file:
+        for i, row in enumerate(csv.DictReader(file)):
+            if i >= start:
+                yield _normalize(row)
+
+
+def _iter_jsonl(path: str, start: int) -> Iterator[Dict[str, str]]:
+    with open(path, 'r', encoding='utf-8') as file:
+        i = 0
+        for line in file:
+            if not line.strip():
+                continue
+            if i >= start:
+                yield _normalize(json.loads(line))
+            i += 1
+
+
+def _iter_parquet(path: str, start: int, batch_size: int = 10000) -> Iterator[Dict[str, str]]:
+    import pyarrow.parquet as pq
+
+    parquet_file = pq.ParquetFile(path)
+    available = set(parquet_file.schema_arrow.names)
+    columns = [c for c in QUERY_COLUMNS if c in available]
+
+    # Skip whole row groups before the start row using footer metadata only
+    first_row = 0
+    row_groups = []
+    for rg in range(parquet_file.num_row_groups):
+        num_rows = parquet_file.metadata.row_group(rg).num_rows
+        if first_row + num_rows > start:
+            row_groups.append(rg)
+        else:
+            first_row += num_rows
+    if not row_groups:
+        return
+
+    i = first_row
+    for batch in parquet_file.iter_batches(batch_size=batch_size, row_groups=row_groups, columns=columns):
+        for row in batch.to_pylist():
+            if i >= start:
+                yield _normalize(row)
+            i += 1
+
+
+def iter_query_rows(path: str, row_start: int = 0, row_end: int = None,
+                    shard_index: int = None, num_shards: int = None) -> Iterator[Dict[str, str]]:
+    """
+    Stream query rows (dicts with row_id, segment_id, segment_text) in a single pass.
+    row_start/row_end select a half-open range of data rows (0-based, header excluded).
+    shard_index/num_shards keep every num_shards-th row of that range starting at
+    shard_index, so a job array can split one file without knowing its length.
+    """
+    sharded = num_shards is not None and num_shards > 1
+    if sharded and (shard_index is None or not 0 <= shard_index < num_shards):
+        raise ValueError(f"shard_index must be in [0, {num_shards}), got {shard_index}")
+    row_start = row_start or 0
+    fmt = detect_format(path)
+    if fmt == 'jsonl':
+        rows = _iter_jsonl(path, row_start)
+    elif fmt == 'parquet':
+        rows = _iter_parquet(path, row_start)
+    else:
+        rows = _iter_csv(path, row_start)
+
+    for offset, row in enumerate(rows):
+        if row_end is not None and row_start + offset >= row_end:
+            break
+        if sharded and offset % num_shards != shard_index:
+            continue
+        yield row
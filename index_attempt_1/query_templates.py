@@ -0,0 +1,104 @@
+"""
+Query templates compiled once per run
+A template is a query body with named Slot markers. fill() copies only the dicts and
+lists on the path to a slot, so the static parts (options, highlight, _source) are
+shared by every query built from it. The same body renders to an Elasticsearch
+mustache search template, so with search templates only slot values go over the wire.
+"""
+
+import hashlib
+import json
+import re
+from typing import Any, Callable, Dict, Tuple, Union
+
+_SLOT_MARK = re.compile(r'"@@slot:(\w+)@@"')
+
+
+class Slot:
+    """Placeholder for a per-query value inside a template body"""
+    __slots__ = ('name',)
+
+    def __init__(self, name: str):
+        self.name = name
+
+
+def _has_slot(node: Any) -> bool:
+    if isinstance(node, Slot):
+        return True
+    if isinstance(node, dict):
+        return any(_has_slot(value) for value in node.values())
+    if isinstance(node, list):
+        return any(_has_slot(value) for value in node)
+    return False
+
+
+def _compile(node: Any) -> Callable[[dict], Any]:
+    """Filler for one node; subtrees without slots are returned as is (shared, never copied)"""
+    if isinstance(node, Slot):
+        name = node.name
+        return lambda values: values[name]
+    if isinstance(node, dict):
+        dynamic = {key: _compile(value) for key, value in node.items() if _has_slot(value)}
+        if not dynamic:
+            return lambda values: node
+        if len(dynamic) == 1:
+            # Common case, one slot below this dict: an overriding merge keeps the key order
+            (key, fill), = dynamic.items()
+            return lambda values: {**node, key: fill(values)}
+
+        def fill_dict(values: dict) -> dict:
+            filled = dict(node)  # Keeps key order, so bodies serialize as before
+            for key, fill in dynamic.items():
+                filled[key] = fill(values)
+            return filled
+        return fill_dict
+    if isinstance(node, list) and _has_slot(node):
+        items = [_compile(value) for value in node]
+        return lambda values: [fill(values) for fill in items]
+    return lambda values: node
+
+
+class QueryTemplate:
+    def __init__(self, name: str, body: dict):
+        self.name = name
+        self.body = body
+        self._fill = _compile(body)
+        # Slot values are inserted as JSON by mustache's toJson; the trailing space keeps
+        # the closing tag from running into the body's own closing braces
+        marked = json.dumps(body, default=lambda slot: f"@@slot:{slot.name}@@")
+        self.source = _SLOT_MARK.sub(lambda m: f"{{{{#toJson}}}}{m.group(1)}{{{{/toJson}}}} ", marked)
+        # Content-addressed, so a changed body (e.g. another response profile) gets a new id
+        self.template_id = f"{name}_{hashlib.sha1(self.source.encode('utf-8')).hexdigest()[:10]}"
+
+    def fill(self, values: dict) -> dict:
+        """Query body with the slots filled in"""
+        return self._fill(values)
+
+
+class CompiledQuery:
+    """
+    One query type: its template variants and a selector that picks a variant and the
+    slot values for a segment text, or returns None when the query is skipped for it
+    """
+
+    def __init__(self, query_type: str, templates: Dict[str, QueryTemplate],
+                 select: Callable[[str], Union[Tuple[str, dict], None]]):
+        self.query_type = query_type
+        self.templates = templates
+        self.select = select
+
+    def build(self, text: str) -> Union[dict, None]:
+        """Full query body for _search"""
+        selected = self.select(text)
+        if selected is None:
+            return None
+        variant, values = selected
+        return self.templates[variant].fill(values)
+
+    def build_template_call(self, text: str) -> Union[dict, None]:
+        """Stored template id and parameters for _search/template"""
+        selected = self.select(text)
+        if selected is None:
+            return None
+        variant, values = selected
+        return {"id": self.templates[variant].template_id, "params": values}
@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+"""
+Streaming result output for the search pipeline
+Buffered CSV writer that flushes periodically, plus running statistics
+(counters and quantile sketches) so memory stays flat for any number of segments
+"""
+
+import csv
+import math
+import os
+import time
+from typing import Dict, List, Any, Iterator
+
+# Column order of the detailed results CSV
+DETAILED_FIELDNAMES = [
+    'timestamp', 'row_id', 'segment_id', 'segment_text', 'query_type', 'repetition',
+    'query_time_ms', 'connect_ms', 'send_ms', 'server_ms', 'parse_ms',
+    'es_took_ms', 'lexical_ms', 'vector_ms', 'fusion_ms', 'total_hits', 'max_score',
+    'timed_out', 'cache_hit', 'error', 'top_5_hits'
+]
+
+# Column order of the summary CSV
+SUMMARY_FIELDNAMES = [
+    'query_type', 'total_queries', 'avg_query_time_ms', 'median_query_time_ms',
+    'min_query_time_ms', 'max_query_time_ms', 'avg_es_time_ms',
+    'avg_server_ms', 'avg_client_overhead_ms', 'avg_lexical_ms', 'avg_vector_ms', 'avg_fusion_ms',
+    'avg_hits', 'total_hits', 'cache_hits', 'errors'
+]
+
+# Stage timings that only hybrid queries report (empty for the other query types)
+STAGE_FIELDS = ('lexical', 'vector', 'fusion')
+
+
+class QuantileSketch:
+    """
+    Log-bucketed quantile sketch (DDSketch style).
+    Quantiles are within relative_accuracy of the true value, memory is
+    bounded by the log-range of the values, not by how many were added.
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01, min_value: float = 1e-3):
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.min_value = min_value
+        self.buckets: Dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+
+    def add(self, value: float):
+        self.count += 1
+        if value <= self.min_value:
+            self.zero_count += 1
+            return
+        key = math.ceil(math.log(value) / self.log_gamma)
+        self.buckets[key] = self.buckets.get(key, 0) + 1
+
+    def merge(self, other: 'QuantileSketch'):
+        self.count += other.count
+        self.zero_count += other.zero_count
+        for key, n in other.buckets.items():
+            self.buckets[key] = self.buckets.get(key, 0) + n
+
+    def quantile(self, q: float) -> float:
+        """Approximate q-quantile (0 <= q <= 1), 0 if empty"""
+        if self.count == 0:
+            return 0.0
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if rank < seen:
+                # Midpoint of the bucket (gamma^(key-1), gamma^key]
+                return 2 * self.gamma ** key / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+
+
+class RunningStats:
+    """Count / sum / min / max plus a quantile sketch for one metric"""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.min = None
+        self.max = None
+        self.sketch = QuantileSketch()
+
+    def add(self, value: float):
+        self.count += 1
+        self.total += value
+        self.total_sq += value * value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        self.sketch.add(value)
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    @property
+    def stdev(self) -> float:
+        """Sample standard deviation"""
+        if self.count < 2:
+            return 0.0
+        variance = (self.total_sq - self.total * self.total / self.count) / (self.count - 1)
+        return math.sqrt(max(variance, 0.0))
+
+    @property
+    def ci95_half_width(self) -> float:
+        """Half width of the normal-approximation 95% confidence interval of the mean"""
+        return 1.96 * self.stdev / math.sqrt(self.count) if self.count > 1 else 0.0
+
+    def quantile(self, q: float) -> float:
+        if self.count == 0:
+            return 0.0
+        # The sketch returns bucket midpoints, keep them inside the observed range
+        return min(max(self.sketch.quantile(q), self.min), self.max)
+
+
+class QueryTypeStats:
+    """Running statistics of successful and failed queries of one query type"""
+
+    def __init__(self):
+        self.query_time = RunningStats()
+        self.es_time = RunningStats()
+        self.server_time = RunningStats()
+        self.client_overhead = RunningStats()
+        self.hits = RunningStats()
+        self.stages = {stage: RunningStats() for stage in STAGE_FIELDS}
+        self.cache_hits = 0
+        self.errors = 0
+
+    def add(self, result: dict):
+        if result['error'] is not None:
+            self.errors += 1
+            return
+        self.query_time.add(result['query_time_ms'])
+        self.es_time.add(result['es_took_ms'])
+        self.server_time.add(result.get('server_ms', 0))
+        self.client_overhead.add(result.get('connect_ms', 0) + result.get('send_ms', 0) + result.get('parse_ms', 0))
+        self.hits.add(result['total_hits'])
+        for stage, stats in self.stages.items():
+            if result.get(f'{stage}_ms') is not None:
+                stats.add(result[f'{stage}_ms'])
+        if result.get('cache_hit'):
+            self.cache_hits += 1
+
+    def summary_row(self) -> dict:
+        """Row for the summary CSV, same columns as the in-memory summary used to have"""
+        if self.query_time.count == 0:
+            return {
+                'total_queries': 0,
+                'avg_query_time_ms': 0,
+                'median_query_time_ms': 0,
+                'min_query_time_ms': 0,
+                'max_query_time_ms': 0,
+                'avg_es_time_ms': 0,
+                'avg_server_ms': 0,
+                'avg_client_overhead_ms': 0,
+                **{f'avg_{stage}_ms': '' for stage in STAGE_FIELDS},
+                'avg_hits': 0,
+                'total_hits': 0,
+                'cache_hits': 0,
+                'errors': self.errors
+            }
+        return {
+            'total_queries': self.query_time.count,
+            'avg_query_time_ms': round(self.query_time.mean, 2),
+            'median_query_time_ms': round(self.query_time.quantile(0.5), 2),
+            'min_query_time_ms': round(self.query_time.min, 2),
+            'max_query_time_ms': round(self.query_time.max, 2),
+            'avg_es_time_ms': round(self.es_time.mean, 2),
+            'avg_server_ms': round(self.server_time.mean, 2),
+            'avg_client_overhead_ms': round(self.client_overhead.mean, 2),
+            **{f'avg_{stage}_ms': round(stats.mean, 2) if stats.count else '' for stage, stats in self.stages.items()},
+            'avg_hits': round(self.hits.mean, 2),
+            'total_hits': int(self.hits.total),
+            'cache_hits': self.cache_hits,
+            'errors': self.errors
+        }
+
+
+class RunningSummary:
+    """Incremental summary over all results, grouped by query type"""
+
+    def __init__(self):
+        self.by_type: Dict[str, QueryTypeStats] = {}
+        self.total_queries = 0
+        self.successful_queries = 0
+
+    def add(self, result: dict):
+        self.total_queries += 1
+        if result['error'] is None:
+            self.successful_queries += 1
+        self.by_type.setdefault(result['query_type'], QueryTypeStats()).add(result)
+
+    def rows(self, query_types: List[str]) -> Dict[str, dict]:
+        """Summary rows for the configured query types, then any other type that was seen"""
+        ordered = list(query_types) + [t for t in self.by_type if t not in query_types]
+        return {t: self.by_type.get(t, QueryTypeStats()).summary_row() for t in ordered}
+
+
+class StreamingResultWriter:
+    """
+    Writes result rows to the detailed CSV as they complete.
+    Rows are buffered and flushed every flush_every_rows rows or flush_interval_s
+    seconds, so a crash or SLURM timeout loses at most one flush window.
+    """
+
+    def __init__(self, filename: str, fieldnames: List[str] = None,
+                 flush_every_rows: int = 100, flush_interval_s: float = 5.0,
+                 append: bool = False, last_segment: str = None):
+        self.filename = filename
+        self.fieldnames = fieldnames or DETAILED_FIELDNAMES
+        self.flush_every_rows = flush_every_rows
+        self.flush_interval_s = flush_interval_s
+
+        self.file = open(filename, 'a' if append else 'w', newline='', encoding='utf-8', buffering=1024 * 1024)
+        self.writer = csv.DictWriter(self.file, fieldnames=self.fieldnames, extrasaction='ignore')
+        if self.file.tell() == 0:
+            self.writer.writeheader()
+
+        self.rows_written = 0
+        # When appending, continue the segment separators where the previous run stopped
+        self.current_segment = last_segment
+        self._unflushed = 0
+        self._last_flush = time.monotonic()
+
+    def write(self, result: Dict[str, Any]):
+        # Add separator row between different segments for readability
+        if self.current_segment != result['segment_id'] and self.current_segment is not None:
+            separator_row = {field: '---' if field != 'top_5_hits' else '' for field in self.fieldnames}
+            separator_row['segment_text'] = f"--- END SEGMENT {self.current_segment} ---"
+            self.writer.writerow(separator_row)
+
+        self.writer.writerow(result)
+        self.current_segment = result['segment_id']
+        self.rows_written += 1
+        self._unflushed += 1
+
+        if (self._unflushed >= self.flush_every_rows
+                or time.monotonic() - self._last_flush >= self.flush_interval_s):
+            self.flush()
+
+    def flush(self):
+        self.file.flush()
+        self._unflushed = 0
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
+
+
+def _parse_result_row(row: Dict[str, str]) -> dict:
+    """Convert a detailed CSV row back into a result dict with numeric fields"""
+    result = dict(row)
+    for field in ('query_time_ms', 'connect_ms', 'send_ms', 'server_ms', 'parse_ms', 'max_score'):
+        result[field] = float(row.get(field) or 0)
+    for field in ('repetition', 'es_took_ms', 'total_hits'):
+        result[field] = int(float(row.get(field) or 0))
+    for stage in STAGE_FIELDS:
+        result[f'{stage}_ms'] = float(row[f'{stage}_ms']) if row.get(f'{stage}_ms') else None
+    result['timed_out'] = row.get('timed_out') == 'True'
+    result['cache_hit'] = row.get('cache_hit') == 'True'
+    result['error'] = row.get('error') or None
+    return result
+
+
+def read_completed_results(filename: str, fieldnames: List[str] = None) -> Iterator[dict]:
+    """
+    Yield the complete result rows of a previously streamed detailed CSV.
+    A record cut off by a crash (missing fields, no trailing newline, or a quoted
+    multi-line field such as top_5_hits left open) ends the scan, and the file is
+    truncated right after the last complete record so it can be safely appended to.
+    """
+    fieldnames = fieldnames or DETAILED_FIELDNAMES
+    if not os.path.exists(filename):
+        return
+
+    # quotes: parity of '"' since the last complete record. Escaped quotes come in pairs,
+    # so an odd count means the record ends inside a quoted field
+    position = {'offset': 0, 'newline': True, 'quotes': 0}
+
+    def lines(f):
+        for line in f:
+            position['offset'] += len(line)
+            position['newline'] = line.endswith(b'\n')
+            position['quotes'] += line.count(b'"')
+            yield line.decode('utf-8', errors='replace')
+
+    good_offset = 0
+    with open(filename, 'rb') as f:
+        # strict: EOF inside a quoted field raises instead of returning the partial field
+        reader = csv.reader(lines(f), strict=True)
+        try:
+            header = next(reader)
+            if header != fieldnames:
+                raise ValueError(f"{filename} has columns {header}, expected {fieldnames}")
+            good_offset = position['offset']
+            position['quotes'] = 0
+            for values in reader:
+                if len(values) != len(fieldnames) or not position['newline'] or position['quotes'] % 2:
+                    break
+                good_offset = position['offset']
+                position['quotes'] = 0
+                row = dict(zip(fieldnames, values))
+                if row['segment_id'] == '---':
+                    continue  # separator row
+                yield _parse_result_row(row)
+        except StopIteration:
+            pass  # empty file
+        except csv.Error:
+            pass  # truncated quoted field at end of file
+
+    if good_offset < os.path.getsize(filename):
+        print(f"Truncating incomplete trailing record in {filename}")
+        with open(filename, 'r+b') as f:
+            f.truncate(good_offset)
+
+
+class ProgressReporter:
+    """
+    Rate-limited progress output: prints at most once every interval_s seconds
+    instead of a line per segment/query, which is slow on shared filesystems.
+    """
+
+    def __init__(self, total_segments: int = None, interval_s: float = 30.0):
+        self.total_segments = total_segments
+        self.interval_s = interval_s
+        self.segments = 0
+        self.skipped = 0
+        self.queries = 0
+        self.errors = 0
+        self.start = time.monotonic()
+        self._last_report = self.start
+
+    def segment_read(self):
+        self.segments += 1
+
+    def segment_skipped(self):
+        self.skipped += 1
+
+    def query_done(self, result: dict):
+        self.queries += 1
+        if result.get('error') is not None:
+            self.errors += 1
+        now = time.monotonic()
+        if now - self._last_report >= self.interval_s:
+            self._last_report = now
+            self.report()
+
+    def report(self, final: bool = False):
+        elapsed = time.monotonic() - self.start
+        rate = self.queries / elapsed if elapsed > 0 else 0.0
+        of_total = f"/{self.total_segments}" if self.total_segments is not None else ""
+        prefix = "Done" if final else "Progress"
+        print(f"{prefix}: {self.segments}{of_total} segments read, {self.skipped} empty skipped, "
+              f"{self.queries} queries ({self.errors} errors) in {elapsed:.1f}s, {rate:.1f} queries/s",
+              flush=True)
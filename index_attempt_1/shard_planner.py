@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+File-range sharding of an indexing run across a SLURM job array
+plan     - scan DATA_DIR and balance Parquet files by bytes or rows over N array tasks (manifest JSON)
+snapshot - at the end of an array task, snapshot its index to the task's own fs repository
+finalize - restore every task snapshot into one cluster and alias them, or reindex into one index
+
+Every array task runs its own single-node ES, so task indices are combined through
+snapshots. Each task writes to its own repository directory (task_<k>) because
+several clusters must never write to the same ES repository.
+"""
+
+import argparse
+import heapq
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List
+
+from es_transport import ESTransport
+from parquet_files import list_parquet_files
+
+LONG_TIMEOUT_S = 6 * 3600  # Snapshot, restore and reindex block until done
+
+
+def task_index_name(index_name: str, task_id: int) -> str:
+    """Index written by one array task (my_indexer.sh uses the same naming)"""
+    return f"{index_name}_task{task_id}"
+
+
+def _file_info(path: str) -> Dict:
+    import pyarrow.parquet as pq
+
+    metadata = pq.ParquetFile(path).metadata  # footer only
+    return {'path': path, 'bytes': os.path.getsize(path), 'rows': metadata.num_rows,
+            'row_groups': metadata.num_row_groups}
+
+
+def scan_files(data_dir: str, threads: int = 16) -> List[Dict]:
+    """Size and row count of every Parquet file; footers are read in parallel (latency bound on Lustre)"""
+    files = list_parquet_files(data_dir)
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        return list(executor.map(_file_info, files))
+
+
+def balance(files: List[Dict], num_tasks: int, balance_by: str = 'bytes') -> List[List[Dict]]:
+    """Longest-processing-time greedy: biggest file first onto the least loaded task"""
+    heap = [(0, task_id) for task_id in range(num_tasks)]
+    tasks = [[] for _ in range(num_tasks)]
+    for info in sorted(files, key=lambda f: f[balance_by], reverse=True):
+        load, task_id = heapq.heappop(heap)
+        tasks[task_id].append(info)
+        heapq.heappush(heap, (load + info[balance_by], task_id))
+    # Sorted paths within a task keep reads in directory order
+    return [sorted(task, key=lambda f: f['path']) for task in tasks]
+
+
+def plan(data_dir: str, index_name: str, num_tasks: int = None, target_gb_per_task: float = None,
+         balance_by: str = 'bytes') -> Dict:
+    files = scan_files(data_dir)
+    if not files:
+        raise ValueError(f"No parquet files found in {data_dir}")
+    total_bytes = sum(f['bytes'] for f in files)
+    if num_tasks is None:
+        num_tasks = max(1, round(total_bytes / (target_gb_per_task * 1024 ** 3)))
+    num_tasks = min(num_tasks, len(files))
+
+    tasks = []
+    for task_id, task_files in enumerate(balance(files, num_tasks, balance_by)):
+        tasks.append({
+            'task_id': task_id,
+            'index_name': task_index_name(index_name, task_id),
+            'files': [f['path'] for f in task_files],
+            'bytes': sum(f['bytes'] for f in task_files),
+            'rows': sum(f['rows'] for f in task_files),
+            'row_groups': sum(f['row_groups'] for f in task_files)
+        })
+    return {
+        'created': datetime.now().isoformat(),
+        'data_dir': data_dir,
+        'index_name': index_name,
+        'balance_by': balance_by,
+        'num_tasks': num_tasks,
+        'total_files': len(files),
+        'total_bytes': total_bytes,
+        'total_rows': sum(f['rows'] for f in files),
+        'tasks': tasks
+    }
+
+
+def load_manifest(path: str) -> Dict:
+    with open(path, 'r', encoding='utf-8') as file:
+        return json.load(file)
+
+
+def print_plan(manifest: Dict):
+    key = manifest['balance_by']
+    loads = [task[key] for task in manifest['tasks']]
+    mean = sum(loads) / len(loads)
+    print(f"{manifest['total_files']} files, {manifest['total_bytes'] / 1e9:.2f} GB, "
+          f"{manifest['total_rows']} rows -> {manifest['num_tasks']} tasks balanced by {key}")
+    for task in manifest['tasks']:
+        print(f"  task {task['task_id']:>4}: {len(task['files']):>5} files, {task['bytes'] / 1e9:8.2f} GB, "
+              f"{task['rows']:>12} rows -> {task['index_name']}")
+    print(f"Imbalance (max / mean {key}): {max(loads) / mean if mean else 0:.3f}")
+
+
+def _check(response, decoded, what: str):
+    if response.status_code >= 300:
+        raise RuntimeError(f"{what} failed: {decoded}")
+    return decoded
+
+
+def register_repository(transport: ESTransport, name: str, location: str, readonly: bool = False):
+    body = {'type': 'fs', 'settings': {'location': location, 'readonly': readonly}}
+    _check(*transport.request('PUT', f"_snapshot/{name}", body)[:2], f"Registering repository {name}")
+
+
+def snapshot_task(transport: ESTransport, manifest: Dict, task_id: int, repo_dir: str):
+    """Snapshot one task's index into <repo_dir>/task_<k> (ES must run with path.repo covering repo_dir)"""
+    task = manifest['tasks'][task_id]
+    repository = f"task_{task_id}"
+    location = os.path.join(repo_dir, repository)
+    os.makedirs(location, exist_ok=True)
+    register_repository(transport, repository, location)
+
+    # A rerun of the task replaces its snapshot: PUT of an existing snapshot name is rejected
+    response, decoded, _ = transport.request('DELETE', f"_snapshot/{repository}/{task['index_name']}",
+                                             timeout=LONG_TIMEOUT_S)
+    if response.status_code != 404:
+        _check(response, decoded, f"Deleting the previous snapshot of {task['index_name']}")
+
+    start = time.perf_counter()
+    body = {'indices': task['index_name'], 'include_global_state': False}
+    _check(*transport.request('PUT', f"_snapshot/{repository}/{task['index_name']}?wait_for_completion=true",
+                              body, timeout=LONG_TIMEOUT_S)[:2], f"Snapshot of {task['index_name']}")
+    print(f"Snapshot {repository}/{task['index_name']} written to {location} in {time.perf_counter() - start:.1f}s")
+
+
+def finalize(transport: ESTransport, manifest: Dict, repo_dir: str, mode: str = 'alias',
+             index_config_file: str = None):
+    """
+    Restore every task snapshot into this cluster, then either register them all
+    under the alias manifest['index_name'] or reindex them into that one index
+    """
+    index_name = manifest['index_name']
+    task_indices = []
+    for task in manifest['tasks']:
+        repository = f"task_{task['task_id']}"
+        register_repository(transport, repository, os.path.join(repo_dir, repository), readonly=True)
+        start = time.perf_counter()
+        _check(*transport.request('POST', f"_snapshot/{repository}/{task['index_name']}/_restore"
+                                  f"?wait_for_completion=true",
+                                  {'indices': task['index_name'], 'include_global_state': False},
+                                  timeout=LONG_TIMEOUT_S)[:2], f"Restore of {task['index_name']}")
+        task_indices.append(task['index_name'])
+        print(f"Restored {task['index_name']} in {time.perf_counter() - start:.1f}s")
+
+    if mode == 'alias':
+        actions = [{'add': {'index': name, 'alias': index_name}} for name in task_indices]
+        _check(*transport.request('POST', '_aliases', {'actions': actions})[:2], f"Alias {index_name}")
+        print(f"Alias '{index_name}' -> {len(task_indices)} task indices")
+        return
+
+    # reindex: one physical index, task indices are dropped afterwards
+    body = None
+    if index_config_file:
+        with open(index_config_file, 'r', encoding='utf-8') as file:
+            body = json.load(file)
+    _check(*transport.request('PUT', index_name, body)[:2], f"Creating {index_name}")
+    current = _check(*transport.request('GET', f"{index_name}/_settings?flat_settings=true")[:2],
+                     f"Reading the settings of {index_name}")
+    current = next(iter(current.values()), {}).get('settings', {})
+    original = {key: current.get(key) for key in ('index.refresh_interval', 'index.number_of_replicas')}
+    _check(*transport.request('PUT', f"{index_name}/_settings",
+                              {'index.refresh_interval': '-1', 'index.number_of_replicas': '0'})[:2],
+           f"Bulk-load settings of {index_name}")
+    start = time.perf_counter()
+    decoded = _check(*transport.request('POST', '_reindex?wait_for_completion=true&slices=auto',
+                                        {'source': {'index': task_indices}, 'dest': {'index': index_name}},
+                                        timeout=LONG_TIMEOUT_S)[:2], f"Reindex into {index_name}")
+    print(f"Reindexed {decoded.get('total', 0)} documents into '{index_name}' in {time.perf_counter() - start:.1f}s")
+    # A failure here would leave the combined index without replicas or refreshes: not a success
+    _check(*transport.request('PUT', f"{index_name}/_settings", original)[:2],
+           f"Restoring the settings of {index_name} ({original})")
+    _check(*transport.request('POST', f"{index_name}/_refresh", timeout=LONG_TIMEOUT_S)[:2],
+           f"Refresh of {index_name}")
+    for name in task_indices:
+        _check(*transport.request('DELETE', name)[:2], f"Deleting task index {name}")
+    print(f"Deleted {len(task_indices)} task indices")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shard an indexing run across a SLURM job array")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    plan_parser = subparsers.add_parser('plan', help="Balance DATA_DIR's Parquet files over array tasks")
+    plan_parser.add_argument('--data-dir', required=True)
+    plan_parser.add_argument('--index-name', required=True, help="Final index/alias name")
+    plan_parser.add_argument('--manifest', required=True, help="Manifest JSON to write")
+    group = plan_parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('--num-tasks', type=int)
+    group.add_argument('--target-gb-per-task', type=float)
+    plan_parser.add_argument('--balance-by', choices=['bytes', 'rows'], default='bytes')
+
+    for command in ('snapshot', 'finalize'):
+        sub = subparsers.add_parser(command)
+        sub.add_argument('--manifest', required=True)
+        sub.add_argument('--repo-dir', required=True, help="Shared directory listed in ES path.repo")
+        sub.add_argument('--es-host', default='localhost')
+        sub.add_argument('--es-port', type=int, default=9200)
+    subparsers.choices['snapshot'].add_argument(
+        '--task-id', type=int, default=int(os.environ.get('SLURM_ARRAY_TASK_ID', 0)))
+    subparsers.choices['finalize'].add_argument('--mode', choices=['alias', 'reindex'], default='alias')
+    subparsers.choices['finalize'].add_argument('--index-config', default=None,
+                                                help="Settings/mappings for the reindex target")
+    args = parser.parse_args()
+
+    if args.command == 'plan':
+        try:
+            manifest = plan(args.data_dir, args.index_name, args.num_tasks, args.target_gb_per_task,
+                            args.balance_by)
+        except ValueError as e:
+            print(e)
+            sys.exit(1)
+        os.makedirs(os.path.dirname(os.path.abspath(args.manifest)), exist_ok=True)
+        with open(args.manifest, 'w', encoding='utf-8') as file:
+            json.dump(manifest, file, indent=2)
+        print_plan(manifest)
+        print(f"Manifest written to {args.manifest}")
+        return
+
+    manifest = load_manifest(args.manifest)
+    transport = ESTransport(f"http://{args.es_host}:{args.es_port}", pool_size=1, timeout=120)
+    try:
+        if args.command == 'snapshot':
+            snapshot_task(transport, manifest, args.task_id, args.repo_dir)
+        else:
+            finalize(transport, manifest, args.repo_dir, args.mode, args.index_config)
+    except RuntimeError as e:
+        print(e)
+        sys.exit(1)
+    finally:
+        transport.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+#!/bin/bash
+# Plan and submit a sharded FineWeb index build:
+#   1. shard_planner.py balances DATA_DIR's Parquet files over NUM_TASKS (by bytes or rows) -> manifest
+#   2. a job array of my_indexer.sh, task k indexes its files into ${INDEX_NAME}_task<k> and snapshots it
+#   3. a finalize my_indexer.sh job (after the whole array succeeded) restores the snapshots and
+#      aliases them as INDEX_NAME, or reindexes them into one index
+# Run on the login node: DATA_DIR=... INDEX_NAME=... NUM_TASKS=16 ./submit_index_array.sh
+set -e
+
+SCRIPT_DIR="${SCRIPT_DIR:-/capstor/scratch/cscs/anastasiia_kucherenko/index_attempt_1}"
+DATA_DIR="${DATA_DIR:-}"
+INDEX_NAME="${INDEX_NAME:-fineweb_test_1}"
+NUM_TASKS="${NUM_TASKS:-}"                        # Array size...
+TARGET_GB_PER_TASK="${TARGET_GB_PER_TASK:-20}"   # ...or derived from the data size when NUM_TASKS is empty
+BALANCE_BY="${BALANCE_BY:-bytes}"                # 'bytes' or 'rows'
+MAX_PARALLEL="${MAX_PARALLEL:-}"                 # Max array tasks running at once (empty = no limit)
+FINALIZE_MODE="${FINALIZE_MODE:-alias}"          # 'alias' or 'reindex'
+WORK_DIR="${WORK_DIR:-/capstor/scratch/cscs/anastasiia_kucherenko/fineweb_indexing/${INDEX_NAME}}"
+MANIFEST="${MANIFEST:-${WORK_DIR}/manifest.json}"
+SNAPSHOT_REPO_DIR="${SNAPSHOT_REPO_DIR:-${WORK_DIR}/snapshots}"
+PYTHON="${PYTHON:-python3}"                      # Needs pyarrow, e.g. "srun --environment=elastictest python3"
+
+# Colors for output
+RED='\033[0;31m'
+GREEN='\033[0;32m'
+BLUE='\033[0;34m'
+NC='\033[0m' # No Color
+
+log_info() {
+    echo -e "${BLUE}[INFO]${NC} $1"
+}
+
+log_error() {
+    echo -e "${RED}[ERROR]${NC} $1"
+}
+
+log_success() {
+    echo -e "${GREEN}[SUCCESS]${NC} $1"
+}
+
+if [ -z "$DATA_DIR" ]; then
+    log_error "DATA_DIR is required"
+    log_info "Usage: DATA_DIR=/path/to/parquet INDEX_NAME=name [NUM_TASKS=n | TARGET_GB_PER_TASK=20] $0"
+    log_info "  BALANCE_BY=bytes                        # Balance tasks by 'bytes' or 'rows'"
+    log_info "  MAX_PARALLEL=                           # Array throttle (sbatch --array=...%N)"
+    log_info "  FINALIZE_MODE=alias                     # 'alias' task indices or 'reindex' into one"
+    log_info "  WORK_DIR=.../fineweb_indexing/INDEX_NAME # Manifest and snapshot repository location"
+    exit 1
+fi
+
+mkdir -p "$WORK_DIR" "$SNAPSHOT_REPO_DIR"
+
+# 1. Plan
+log_info "Planning shards of $DATA_DIR..."
+if [ -n "$NUM_TASKS" ]; then
+    size_arg="--num-tasks $NUM_TASKS"
+else
+    size_arg="--target-gb-per-task $TARGET_GB_PER_TASK"
+fi
+$PYTHON "$SCRIPT_DIR/shard_planner.py" plan \
+    --data-dir "$DATA_DIR" \
+    --index-name "$INDEX_NAME" \
+    --manifest "$MANIFEST" \
+    --balance-by "$BALANCE_BY" \
+    $size_arg
+
+num_tasks=$(python3 -c "import json; print(json.load(open('$MANIFEST'))['num_tasks'])")
+
+# 2. Index array
+array_spec="0-$((num_tasks - 1))${MAX_PARALLEL:+%$MAX_PARALLEL}"
+array_job=$(sbatch --parsable --array="$array_spec" \
+    --export=ALL,DATA_DIR="$DATA_DIR",INDEX_NAME="$INDEX_NAME",MANIFEST="$MANIFEST",SNAPSHOT_REPO_DIR="$SNAPSHOT_REPO_DIR",INDEX_STAGE=index \
+    "$SCRIPT_DIR/my_indexer.sh")
+log_success "Submitted index array job $array_job ($array_spec)"
+
+# 3. Finalize once every task succeeded
+finalize_job=$(sbatch --parsable --dependency=afterok:"$array_job" \
+    --export=ALL,INDEX_NAME="$INDEX_NAME",MANIFEST="$MANIFEST",SNAPSHOT_REPO_DIR="$SNAPSHOT_REPO_DIR",INDEX_STAGE=finalize,FINALIZE_MODE="$FINALIZE_MODE" \
+    "$SCRIPT_DIR/my_indexer.sh")
+log_success "Submitted finalize job $finalize_job (after $array_job)"
+log_info "Manifest: $MANIFEST"
+log_info "Snapshots: $SNAPSHOT_REPO_DIR"
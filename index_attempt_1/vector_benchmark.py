@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Recall / speed / memory benchmark of FAISS index types on an embedding sample
+Draws a database sample and held-out query vectors from dense_index.py embedding directories
+(or embeds a query file), takes the exact top k of each query from a flat inner-product
+search, then builds every requested index type on the same sample and reports per search
+setting (nprobe for IVF types, efSearch for HNSW):
+
+  recall_at_k       share of the exact top k found in the approximate top k
+  qps               queries per second, one batched search over all queries
+  train_s, build_s  training and total build time
+  index_mb          serialized index size, i.e. its memory once loaded
+  rss_mb            growth of the process resident set while it was built
+  full_gb           index_mb scaled to every row of the embedding directories
+
+One CSV row per index type and search setting, plus a JSON report with the configuration.
+"""
+
+import argparse
+import csv
+import gc
+import json
+import os
+import resource
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+
+from dense_index import (INDEX_TYPES, IVF_TYPES, EmbeddingStore, default_train_size, make_encoder, new_faiss_index,
+                         set_search_params)
+
+DEFAULT_TYPES = ['flat', 'sq8', 'pq', 'opq', 'ivf', 'ivfsq8', 'ivfpq', 'opqivfpq', 'hnsw']
+RESULT_FIELDNAMES = [
+    'index_type', 'factory', 'nprobe', 'ef_search', 'k', 'recall_at_k', 'qps', 'train_s', 'build_s',
+    'index_mb', 'bytes_per_vector', 'rss_mb', 'full_gb', 'database_rows', 'queries'
+]
+
+
+def resident_mb() -> float:
+    """Current resident set size (VmRSS); peak RSS where /proc is not available"""
+    try:
+        with open('/proc/self/status', encoding='utf-8') as file:
+            for line in file:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def recall_at_k(found: np.ndarray, exact: np.ndarray, k: int) -> float:
+    """Mean |approximate top k & exact top k| / k over the queries"""
+    return float(np.mean([len(set(f[:k].tolist()) & set(e[:k].tolist())) / k for f, e in zip(found, exact)]))
+
+
+def exact_neighbors(database: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    import faiss
+
+    index = faiss.IndexFlatIP(database.shape[1])
+    index.add(database)
+    return index.search(queries, k)[1]
+
+
+def benchmark_index(index_type: str, database: np.ndarray, queries: np.ndarray, exact: np.ndarray, k: int,
+                    full_rows: int, nlist: int = None, m: int = 32, ef_construction: int = 200,
+                    pq_m: int = None, pq_bits: int = 8, nprobes: List[int] = (1, 4, 16, 64),
+                    ef_searches: List[int] = (16, 64, 256), seed: int = 0) -> List[Dict[str, Any]]:
+    """Build index_type over database, then time and score every search setting"""
+    import faiss
+
+    rss_before = resident_mb()
+    start = time.perf_counter()
+    index, params = new_faiss_index(index_type, database.shape[1], len(database), nlist, m, ef_construction,
+                                    pq_m, pq_bits)
+    if not index.is_trained:
+        train_size = default_train_size(params, len(database))
+        rows = np.sort(np.random.default_rng(seed).choice(len(database), size=train_size, replace=False))
+        index.train(database[rows])
+    train_s = time.perf_counter() - start
+    for offset in range(0, len(database), 100000):
+        index.add(database[offset:offset + 100000])
+    build_s = time.perf_counter() - start
+    rss_mb = resident_mb() - rss_before
+    index_bytes = faiss.serialize_index(index).nbytes
+
+    if index_type in IVF_TYPES:
+        settings = [{'nprobe': nprobe} for nprobe in nprobes if nprobe <= params['nlist']]
+    elif index_type == 'hnsw':
+        settings = [{'ef_search': ef_search} for ef_search in ef_searches]
+    else:
+        settings = [{}]
+    results = []
+    for setting in settings:
+        set_search_params(index, **setting)
+        index.search(queries[:min(len(queries), 16)], k)  # Warm-up: first touch of lists and codes
+        search_start = time.perf_counter()
+        found = index.search(queries, k)[1]
+        elapsed = time.perf_counter() - search_start
+        results.append({
+            'index_type': index_type,
+            'factory': params['factory'],
+            'nprobe': setting.get('nprobe'),
+            'ef_search': setting.get('ef_search'),
+            'k': k,
+            'recall_at_k': round(recall_at_k(found, exact, k), 4),
+            'qps': round(len(queries) / elapsed, 1) if elapsed else None,
+            'train_s': round(train_s, 2),
+            'build_s': round(build_s, 2),
+            'index_mb': round(index_bytes / 1024 ** 2, 2),
+            'bytes_per_vector': round(index_bytes / len(database), 1),
+            'rss_mb': round(rss_mb, 1),
+            'full_gb': round(index_bytes / len(database) * full_rows / 1024 ** 3, 2),
+            'database_rows': len(database),
+            'queries': len(queries),
+        })
+    del index
+    gc.collect()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall@k, QPS, build time and memory of FAISS index types")
+    parser.add_argument('--embeddings', nargs='+', required=True, help="Embedding directories from dense_index.py")
+    parser.add_argument('--output', required=True, help="Results CSV (a .json report is written next to it)")
+    parser.add_argument('--types', nargs='+', choices=INDEX_TYPES, default=DEFAULT_TYPES,
+                        help="Index types to compare")
+    parser.add_argument('--database-rows', type=int, default=1000000, help="Indexed sample size")
+    parser.add_argument('--queries', type=int, default=1000, help="Held-out sample rows used as queries")
+    parser.add_argument('--query-file', default=None, help="Embed these query segments instead (CSV/JSONL/Parquet)")
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--nlist', type=int, default=None, help="IVF lists (default ~4 sqrt(database rows))")
+    parser.add_argument('--m', type=int, default=32, help="HNSW neighbours per node")
+    parser.add_argument('--ef-construction', type=int, default=200)
+    parser.add_argument('--pq-m', type=int, default=None, help="PQ codes per vector (default: dim / 8 or below)")
+    parser.add_argument('--pq-bits', type=int, default=8)
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[1, 4, 16, 64])
+    parser.add_argument('--ef-search', type=int, nargs='+', default=[16, 64, 256])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('SLURM_CPUS_PER_TASK', 0)) or None)
+    parser.add_argument('--cache-dir', default=None, help="Embedding cache for --query-file")
+    parser.add_argument('--model-dir', default=None)
+    args = parser.parse_args()
+
+    import faiss
+
+    if args.threads:
+        faiss.omp_set_num_threads(args.threads)
+    store = EmbeddingStore(args.embeddings)
+    rng = np.random.default_rng(args.seed)
+    if args.query_file:
+        from query_source import iter_query_rows
+
+        texts = [row['segment_text'] for row in iter_query_rows(args.query_file, 0, args.queries)]
+        encoder = make_encoder(store.model, store.max_length, args.threads, cache_dir=args.cache_dir,
+                               model_dir=args.model_dir)
+        queries = encoder.encode(texts)
+        database = store.sample(args.database_rows, args.seed)
+    else:
+        # Held out: query rows are drawn with the database sample but never indexed
+        vectors = store.sample(args.database_rows + args.queries, args.seed)
+        order = rng.permutation(len(vectors))
+        queries, database = vectors[order[:args.queries]], vectors[order[args.queries:]]
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    database = np.ascontiguousarray(database, dtype=np.float32)
+    print(f"Benchmark: {len(database)} of {store.rows} vectors ({store.dim}-d {store.model}), "
+          f"{len(queries)} queries, k={args.k}")
+
+    start = time.perf_counter()
+    exact = exact_neighbors(database, queries, args.k)
+    print(f"Exact top {args.k} in {time.perf_counter() - start:.1f}s")
+
+    results = []
+    for index_type in args.types:
+        print(f"Building {index_type}...")
+        for result in benchmark_index(index_type, database, queries, exact, args.k, store.rows, args.nlist,
+                                      args.m, args.ef_construction, args.pq_m, args.pq_bits, args.nprobe,
+                                      args.ef_search, args.seed):
+            setting = (f" nprobe={result['nprobe']}" if result['nprobe'] is not None else
+                       f" efSearch={result['ef_search']}" if result['ef_search'] is not None else '')
+            print(f"  {index_type}{setting}: recall@{args.k} {result['recall_at_k']:.3f}, {result['qps']} q/s, "
+                  f"{result['index_mb']} MB ({result['bytes_per_vector']} B/vector, ~{result['full_gb']} GB "
+                  f"for all {store.rows}), build {result['build_s']}s, RSS +{result['rss_mb']} MB")
+            results.append(result)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.DictWriter(file, fieldnames=RESULT_FIELDNAMES)
+        writer.writeheader()
+        writer.writerows(results)
+    with open(os.path.splitext(args.output)[0] + '.json', 'w', encoding='utf-8') as file:
+        json.dump({'config': {**vars(args), 'store_rows': store.rows, 'dim': store.dim, 'model': store.model},
+                   'results': results}, file, indent=2)
+    print(f"Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Length-bucketed batch inference for the sentiment classifiers of sentiment.ipynb and
+Fine_tuning_HFace.ipynb
+trainer.predict pads every fixed-size batch to its longest review, and IMDB mixes 50-token
+and 512-token reviews, so most of the compute goes to padding. Here every text is tokenized
+once without padding, the texts are sorted by token count, and batches are packed under a
+token budget (batch size x longest sequence), so short reviews run in large batches and long
+ones in small batches. Logits come back in input order, with tokens/sec statistics.
+
+    from sentiment_inference import predict_logits
+    logits, stats = predict_logits(model, tokenizer, raw_datasets["test"]["text"], max_tokens=16384)
+"""
+
+import argparse
+import time
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+
+def token_budget_batches(lengths: List[int], max_tokens: int = 16384, max_batch_size: int = 512,
+                         sort: bool = True) -> List[List[int]]:
+    """
+    Index batches whose padded size (count x longest) stays within max_tokens. Sorted longest
+    first, so the largest padded batch runs first; sort=False keeps input order (the fixed
+    batch baseline when max_tokens is large)
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True) if sort else range(len(lengths))
+    batches: List[List[int]] = []
+    batch: List[int] = []
+    longest = 0
+    for i in order:
+        length = max(lengths[i], 1)
+        if batch and (len(batch) >= max_batch_size or (len(batch) + 1) * max(longest, length) > max_tokens):
+            batches.append(batch)
+            batch, longest = [], 0
+        batch.append(i)
+        longest = max(longest, length)
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def pad_batch(input_ids: List[List[int]], pad_token_id: int) -> Tuple[np.ndarray, np.ndarray]:
+    """(input_ids, attention_mask) int64 arrays padded to the longest sequence of the batch"""
+    width = max(len(ids) for ids in input_ids)
+    padded = np.full((len(input_ids), width), pad_token_id, dtype=np.int64)
+    mask = np.zeros((len(input_ids), width), dtype=np.int64)
+    for row, ids in enumerate(input_ids):
+        padded[row, :len(ids)] = ids
+        mask[row, :len(ids)] = 1
+    return padded, mask
+
+
+def predict_logits(model, tokenizer, texts: List[str], max_tokens: int = 16384, max_batch_size: int = 512,
+                   max_length: int = None, sort: bool = True, threads: int = None,
+                   progress_every: int = 0) -> Tuple[np.ndarray, Dict[str, Any]]:
+    """
+    (len(texts), num_labels) float32 logits in input order, and throughput statistics:
+    real and padded token counts, tokenize/inference seconds, tokens/sec and examples/sec
+    """
+    import torch
+
+    if threads:
+        torch.set_num_threads(threads)
+    model.eval()
+    start = time.perf_counter()
+    # Fast tokenizers encode the whole list in parallel; truncation as in the notebooks
+    input_ids = tokenizer(list(texts), truncation=True, max_length=max_length)['input_ids']
+    tokenize_s = time.perf_counter() - start
+
+    lengths = [len(ids) for ids in input_ids]
+    batches = token_budget_batches(lengths, max_tokens, max_batch_size, sort)
+    logits = None
+    padded_tokens = 0
+    start = time.perf_counter()
+    with torch.inference_mode():
+        for number, batch in enumerate(batches, start=1):
+            ids, mask = pad_batch([input_ids[i] for i in batch], tokenizer.pad_token_id)
+            padded_tokens += ids.size
+            output = model(input_ids=torch.from_numpy(ids), attention_mask=torch.from_numpy(mask)).logits
+            if logits is None:
+                logits = np.empty((len(texts), output.shape[-1]), dtype=np.float32)
+            logits[batch] = output.float().numpy()
+            if progress_every and number % progress_every == 0:
+                elapsed = time.perf_counter() - start
+                print(f"Batch {number}/{len(batches)}: {padded_tokens / elapsed:.0f} padded tokens/s")
+    inference_s = time.perf_counter() - start
+
+    real_tokens = sum(lengths)
+    stats = {
+        'examples': len(texts),
+        'batches': len(batches),
+        'tokens': real_tokens,
+        'padded_tokens': padded_tokens,
+        'padding_share': round(1 - real_tokens / padded_tokens, 4) if padded_tokens else 0.0,
+        'tokenize_s': round(tokenize_s, 2),
+        'inference_s': round(inference_s, 2),
+        'tokens_per_s': round(real_tokens / inference_s, 1) if inference_s else None,
+        'examples_per_s': round(len(texts) / inference_s, 1) if inference_s else None,
+    }
+    if logits is None:
+        logits = np.empty((0, model.config.num_labels), dtype=np.float32)
+    return logits, stats
+
+
+def stats_line(stats: Dict[str, Any]) -> str:
+    return (f"{stats['examples']} examples in {stats['batches']} batches: {stats['inference_s']}s inference "
+            f"(+{stats['tokenize_s']}s tokenization), {stats['tokens_per_s']} tokens/s, "
+            f"{stats['examples_per_s']} examples/s, padding {stats['padding_share']:.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score a text dataset with a sequence classifier, "
+                                                 "length-bucketed under a token budget")
+    parser.add_argument('--model', default='distilbert-base-uncased', help="Checkpoint or fine-tuned model directory")
+    parser.add_argument('--dataset', default='stanfordnlp/imdb')
+    parser.add_argument('--split', default='test')
+    parser.add_argument('--text-column', default='text')
+    parser.add_argument('--limit', type=int, default=None, help="First N examples only")
+    parser.add_argument('--max-tokens', type=int, default=16384, help="Padded tokens per batch")
+    parser.add_argument('--max-batch-size', type=int, default=512)
+    parser.add_argument('--threads', type=int, default=None)
+    parser.add_argument('--compare-batch-size', type=int, default=None,
+                        help="Also run unsorted fixed batches of this size (the trainer.predict layout)")
+    args = parser.parse_args()
+
+    from datasets import load_dataset
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+    dataset = load_dataset(args.dataset, split=args.split)
+    if args.limit:
+        dataset = dataset.select(range(min(args.limit, len(dataset))))
+    tokenizer = AutoTokenizer.from_pretrained(args.model)
+    model = AutoModelForSequenceClassification.from_pretrained(args.model)
+    texts = dataset[args.text_column]
+
+    runs = [('bucketed', {'max_tokens': args.max_tokens, 'max_batch_size': args.max_batch_size})]
+    if args.compare_batch_size:
+        runs.append(('fixed', {'max_tokens': 1 << 62, 'max_batch_size': args.compare_batch_size, 'sort': False}))
+    for name, options in runs:
+        logits, stats = predict_logits(model, tokenizer, texts, threads=args.threads, **options)
+        print(f"{name}: {stats_line(stats)}")
+        if 'label' in dataset.column_names:
+            accuracy = float(np.mean(logits.argmax(-1) == np.asarray(dataset['label'])))
+            print(f"{name}: accuracy {accuracy:.4f}")
+
+
+if __name__ == "__main__":
+    main()
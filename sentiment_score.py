@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+CPU batch scoring with a fine-tuned sentiment classifier (e.g. the distilbert of
+Fine_tuning_HFace.ipynb, saved with trainer.save_model)
+Streams texts from Parquet, CSV or JSONL files, scores them in a pool of worker processes
+(each loads the model once, optionally int8 dynamically quantized, and runs the
+length-bucketed batches of sentiment_inference.py under torch.inference_mode), and streams
+predictions and class probabilities to one Parquet file per input file:
+
+  <output_dir>/<input path>.sentiment.parquet   id columns, label, label_name, prob_<label>...
+
+where <input path> is relative to the input directory, so subdirectories (e.g. FineWeb dumps,
+which repeat file names) are mirrored under output_dir.
+
+Outputs are written under a .tmp name and renamed when complete, so a rerun (or a requeued
+SLURM job) skips the files that are already scored.
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterator, List, Tuple
+
+import numpy as np
+
+from sentiment_inference import predict_logits
+
+INPUT_EXTENSIONS = ('.parquet', '.csv', '.jsonl')
+OUTPUT_SUFFIX = '.sentiment.parquet'
+
+# Model of this process (one per worker), loaded by load_worker_model
+_model = None
+_tokenizer = None
+
+
+def list_input_files(input_path: str, file_range_start: int = None, file_range_end: int = None,
+                     exclude_dir: str = None) -> List[str]:
+    """
+    input_path itself, or the sorted supported files under it ([start, end) slice for job arrays).
+    Outputs of this script (finished or .tmp, or anything under exclude_dir, the output directory)
+    are not inputs, so an output_dir inside input_path does not shift the file ranges of a rerun.
+    """
+    if os.path.isfile(input_path):
+        return [input_path]
+    exclude = os.path.join(os.path.abspath(exclude_dir), '') if exclude_dir else None
+    files = sorted(path for path in glob.glob(os.path.join(input_path, '**', '*'), recursive=True)
+                   if path.endswith(INPUT_EXTENSIONS) and not path.endswith((OUTPUT_SUFFIX, '.tmp'))
+                   and not (exclude and os.path.abspath(path).startswith(exclude)))
+    start = file_range_start or 0
+    end = len(files) if file_range_end is None else file_range_end
+    return files[start:end]
+
+
+def iter_record_batches(path: str, columns: List[str], batch_rows: int) -> Iterator[Dict[str, list]]:
+    """Column dict batches of at most batch_rows rows; only columns present in the file"""
+    if path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+
+        parquet_file = pq.ParquetFile(path)
+        present = [c for c in columns if c in parquet_file.schema_arrow.names]
+        for batch in parquet_file.iter_batches(batch_size=batch_rows, columns=present):
+            yield batch.to_pydict()
+    elif path.endswith('.csv'):
+        import pyarrow.csv as pa_csv
+
+        reader = pa_csv.open_csv(path, read_options=pa_csv.ReadOptions(block_size=16 << 20),
+                                 convert_options=pa_csv.ConvertOptions(include_missing_columns=True,
+                                                                       include_columns=columns))
+        pending: Dict[str, list] = {c: [] for c in columns}
+        for batch in reader:
+            for column, values in batch.to_pydict().items():
+                pending[column].extend(values)
+            while len(pending[columns[0]]) >= batch_rows:
+                yield {c: v[:batch_rows] for c, v in pending.items()}
+                pending = {c: v[batch_rows:] for c, v in pending.items()}
+        if pending[columns[0]]:
+            yield pending
+    else:
+        rows: List[dict] = []
+        with open(path, encoding='utf-8') as file:
+            for line in file:
+                if line.strip():
+                    rows.append(json.loads(line))
+                if len(rows) >= batch_rows:
+                    yield {c: [row.get(c) for row in rows] for c in columns}
+                    rows = []
+        if rows:
+            yield {c: [row.get(c) for row in rows] for c in columns}
+
+
+def load_worker_model(model_path: str, threads: int = None, quantize: bool = False):
+    """Load the tokenizer and model once per process (ProcessPoolExecutor initializer)"""
+    global _model, _tokenizer
+    import torch
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+    if threads:
+        torch.set_num_threads(threads)
+    _tokenizer = AutoTokenizer.from_pretrained(model_path)
+    _model = AutoModelForSequenceClassification.from_pretrained(model_path).eval()
+    if quantize:
+        # int8 weights for every Linear layer, activations quantized on the fly: ~2x on CPU
+        _model = torch.ao.quantization.quantize_dynamic(_model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def score_texts(texts: List[str], max_tokens: int = 16384, max_batch_size: int = 512,
+                max_length: int = None) -> Tuple[np.ndarray, Dict[str, Any]]:
+    """Softmax probabilities (len(texts), num_labels) with the model of this process"""
+    logits, stats = predict_logits(_model, _tokenizer, [text or '' for text in texts], max_tokens,
+                                   max_batch_size, max_length)
+    logits -= logits.max(axis=1, keepdims=True)
+    probabilities = np.exp(logits)
+    probabilities /= probabilities.sum(axis=1, keepdims=True)
+    return probabilities, stats
+
+
+def label_names(model_path: str, override: str = None) -> List[str]:
+    if override:
+        return [name.strip() for name in override.split(',')]
+    from transformers import AutoConfig
+
+    config = AutoConfig.from_pretrained(model_path)
+    return [config.id2label[i] for i in range(config.num_labels)]
+
+
+def output_path(output_dir: str, input_path: str, input_file: str) -> str:
+    """Output of input_file, at its path relative to the input directory input_path"""
+    stem = os.path.relpath(input_file, input_path) if os.path.isdir(input_path) else os.path.basename(input_file)
+    for extension in INPUT_EXTENSIONS:
+        if stem.endswith(extension):
+            stem = stem[:-len(extension)]
+    return os.path.join(output_dir, stem + OUTPUT_SUFFIX)
+
+
+def output_paths(output_dir: str, input_path: str, files: List[str]) -> Dict[str, str]:
+    """Output of every input file; ValueError when two inputs (e.g. a.csv, a.parquet) share one"""
+    destinations: Dict[str, str] = {}
+    for input_file in files:
+        destination = output_path(output_dir, input_path, input_file)
+        if destination in destinations:
+            raise ValueError(f"{destinations[destination]} and {input_file} would both be written to {destination}")
+        destinations[destination] = input_file
+    return {input_file: destination for destination, input_file in destinations.items()}
+
+
+def score_file(input_file: str, destination: str, submit, labels: List[str], text_column: str,
+               id_columns: List[str], chunk_rows: int, max_in_flight: int) -> Dict[str, Any]:
+    """Score one file in chunks, keeping at most max_in_flight chunks queued; returns totals"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([(c, pa.string()) for c in id_columns] + [('label', pa.int8()), ('label_name', pa.string())]
+                       + [(f"prob_{name}", pa.float32()) for name in labels])
+    totals = {'documents': 0, 'tokens': 0, 'padded_tokens': 0}
+    in_flight = deque()
+    start = time.perf_counter()
+
+    def write_oldest():
+        ids, future = in_flight.popleft()
+        probabilities, stats = future.result()
+        predicted = probabilities.argmax(axis=1)
+        columns = {c: [None if v is None else str(v) for v in ids[c]] for c in id_columns}
+        columns['label'] = predicted.astype(np.int8)
+        columns['label_name'] = [labels[i] for i in predicted.tolist()]
+        for i, name in enumerate(labels):
+            columns[f"prob_{name}"] = probabilities[:, i].astype(np.float32)
+        writer.write_table(pa.table(columns, schema=schema))
+        for key in totals:
+            totals[key] += stats['examples' if key == 'documents' else key]
+
+    tmp_path = destination + '.tmp'
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    with pq.ParquetWriter(tmp_path, schema, compression='zstd') as writer:
+        for batch in iter_record_batches(input_file, [text_column] + id_columns, chunk_rows):
+            in_flight.append(({c: batch.get(c) or [None] * len(batch[text_column]) for c in id_columns},
+                              submit(batch[text_column])))
+            if len(in_flight) >= max_in_flight:
+                write_oldest()
+        while in_flight:
+            write_oldest()
+    os.replace(tmp_path, destination)
+    totals['elapsed_s'] = time.perf_counter() - start
+    return totals
+
+
+class _InlineFuture:
+    """Result holder for workers=1, where chunks are scored in this process"""
+
+    def __init__(self, result):
+        self._result = result
+
+    def result(self):
+        return self._result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Label texts from Parquet/CSV/JSONL with a fine-tuned "
+                                                 "sentiment classifier on CPU")
+    parser.add_argument('input_path', help="Input file or directory of Parquet/CSV/JSONL files")
+    parser.add_argument('output_dir')
+    parser.add_argument('--model', required=True, help="Fine-tuned model directory (trainer.save_model)")
+    parser.add_argument('--text-column', default='text')
+    parser.add_argument('--id-columns', default='id,url', help="Columns copied to the output (missing ones are null)")
+    parser.add_argument('--labels', default=None, help="Label names, e.g. negative,positive (default: model config)")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: cpus / threads)")
+    parser.add_argument('--threads-per-worker', type=int, default=4, help="torch threads of each worker")
+    parser.add_argument('--quantize', action='store_true', help="Dynamic int8 quantization of Linear layers")
+    parser.add_argument('--chunk-rows', type=int, default=2048, help="Texts per worker task")
+    parser.add_argument('--max-tokens', type=int, default=16384, help="Padded tokens per model batch")
+    parser.add_argument('--max-batch-size', type=int, default=512)
+    parser.add_argument('--max-length', type=int, default=None, help="Token truncation (default: model maximum)")
+    parser.add_argument('--file-range-start', type=int, default=None)
+    parser.add_argument('--file-range-end', type=int, default=None)
+    args = parser.parse_args()
+
+    cpus = int(os.environ.get('SLURM_CPUS_PER_TASK', 0)) or os.cpu_count() or 1
+    threads = min(args.threads_per_worker, cpus)
+    workers = args.workers or max(1, cpus // threads)
+    files = list_input_files(args.input_path, args.file_range_start, args.file_range_end, args.output_dir)
+    if not files:
+        print(f"Error: no {'/'.join(INPUT_EXTENSIONS)} files in {args.input_path}")
+        sys.exit(1)
+    try:
+        # Checked over all input files, not just this task's range
+        destinations = output_paths(args.output_dir, args.input_path,
+                                    list_input_files(args.input_path, exclude_dir=args.output_dir))
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    os.makedirs(args.output_dir, exist_ok=True)
+    labels = label_names(args.model, args.labels)
+    id_columns = [c.strip() for c in args.id_columns.split(',') if c.strip()]
+    options = {'max_tokens': args.max_tokens, 'max_batch_size': args.max_batch_size, 'max_length': args.max_length}
+    print(f"Scoring {len(files)} files with {args.model} ({'int8' if args.quantize else 'fp32'}): "
+          f"{workers} workers x {threads} threads, labels {', '.join(labels)}")
+
+    if workers == 1:
+        executor = None
+        load_worker_model(args.model, threads, args.quantize)
+
+        def submit(texts):
+            return _InlineFuture(score_texts(texts, **options))
+    else:
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=load_worker_model,
+                                       initargs=(args.model, threads, args.quantize))
+
+        def submit(texts):
+            return executor.submit(score_texts, texts, **options)
+
+    start = time.perf_counter()
+    documents = 0
+    try:
+        for input_file in files:
+            destination = destinations[input_file]
+            if os.path.exists(destination):
+                print(f"Skipping {input_file}: {destination} exists")
+                continue
+            totals = score_file(input_file, destination, submit, labels, args.text_column, id_columns,
+                                args.chunk_rows, max_in_flight=workers * 2)
+            documents += totals['documents']
+            elapsed = totals['elapsed_s']
+            print(f"{input_file}: {totals['documents']} documents in {elapsed:.1f}s "
+                  f"({totals['documents'] / elapsed if elapsed else 0:.1f} docs/s, "
+                  f"{totals['tokens'] / elapsed if elapsed else 0:.0f} tokens/s, padding "
+                  f"{1 - totals['tokens'] / totals['padded_tokens'] if totals['padded_tokens'] else 0:.1%}) "
+                  f"-> {destination}")
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    elapsed = time.perf_counter() - start
+    print(f"Scored {documents} documents in {elapsed:.1f}s ({documents / elapsed if elapsed else 0:.1f} docs/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+#!/bin/bash
+#SBATCH --job-name=sentiment-score
+#SBATCH --partition=normal
+#SBATCH --account=a145
+#SBATCH --time=04:00:00
+#SBATCH --nodes=1
+#SBATCH --ntasks-per-node=1
+#SBATCH --cpus-per-task=32
+#SBATCH --mem=64G
+
+#SBATCH --output=/capstor/scratch/cscs/anastasiia_kucherenko/fineweb_sentiment/output/sentiment_%j.out
+#SBATCH --error=/capstor/scratch/cscs/anastasiia_kucherenko/fineweb_sentiment/err/sentiment_%j.err
+
+# Sentiment labels for FineWeb Parquet (or CSV/JSONL) with the fine-tuned distilbert
+# (sentiment_score.py): one <file>.sentiment.parquet per input file in OUTPUT_DIR (input
+# subdirectories mirrored), finished files are skipped on rerun. For job arrays give every task
+# its own FILE_RANGE_START/END.
+set -e
+
+SCRIPT_DIR="${SCRIPT_DIR:-/capstor/scratch/cscs/anastasiia_kucherenko/LLM-playground}"
+DATA_DIR="${DATA_DIR:-/capstor/scratch/cscs/anastasiia_kucherenko/index_attempt_1}"
+OUTPUT_DIR="${OUTPUT_DIR:-/capstor/scratch/cscs/anastasiia_kucherenko/fineweb_sentiment/labels}"
+MODEL_DIR="${MODEL_DIR:-}"                    # Fine-tuned model saved with trainer.save_model
+PYTHON="${PYTHON:-python3}"                   # Needs torch, transformers, pyarrow
+
+FILE_RANGE_START="${FILE_RANGE_START:-}"
+FILE_RANGE_END="${FILE_RANGE_END:-}"
+TEXT_COLUMN="${TEXT_COLUMN:-text}"
+ID_COLUMNS="${ID_COLUMNS:-id,url}"            # Copied to the output next to the labels
+LABELS="${LABELS:-negative,positive}"         # Names of the model's classes, in label order
+THREADS_PER_WORKER="${THREADS_PER_WORKER:-4}" # Workers = SLURM CPUs / THREADS_PER_WORKER
+QUANTIZE="${QUANTIZE:-true}"                  # Dynamic int8 Linear layers
+CHUNK_ROWS="${CHUNK_ROWS:-2048}"              # Texts per worker task
+MAX_TOKENS="${MAX_TOKENS:-16384}"             # Padded tokens per model batch (length-bucketed)
+
+# Colors for output
+RED='\033[0;31m'
+GREEN='\033[0;32m'
+BLUE='\033[0;34m'
+NC='\033[0m' # No Color
+
+log_info() {
+    echo -e "${BLUE}[INFO]${NC} $1"
+}
+
+log_error() {
+    echo -e "${RED}[ERROR]${NC} $1"
+}
+
+log_success() {
+    echo -e "${GREEN}[SUCCESS]${NC} $1"
+}
+
+if [ -z "$MODEL_DIR" ]; then
+    log_error "MODEL_DIR is not set"
+    log_info "Usage: MODEL_DIR=/path/to/fine-tuned-model [DATA_DIR=/path/to/parquet] sbatch $0"
+    log_info "  OUTPUT_DIR=                             # <subdir>/<file>.sentiment.parquet per input file"
+    log_info "  FILE_RANGE_START= FILE_RANGE_END=       # Slice of DATA_DIR's sorted input files"
+    log_info "  TEXT_COLUMN=text ID_COLUMNS=id,url LABELS=negative,positive"
+    log_info "  THREADS_PER_WORKER=4 QUANTIZE=true      # Worker pool layout, int8 dynamic quantization"
+    log_info "  CHUNK_ROWS=2048 MAX_TOKENS=16384        # Texts per task, padded tokens per batch"
+    exit 1
+fi
+
+mkdir -p "$OUTPUT_DIR"
+log_info "Sentiment scoring: ${SLURM_CPUS_PER_TASK:-$(nproc)} CPUs, $THREADS_PER_WORKER threads per worker"
+log_info "  Data: $DATA_DIR [${FILE_RANGE_START:-0}, ${FILE_RANGE_END:-end})"
+log_info "  Model: $MODEL_DIR (quantize: $QUANTIZE, labels: $LABELS)"
+log_info "  Output: $OUTPUT_DIR"
+
+QUANTIZE_FLAG=""
+if [ "$QUANTIZE" = "true" ]; then
+    QUANTIZE_FLAG="--quantize"
+fi
+
+$PYTHON "$SCRIPT_DIR/sentiment_score.py" "$DATA_DIR" "$OUTPUT_DIR" --model "$MODEL_DIR" \
+    --text-column "$TEXT_COLUMN" --id-columns "$ID_COLUMNS" --labels "$LABELS" \
+    --threads-per-worker "$THREADS_PER_WORKER" --chunk-rows "$CHUNK_ROWS" --max-tokens "$MAX_TOKENS" \
+    $QUANTIZE_FLAG \
+    ${FILE_RANGE_START:+--file-range-start "$FILE_RANGE_START"} \
+    ${FILE_RANGE_END:+--file-range-end "$FILE_RANGE_END"}
+log_success "Labels written to $OUTPUT_DIR"